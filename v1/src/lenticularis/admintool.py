@@ -15,19 +15,23 @@ import json
 import yaml
 import sys
 import traceback
+from urllib.request import Request, urlopen
 from lenticularis.control import Control_Api
-from lenticularis.control import erase_minio_ep, erase_pool_data
+from lenticularis.control import erase_minio_ep
+from lenticularis.control import erase_pools_data
 from lenticularis.control import list_user_pools
 from lenticularis.table import read_redis_conf
 from lenticularis.table import get_table
 from lenticularis.table import set_conf, get_conf
 from lenticularis.yamlconf import read_yaml_conf
 from lenticularis.pooldata import Api_Error
-from lenticularis.pooldata import gather_pool_desc
 from lenticularis.pooldata import check_user_naming
 from lenticularis.pooldata import check_claim_string
 from lenticularis.pooldata import get_pool_owner_for_messages
-from lenticularis.pooldata import dump_db, restore_db
+from lenticularis.pooldata import update_pools_of_user
+from lenticularis.pooldata import dump_db_records, restore_db_records
+from lenticularis.snapshot import load_snapshot
+from lenticularis.profiler import PROFILE_PATH, PROFILE_TOKEN_HEADER
 from lenticularis.utility import ERROR_EXIT_BADCONF, ERROR_EXIT_EXCEPTION, ERROR_EXIT_ARGUMENT
 from lenticularis.utility import format_time_z
 from lenticularis.utility import random_str
@@ -49,6 +53,21 @@ def _get_nparams_of_fn(fn):
     return (nparams - 1, varargs)
 
 
+def _is_old_dump_format(r):
+    """Checks a record is a dump of the old format, which holds all confs,
+    users, and pools in one record.
+    """
+    return ("confs" in r or "users" in r or "pools" in r)
+
+
+def _convert_old_dump(r):
+    """Converts a dump of the old format to records of json lines."""
+    yield from ({"conf": e} for e in r.get("confs", []))
+    yield from ({"user": e} for e in r.get("users", []))
+    yield from ({"pool": e} for e in r.get("pools", []))
+    pass
+
+
 def _make_time_readable(d, keys):
     """Replaces date+time values by strings."""
     for key in keys:
@@ -75,6 +94,53 @@ def _print_in_yaml(o):
     pass
 
 
+def _print_report(sections, formatting):
+    """Prints sections of a report, where a section is a pair of a title
+    and a list of pairs of an id and a dict.  It prints in yaml by
+    default, or in json or csv.  A csv has a header row for each
+    section, whose first columns are "section" and "id".  Values
+    which are not scalars are in json in csv.
+    """
+    if formatting == "json":
+        o = {title: {id: d for (id, d) in entries}
+             for (title, entries) in sections}
+        print(json.dumps(o, indent=4))
+    elif formatting == "csv":
+        rows = []
+        for (title, entries) in sections:
+            columns = []
+            for (_, d) in entries:
+                columns += [k for k in d.keys() if k not in columns]
+                pass
+            rows.append(["section", "id", *columns])
+            for (id, d) in entries:
+                rows.append([title, id, *(_csv_value(d.get(k))
+                                          for k in columns)])
+                pass
+            pass
+        _print_in_csv(rows)
+    else:
+        for (title, entries) in sections:
+            print("---")
+            print(f"# {title}")
+            for (id, d) in entries:
+                _print_in_yaml({id: d})
+                pass
+            pass
+        pass
+    pass
+
+
+def _csv_value(v):
+    if v is None:
+        return ""
+    elif isinstance(v, (list, dict)):
+        return json.dumps(v)
+    else:
+        return v
+    pass
+
+
 def _make_csv_user_list_entry(r):
     assert len(r) >= 2
     op = r[0].upper()
@@ -139,9 +205,7 @@ def _load_user(tables, u):
 
 def _delete_user(tables, uid):
     pids = list_user_pools(tables, uid, None)
-    for pid in pids:
-        erase_pool_data(tables, pid)
-        pass
+    erase_pools_data(tables, pids)
     tables.delete_user(uid)
     tables.delete_user_timestamp(uid)
     pass
@@ -153,18 +217,16 @@ def _enable_disable_user(tables, uid, enabled):
         raise Api_Error(404, f"Bad user (unknown): {uid}")
     u["enabled"] = enabled
     tables.add_user(u)
+    update_pools_of_user(tables, uid)
     pass
 
 
-def _make_disable_csv_rows(tables):
+def _make_disable_csv_rows(users):
     """Returns rows (though it is a single row) of disabled entries or an
-    empty list.  It does not return enabled entries.
+    empty list.  It does not return enabled entries.  Users is a dict
+    of a uid to a user record.
     """
-    users = tables.list_users()
-    uu = [(uid, tables.get_user(uid)["enabled"])
-          for uid in users]
-    bid = [id for (id, enabled) in uu if enabled]
-    ban = [id for (id, enabled) in uu if not enabled]
+    ban = [uid for (uid, u) in sorted(users.items()) if not u["enabled"]]
     return [["DISABLE", *ban]] if len(ban) != 0 else []
 
 
@@ -175,7 +237,8 @@ def _make_user_csv_row(uid, u):
 
 
 def _format_mux(m, formatting):
-    (ep, desc) = m
+    (ep, record) = m
+    desc = record.to_dict()
     if formatting not in {"json"}:
         _make_time_readable(desc, ["modification_time", "start_time"])
     return {ep: desc}
@@ -194,6 +257,9 @@ def _pool_key_order(e):
         "permit_status",
         "online_status",
         "probe_key",
+        "rate_limit",
+        "bandwidth",
+        "minio_cache",
         "modification_time",
         "name",
         "bkt_policy",
@@ -248,6 +314,43 @@ def _timestamp_key_order(e):
     return order.index(e) if e in order else len(order)
 
 
+def _percentile(sorted_values, p):
+    """Returns a p-th percentile by the nearest-rank method."""
+    assert len(sorted_values) > 0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[rank - 1]
+
+
+def _tally_startup_phases(records):
+    """Makes statistics of phases in milliseconds.  A phase appearing
+    multiple times in a record (by retries) is summed up.  It returns
+    an empty dict when there are no records.
+    """
+    samples = {"total": []}
+    for r in records:
+        summed = {}
+        for (name, ms) in r["phases"]:
+            summed[name] = summed.get(name, 0) + ms
+            pass
+        for (name, ms) in summed.items():
+            samples.setdefault(name, []).append(ms)
+            pass
+        samples["total"].append(r["total"])
+        pass
+    stats = {}
+    for (name, vv) in samples.items():
+        if vv == []:
+            continue
+        vv = sorted(vv)
+        stats[name] = {"count": len(vv),
+                       "p50": _percentile(vv, 50),
+                       "p90": _percentile(vv, 90),
+                       "p99": _percentile(vv, 99),
+                       "max": vv[-1]}
+        pass
+    return stats
+
+
 def _determine_expiration_time(maxexpiry):
     now = int(time.time())
     duration = maxexpiry
@@ -344,136 +447,274 @@ class Command():
 
     def op_show_user(self):
         """Prints a user list in CSV.  It lists ADD rows first, and then
-        a DISABLE row.
+        a DISABLE row.  It prints user records with "-f json" or "-f
+        yaml".
         """
-        users = self._tables.list_users()
-        urows = [_make_user_csv_row(id, self._tables.get_user(id))
-                 for id in users]
-        drows = _make_disable_csv_rows(self._tables)
+        snap = load_snapshot(self._tables)
+        users = dict(sorted(snap.users.items()))
+        if self.args.format in {"json", "yaml"}:
+            if self.args.format not in {"json"}:
+                for u in users.values():
+                    _make_time_readable(u, ["modification_time"])
+                    pass
+                pass
+            _print_report([("Users", list(users.items()))],
+                          self.args.format)
+            return
+        urows = [_make_user_csv_row(id, u) for (id, u) in users.items()]
+        drows = _make_disable_csv_rows(users)
         _print_in_csv(urows + drows)
         pass
 
     def op_show_pool(self, *pool_id):
         """Prints pools.  It shows all pools without arguments."""
+        snap = load_snapshot(self._tables)
         pool_list = list(pool_id)
         if pool_list == []:
-            pool_list = self._tables.list_pools(None)
+            pool_list = sorted(snap.pools.keys())
             pass
         pools = []
         for pid in pool_list:
-            pooldesc = gather_pool_desc(self._tables, pid)
+            pooldesc = snap.pool_desc(pid)
             if pooldesc is None:
-                print(f"No pool found for {pid}")
+                sys.stderr.write(f"No pool found for {pid}\n")
                 continue
             if self.args.format not in {"json"}:
-                _make_time_readable(pooldesc, ["expiration_time", "modification_time"])
+                _make_time_readable(pooldesc, ["expiration_time",
+                                               "modification_time"])
                 pass
             pooldesc.pop("pool_name")
-            pools.append({pid: pooldesc})
-            pass
-        for o in pools:
-            _print_in_yaml(o)
+            pools.append((pid, pooldesc))
             pass
+        _print_report([("Pools", pools)], self.args.format)
         pass
 
     def op_delete_pool(self, *pool_id):
-        """Deletes pools by pool-id."""
+        """Deletes pools by pool-id.  Many pools can be deleted at once,
+        and the data of each pool is deleted atomically.
+        """
         if not self.args.yes:
             print("Need yes (-y) for action.")
         else:
             pool_list = list(pool_id)
             for pid in pool_list:
                 erase_minio_ep(self._tables, pid)
-                erase_pool_data(self._tables, pid)
                 pass
+            erase_pools_data(self._tables, pool_list)
             pass
         pass
 
-    def op_show_bucket(self):
-        """Prints all buckets and all buckets-directories of pools."""
-        # pool_list = list(pool_id)
-        # if pool_list == []:
-        #     bkts = self._tables.list_buckets(None)
-        # else:
-        #     bkts = [b for pid in pool_list
-        #             for b in self._tables.list_buckets(pid)]
-        #     pass
-        # List Buckets.
-        allbkts = self._tables.list_buckets(None)
-        bkts = [{d["name"]: {"pool": d["pool"], "bkt_policy": d["bkt_policy"]}}
-                for d in allbkts]
-        print("---")
-        print("# Buckets")
-        for o in bkts:
-            _print_in_yaml(o)
+    def op_set_pool_rate(self, pool_id, rate, burst):
+        """Sets a rate limit of a pool in requests per second, with a
+        burst in requests.  It overrides the Mux setting.  A rate 0
+        removes the limit.
+        """
+        pooldesc = self._tables.get_pool(pool_id)
+        if pooldesc is None:
+            print(f"No pool found for {pool_id}")
+            return
+        pooldesc = pooldesc.to_dict()
+        if float(rate) == 0:
+            pooldesc.pop("rate_limit", None)
+        else:
+            pooldesc["rate_limit"] = {"rate": float(rate),
+                                      "burst": max(1.0, float(burst))}
             pass
-        # List Buckets-Directories.
-        alldirs = self._tables.list_buckets_directories()
-        dirs = [{d["pool"]: d} for d in alldirs]
-        print("---")
-        print("# Buckets-Directories")
-        for o in dirs:
-            _print_in_yaml(o)
+        self._tables.set_pool(pool_id, pooldesc)
+        pass
+
+    def op_set_pool_bandwidth(self, pool_id, rate, weight):
+        """Sets a bandwidth limit of a pool in bytes per second, with a
+        weight in sharing a node bandwidth.  A rate 0 means the limit
+        in the Mux setting.  A rate 0 and a weight 1 removes the entry.
+        """
+        pooldesc = self._tables.get_pool(pool_id)
+        if pooldesc is None:
+            print(f"No pool found for {pool_id}")
+            return
+        pooldesc = pooldesc.to_dict()
+        if float(rate) == 0 and float(weight) == 1:
+            pooldesc.pop("bandwidth", None)
+        else:
+            pooldesc["bandwidth"] = {"rate": float(rate),
+                                     "weight": max(0.01, float(weight))}
             pass
+        self._tables.set_pool(pool_id, pooldesc)
         pass
 
-    def op_show_ep(self):
-        """Lists endpoints of Mux and MinIO."""
-        # Mux.
-        muxs = self._tables.list_muxs()
-        muxs = sorted(list(muxs))
-        outs = [_format_mux(m, self.args.format) for m in muxs]
-        print("---")
-        print("# Lens3-Mux")
-        for o in outs:
-            _print_in_yaml(o)
+    def op_set_pool_cache(self, pool_id, onoff):
+        """Enables or disables (by "on" or "off") a MinIO disk cache of a
+        pool.  It takes effect at the next start of MinIO.
+        """
+        pooldesc = self._tables.get_pool(pool_id)
+        if pooldesc is None:
+            print(f"No pool found for {pool_id}")
+            return
+        pooldesc = pooldesc.to_dict()
+        if onoff not in {"on", "off"}:
+            print(f"Bad argument (not on/off): {onoff}")
+            return
+        if onoff == "on":
+            pooldesc["minio_cache"] = True
+        else:
+            pooldesc.pop("minio_cache", None)
             pass
-        # MinIO.
-        eps = self._tables.list_minio_ep()
-        # eps = [{ep: {"pool": pid}} for (pid, ep) in eps]
-        print("---")
-        print("# MinIO")
-        for o in eps:
-            _print_in_yaml(o)
+        self._tables.set_pool(pool_id, pooldesc)
+        pass
+
+    def op_show_cache(self):
+        """Shows statistics of MinIO disk caches of running pools."""
+        stats = sorted(self._tables.list_cache_stats())
+        for (pid, r) in stats:
+            total = r["hits"] + r["misses"]
+            r["hit_ratio"] = (round(r["hits"] / total, 3)
+                              if total > 0 else None)
+            if self.args.format not in {"json"}:
+                _make_time_readable(r, ["modification_time"])
+                pass
+            _print_in_yaml({pid: r})
             pass
         pass
 
-    def op_show_ts(self):
-        """Shows last access timestamps of pools and users."""
-        pstamps1 = self._tables.list_access_timestamps()
-        pstamps2 = [{f"{e[0]}": {"timestamp": format_time_z(float(e[1]))}}
-                    for e in pstamps1]
-        ustamps1 = self._tables.list_user_timestamps()
-        ustamps2 = [{f"{e[0]}": {"timestamp": format_time_z(float(e[1]))}}
-                    for e in ustamps1]
-        print("# Timestamps (pool)")
-        for o in pstamps2:
-            _print_in_yaml(o)
+    def op_show_metrics(self):
+        """Shows transfer metrics of pools, statistics of the object
+        cache, and statistics of DNS resolutions summed over Mux
+        workers.  Counts are of the last metrics interval.
+        """
+        records = self._tables.list_mux_metrics()
+        pools = {}
+        for r in records:
+            for (pid, m) in r["pools"].items():
+                t = pools.setdefault(pid, {"upload": 0, "download": 0,
+                                           "throttled": 0.0})
+                for (k, v) in m.items():
+                    t[k] += v
+                    pass
+                pass
             pass
-        print("---")
-        print("# Timestamps (user)")
-        for o in ustamps2:
-            _print_in_yaml(o)
+        cache = {}
+        for r in records:
+            for (k, v) in r["object_cache"].items():
+                cache[k] = cache.get(k, 0) + v
+                pass
             pass
+        print(f"# Workers: {len(records)}")
+        for (pid, m) in sorted(pools.items()):
+            m["throttled"] = round(m["throttled"], 3)
+            _print_in_yaml({pid: m})
+            pass
+        if cache.get("hits", 0) + cache.get("misses", 0) > 0:
+            total = cache["hits"] + cache["misses"]
+            cache["hit_ratio"] = round(cache["hits"] / total, 3)
+            _print_in_yaml({"object_cache": cache})
+            pass
+        dns = {}
+        for r in records:
+            for (k, v) in r.get("dns", {}).items():
+                if k == "latency_max":
+                    dns[k] = max(dns.get(k, 0), v)
+                else:
+                    dns[k] = dns.get(k, 0) + v
+                    pass
+                pass
+            pass
+        if dns.get("resolutions", 0) > 0:
+            dns["latency_avg"] = round(dns["latency_total"]
+                                       / dns["resolutions"], 6)
+            dns.pop("latency_total")
+            dns["latency_max"] = round(dns["latency_max"], 6)
+            _print_in_yaml({"dns": dns})
+            pass
+        pass
+
+    def op_show_bucket(self):
+        """Prints all buckets and all buckets-directories of pools."""
+        snap = load_snapshot(self._tables)
+        bkts = [(name, {"pool": d["pool"], "bkt_policy": d["bkt_policy"]})
+                for (name, d) in sorted(snap.buckets.items())]
+        dirs = [(pid, {"directory": path, "pool": pid})
+                for (path, pid) in sorted(snap.buckets_directories.items())]
+        _print_report([("Buckets", bkts), ("Buckets-Directories", dirs)],
+                      self.args.format)
+        pass
+
+    def op_show_ep(self):
+        """Lists endpoints of Mux and MinIO."""
+        snap = load_snapshot(self._tables)
+        muxs = [next(iter(_format_mux(m, self.args.format).items()))
+                for m in sorted(snap.muxs.items())]
+        eps = [(pid, {"minio_ep": ep})
+               for (pid, ep) in sorted(snap.minio_eps.items())]
+        _print_report([("Lens3-Mux", muxs), ("MinIO", eps)],
+                      self.args.format)
+        pass
+
+    def op_show_ts(self):
+        """Shows last access timestamps of pools and users."""
+        snap = load_snapshot(self._tables)
+
+        def stamp(ts):
+            return (ts if self.args.format in {"json"}
+                    else format_time_z(float(ts)))
+
+        pstamps = [(pid, {"timestamp": stamp(ts)})
+                   for (pid, ts) in sorted(snap.access_timestamps.items())]
+        ustamps = [(uid, {"timestamp": stamp(ts)})
+                   for (uid, ts) in sorted(snap.user_timestamps.items())]
+        _print_report([("Timestamps (pool)", pstamps),
+                       ("Timestamps (user)", ustamps)],
+                      self.args.format)
         pass
 
     def op_show_minio(self, pool_id):
         """Shows a MinIO process and a Manager of a pool."""
         proc_list = self._tables.list_minio_procs(pool_id)
         proc_list = sorted(list(proc_list))
-        outs = [{pool: process} for (pool, process) in proc_list]
+        outs = [{pool: process.to_dict()} for (pool, process) in proc_list]
         print("# MinIO")
         for o in outs:
             _print_in_yaml(o)
             pass
         ma = self._tables.get_manager(pool_id)
-        outs = [{pool_id: ma}] if ma is not None else []
+        outs = [{pool_id: ma.to_dict()}] if ma is not None else []
         print("# Manager")
         for o in outs:
             _print_in_yaml(o)
             pass
         pass
 
+    def op_show_startup(self, *pool_id):
+        """Shows records of MinIO start-ups of pools.  Records have
+        elapsed times of phases in milliseconds.  It shows statistics
+        (percentiles) of all the records in the site without
+        arguments.
+        """
+        pool_list = list(pool_id)
+        if pool_list != []:
+            for pid in pool_list:
+                records = self._tables.get_startup_records(pid)
+                if self.args.format not in {"json"}:
+                    for r in records:
+                        _make_time_readable(r, ["start_time"])
+                        r["phases"] = [{name: ms} for (name, ms)
+                                       in r["phases"]]
+                        pass
+                    pass
+                _print_in_yaml({pid: records})
+                pass
+        else:
+            allrecords = self._tables.list_startup_records()
+            records = [r for (_, rr) in allrecords for r in rr]
+            failures = sum(1 for r in records if not r["ok"])
+            stats = _tally_startup_phases(records)
+            print("# Start-ups (milliseconds)")
+            _print_in_yaml({"pools": len(allrecords),
+                            "records": len(records),
+                            "failures": failures,
+                            "phases": stats})
+            pass
+        pass
+
     def op_delete_ep(self, *pool_id):
         """Deletes endpoint entires from a database.  Entries of
         MinIO-managers (ma:pool-id), MinIO-processes (mn:pool-id), and
@@ -488,11 +729,15 @@ class Command():
         pass
 
     def op_dump_db(self, jsonfile):
-        """Dumps confs, users and pools for restoring."""
-        record = dump_db(self._tables)
+        """Dumps confs, users and pools for restoring.  A dump is in json
+        lines, a record of a conf, a user, or a pool in a line.
+        """
         try:
-            with open(jsonfile, 'w') as f:
-                record = json.dump(record, f)
+            with open(jsonfile, "w") as f:
+                for r in dump_db_records(self._tables):
+                    f.write(json.dumps(r))
+                    f.write("\n")
+                    pass
                 pass
         except OSError as e:
             sys.stderr.write(f"Writing a file failed: ({jsonfile});"
@@ -509,24 +754,56 @@ class Command():
     def op_restore_db(self, jsonfile):
         """Restores confs, users and pools from a dump.  It should be worked
         on an empty database.  It is an error if some entries are
-        already occupied.  Errors are fatal, that is, Redis gets
-        partially modified.
+        already occupied by other pools.  Errors are fatal, that is,
+        Redis gets partially modified, but restoring can be resumed by
+        running it again, because it skips pools already restored.  It
+        accepts a dump in the old format (a single json record).  Use
+        "--jobs" to restore pools in parallel.
         """
+        def progress(restored, skipped):
+            sys.stderr.write(f"Restored pools: {restored}"
+                             f" (skipped {skipped})\n")
+            pass
+
+        def read_records(f):
+            for line in f:
+                if line.strip() == "":
+                    continue
+                r = json.loads(line)
+                if _is_old_dump_format(r):
+                    yield from _convert_old_dump(r)
+                else:
+                    yield r
+                    pass
+                pass
+            pass
+
         try:
             with open(jsonfile) as f:
-                record = json.load(f)
+                restore_db_records(self._tables, read_records(f),
+                                   nthreads=self.args.jobs,
+                                   progress=progress)
                 pass
         except OSError as e:
             sys.stderr.write(f"Reading a file failed: ({jsonfile});"
                              f" {os.strerror(e.errno)}\n")
             return
-        except Exception as e:
+        except json.JSONDecodeError as e:
             m = rephrase_exception_message(e)
             sys.stderr.write(f"Reading a file failed: ({jsonfile});"
                              f" exception={m}\n")
-            traceback.print_exc()
             return
-        restore_db(self._tables, record)
+        pass
+
+    def op_rebuild_index(self):
+        """Rebuilds indexes of user to pools, pool to buckets, and pool to
+        access-keys, and the expiry indexes.  It also drops stale
+        entries.  Run it while the service is idle, since dropping
+        races with additions.
+        """
+        self._tables.rebuild_indexes(True)
+        self._tables.rebuild_expiry_indexes()
+        self._tables.set_index_version()
         pass
 
     def op_show_db(self):
@@ -543,6 +820,30 @@ class Command():
             pass
         pass
 
+    def op_profile(self, ep, *seconds):
+        """Profiles a worker of Mux or Api at an endpoint (host:port) for
+        some seconds (10 by default).  It saves stacks in the collapsed
+        format for flamegraph tools in a file "profile-host-port-time.txt".
+        It should be run on the host of the endpoint, because a worker
+        only accepts a local access.  A worker is chosen by Gunicorn.
+        """
+        duration = float(seconds[0]) if len(seconds) > 0 else 10
+        token = random_str(24)
+        self._tables.set_profile_token(token, int(duration) + 60)
+        url = f"http://{ep}{PROFILE_PATH}?seconds={duration}"
+        req = Request(url, headers={PROFILE_TOKEN_HEADER: token})
+        with urlopen(req, timeout=(duration + 60)) as res:
+            stacks = res.read()
+            pass
+        now = time.strftime("%Y%m%d%H%M%S")
+        host = ep.replace("[", "").replace("]", "").replace(":", "-")
+        path = f"profile-{host}-{now}.txt"
+        with open(path, "wb") as f:
+            f.write(stacks)
+            pass
+        print(f"Profile saved in {path}")
+        pass
+
     # THE COMMANDS FROM HERE BELOW USE ROUTINES IN THE CONTROL.  The
     # commands above only access Redis.
 
@@ -568,13 +869,21 @@ class Command():
         op_show_minio,
         op_show_ep,
         op_show_ts,
+        op_show_startup,
+        op_show_metrics,
+        op_show_cache,
 
         op_delete_pool,
+        op_set_pool_rate,
+        op_set_pool_bandwidth,
+        op_set_pool_cache,
         # op_delete_ep,
         op_access_mux,
+        op_profile,
 
         op_dump_db,
         op_restore_db,
+        op_rebuild_index,
         op_show_db,
         op_reset_db,
     ]
@@ -635,7 +944,9 @@ def main():
     parser.add_argument("--everything", type=bool, default=False)
     parser.add_argument("--debug", "-d", default=False,
                         action=argparse.BooleanOptionalAction)
-    parser.add_argument("--format", "-f", choices=["text", "json"])
+    parser.add_argument("--format", "-f",
+                        choices=["text", "json", "yaml", "csv"])
+    parser.add_argument("--jobs", "-j", type=int, default=1)
     (args, rest) = parser.parse_known_args()
 
     try:
@@ -12,20 +12,28 @@
 # https://github.com/aekasitt/fastapi-csrf-protect.
 
 
+import asyncio
+import contextvars
 import os
 import sys
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 from pydantic import BaseModel
 from fastapi import FastAPI, Request, Header, Depends, status
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi_csrf_protect import CsrfProtect
 from fastapi_csrf_protect.exceptions import CsrfProtectError
 from lenticularis.control import Control_Api
 from lenticularis.table import read_redis_conf
 from lenticularis.table import get_conf
+from lenticularis.tarpit import make_penalty_tracker
+from lenticularis.tracer import tracer
+from lenticularis.profiler import PROFILE_PATH, PROFILE_TOKEN_HEADER
+from lenticularis.profiler import check_profile_request, sample_stacks
 from lenticularis.utility import ERROR_EXIT_BADCONF
 from lenticularis.utility import make_typical_ip_address
 from lenticularis.utility import rephrase_exception_message
@@ -40,9 +48,12 @@ from lenticularis.utility import tracing
 _app = None
 _api = None
 _api_conf = None
+_executor = None
+_tarpit = None
+
 
 def _make_app():
-    global _app, _api,  _api_conf
+    global _app, _api,  _api_conf, _executor, _tarpit
     assert _api is None
 
     assert os.environ.get("LENS3_CONF") is not None
@@ -58,10 +69,20 @@ def _make_app():
         sys.exit(ERROR_EXIT_BADCONF)
         pass
 
-    openlog(_api_conf["log_file"], **_api_conf["log_syslog"])
+    openlog(_api_conf["log_file"], **_api_conf["log_syslog"],
+            queue_size=_api_conf.get("log_queue_size"),
+            access_format=_api_conf.get("log_access_format"))
     logger.info("START Api.")
 
+    tracer.configure(_api_conf.get("tracing"), "lens3-api")
     _api = Control_Api(_api_conf, redis)
+    if tracer.enabled():
+        _api.tables.trace_databases(tracer)
+        pass
+    nthreads = int(_api_conf["controller"].get("blocking_threads", 16))
+    _executor = ThreadPoolExecutor(max_workers=nthreads,
+                                   thread_name_prefix="lens3-api")
+    _tarpit = make_penalty_tracker(_api_conf["controller"])
 
     _app = FastAPI()
     # with open(os.path.join(_api.pkg_dir, "ui2", "index.html")) as f:
@@ -84,11 +105,45 @@ def app():
     return _app
 
 
-def _make_json_response(triple, user_id, client, request, csrf_protect):
-    """Makes a response for a triple=(code, reason, values)."""
+async def _run_blocking(f, *args):
+    """Runs a blocking call (Redis accesses, MC commands, or probe
+    accesses to Mux) in the thread pool, not to stall the event loop.
+    It passes the context to keep a traceid and a tracing span.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, context.run, f, *args)
+
+
+def _check_session(x_remote_user):
+    """Maps a claim to a user-id and checks the user is registered."""
+    user_id = _api.map_claim_to_uid(x_remote_user)
+    return (user_id, _api.check_user_is_registered(user_id))
+
+
+async def _delay_bad_response(request):
+    """Delays a bad response by an async timer.  A delay escalates on
+    repeated bad requests from a client.  See tarpit.py.
+    """
+    client = request.headers.get("X-REAL-IP") or str(request.client.host)
+    delay = _tarpit.penalize(client)
+    if delay > 0:
+        await asyncio.sleep(delay)
+        pass
+    pass
+
+
+async def _make_json_response(triple, user_id, client, request,
+                              csrf_protect):
+    """Makes a response for a triple=(code, reason, values).  It delays
+    a response on an error.
+    """
     access_synopsis = [client, user_id, request.method, request.url]
     (code, reason, values) = triple
     log_access(f"{code}", *access_synopsis)
+    if code >= 400:
+        await _delay_bad_response(request)
+        pass
     if reason is not None:
         body = {"status": "error", "reason": reason}
     else:
@@ -151,6 +206,34 @@ def _get_ui(ui_name, file, client, user_id, request):
     pass
 
 
+async def _serve_profile(request):
+    """Runs a sampling profiler on this worker for seconds given by a
+    query, and returns stacks in the collapsed format.  See
+    profiler.py.
+    """
+    peer_addr = make_typical_ip_address(str(request.client.host))
+    forwarded = ("X-REAL-IP" in request.headers
+                 or "X-FORWARDED-FOR" in request.headers)
+    token = request.headers.get(PROFILE_TOKEN_HEADER)
+    ok = await _run_blocking(check_profile_request, _api.tables, peer_addr,
+                             forwarded, token)
+    if not ok:
+        logger.error(f"Bad profiling request: remote={peer_addr}")
+        return PlainTextResponse(status_code=status.HTTP_403_FORBIDDEN,
+                                 content="")
+    try:
+        seconds = float(request.query_params.get("seconds", "10"))
+    except ValueError:
+        return PlainTextResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                                 content="")
+    logger.info(f"Profiling started: pid={os.getpid()}, seconds={seconds}")
+    stacks = await asyncio.to_thread(sample_stacks, seconds)
+    if stacks is None:
+        return PlainTextResponse(status_code=status.HTTP_409_CONFLICT,
+                                 content="")
+    return PlainTextResponse(status_code=status.HTTP_200_OK, content=stacks)
+
+
 class _CsrfSettings(BaseModel):
     secret_key : str = _api_conf["controller"]["csrf_secret_seed"]
 
@@ -163,11 +246,11 @@ def get_csrf_config():
 
 
 @_app.exception_handler(CsrfProtectError)
-def csrf_protect_exception_handler(request : Request, exc : CsrfProtectError):
+async def csrf_protect_exception_handler(request : Request, exc : CsrfProtectError):
     try:
         logger.error(f"CSRF error detected: {exc.message}")
         x_remote_user = request.headers.get("X-REMOTE-USER")
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = request.headers.get("X-REAL-IP")
         access_synopsis = [client, user_id, request.method, request.url]
         now = int(time.time())
@@ -176,14 +259,14 @@ def csrf_protect_exception_handler(request : Request, exc : CsrfProtectError):
                 "reason": f"CSRF protection error",
                 "time": str(now)}
         log_access(f"{code}", *access_synopsis)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = JSONResponse(status_code=code, content=body)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -195,9 +278,12 @@ async def validate_session(request : Request, call_next):
     twice, once here and once later).
     """
     try:
+        if request.url.path == PROFILE_PATH:
+            return await _serve_profile(request)
         peer_addr = make_typical_ip_address(str(request.client.host))
         x_remote_user = request.headers.get("X-REMOTE-USER")
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        (user_id, registered) = await _run_blocking(_check_session,
+                                                    x_remote_user)
         client = request.headers.get("X-REAL-IP")
         access_synopsis = [client, user_id, request.method, request.url]
         now = int(time.time())
@@ -209,10 +295,10 @@ async def validate_session(request : Request, call_next):
                     "time": str(now)}
             code = status.HTTP_403_FORBIDDEN
             log_access(f"{code}", *access_synopsis)
-            time.sleep(_api._bad_response_delay)
+            await _delay_bad_response(request)
             response = JSONResponse(status_code=code, content=body)
             return response
-        if not _api.check_user_is_registered(user_id):
+        if not registered:
             logger.error(f"Access by an unregistered user:"
                          f" uid={user_id}, x_remote_user={x_remote_user}")
             body = {"status": "error",
@@ -220,16 +306,21 @@ async def validate_session(request : Request, call_next):
                     "time": str(now)}
             code = status.HTTP_401_UNAUTHORIZED
             log_access(f"{code}", *access_synopsis)
-            time.sleep(_api._bad_response_delay)
+            await _delay_bad_response(request)
             response = JSONResponse(status_code=code, content=body)
             return response
-        response = await call_next(request)
+        with tracer.trace("api.request", request.headers.get("X-TRACEID"),
+                          kind="SERVER", method=request.method,
+                          path=request.url.path) as span:
+            response = await call_next(request)
+            span.set_tag("status", response.status_code)
+            pass
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -259,7 +350,7 @@ async def app_get_index(
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -274,15 +365,16 @@ async def app_get_ui(
     try:
         logger.debug(f"APP.GET /ui/index.html")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
-        response = _get_ui("ui", "index.html", client, user_id, request)
+        response = await _run_blocking(_get_ui, "ui", "index.html",
+                                       client, user_id, request)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -297,15 +389,16 @@ async def app_get_ui2(
     try:
         logger.debug(f"APP.GET /ui2/index.html")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
-        response = _get_ui("ui2", "index.html", client, user_id, request)
+        response = await _run_blocking(_get_ui, "ui2", "index.html",
+                                       client, user_id, request)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -334,17 +427,17 @@ async def app_get_get_user_info(
     try:
         logger.debug(f"APP.GET /user-info")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
-        triple = _api.api_get_user_info(user_id)
-        response = _make_json_response(triple, user_id, client, request,
-                                       csrf_protect)
+        triple = await _run_blocking(_api.api_get_user_info, user_id)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, csrf_protect)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -360,18 +453,18 @@ async def app_get_list_pools(
     try:
         logger.debug(f"APP.GET /pool")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
         csrf_protect.validate_csrf(request)
-        triple = _api.api_list_pools(user_id, None)
-        response = _make_json_response(triple, user_id, client, request,
-                                       None)
+        triple = await _run_blocking(_api.api_list_pools, user_id, None)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -388,18 +481,18 @@ async def app_get_get_pool(
     try:
         logger.debug(f"APP.GET /pool/{pool_id}")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
         csrf_protect.validate_csrf(request)
-        triple = _api.api_list_pools(user_id, pool_id)
-        response = _make_json_response(triple, user_id, client, request,
-                                       None)
+        triple = await _run_blocking(_api.api_list_pools, user_id, pool_id)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -415,19 +508,19 @@ async def app_post_make_pool(
     try:
         logger.debug(f"APP.POST /pool")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
         body = await _get_request_body(request)
         csrf_protect.validate_csrf(request)
-        triple = _api.api_make_pool(user_id, body)
-        response = _make_json_response(triple, user_id, client, request,
-                                       None)
+        triple = await _run_blocking(_api.api_make_pool, user_id, body)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -444,19 +537,19 @@ async def app_delete_delete_pool(
     try:
         logger.debug(f"APP.DELETE /pool/{pool_id}")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
         body = await _get_request_body(request)
         csrf_protect.validate_csrf(request)
-        triple = _api.api_delete_pool(user_id, pool_id)
-        response = _make_json_response(triple, user_id, client, request,
-                                       None)
+        triple = await _run_blocking(_api.api_delete_pool, user_id, pool_id)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -473,19 +566,20 @@ async def app_put_make_bucket(
     try:
         logger.debug(f"APP.PUT /pool/{pool_id}/bucket")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
         body = await _get_request_body(request)
         csrf_protect.validate_csrf(request)
-        triple = _api.api_make_bucket(user_id, pool_id, body)
-        response = _make_json_response(triple, user_id, client, request,
-                                       None)
+        triple = await _run_blocking(_api.api_make_bucket,
+                                     user_id, pool_id, body)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -503,19 +597,20 @@ async def app_delete_delete_bucket(
     try:
         logger.debug(f"APP.DELETE /pool/{pool_id}/bucket/{bucket}")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
         body = await _get_request_body(request)
         csrf_protect.validate_csrf(request)
-        triple = _api.api_delete_bucket(user_id, pool_id, bucket)
-        response = _make_json_response(triple, user_id, client, request,
-                                       None)
+        triple = await _run_blocking(_api.api_delete_bucket,
+                                     user_id, pool_id, bucket)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -532,19 +627,20 @@ async def app_post_make_secret(
     try:
         logger.debug(f"APP.POST /pool/{pool_id}/secret")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
         body = await _get_request_body(request)
         csrf_protect.validate_csrf(request)
-        triple = _api.api_make_secret(user_id, pool_id, body)
-        response = _make_json_response(triple, user_id, client, request,
-                                       None)
+        triple = await _run_blocking(_api.api_make_secret,
+                                     user_id, pool_id, body)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
@@ -562,19 +658,78 @@ async def app_delete_delete_secret(
     try:
         logger.debug(f"APP.DELETE /pool/{pool_id}/secret/{access_key}")
         tracing.set(x_traceid)
-        user_id = _api.map_claim_to_uid(x_remote_user)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
         client = x_real_ip
         body = await _get_request_body(request)
         csrf_protect.validate_csrf(request)
-        triple = _api.api_delete_secret(user_id, pool_id, access_key)
-        response = _make_json_response(triple, user_id, client, request,
-                                       None)
+        triple = await _run_blocking(_api.api_delete_secret,
+                                     user_id, pool_id, access_key)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
+        return response
+    except Exception as e:
+        m = rephrase_exception_message(e)
+        logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
+                     exc_info=True)
+        await _delay_bad_response(request)
+        response = _make_status_500_response(m)
+        return response
+    pass
+
+
+@_app.post("/pool/{pool_id}/batch")
+async def app_post_batch(
+        request : Request,
+        pool_id : str,
+        x_remote_user : Union[str, None] = Header(default=None),
+        x_real_ip : Union[str, None] = Header(default=None),
+        x_traceid : Union[str, None] = Header(default=None),
+        csrf_protect : CsrfProtect = Depends()):
+    try:
+        logger.debug(f"APP.POST /pool/{pool_id}/batch")
+        tracing.set(x_traceid)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
+        client = x_real_ip
+        body = await _get_request_body(request)
+        csrf_protect.validate_csrf(request)
+        triple = await _run_blocking(_api.api_batch,
+                                     user_id, pool_id, body)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
+        return response
+    except Exception as e:
+        m = rephrase_exception_message(e)
+        logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
+                     exc_info=True)
+        await _delay_bad_response(request)
+        response = _make_status_500_response(m)
+        return response
+    pass
+
+
+@_app.get("/job/{job_id}")
+async def app_get_get_job(
+        request : Request,
+        job_id : str,
+        x_remote_user : Union[str, None] = Header(default=None),
+        x_real_ip : Union[str, None] = Header(default=None),
+        x_traceid : Union[str, None] = Header(default=None),
+        csrf_protect : CsrfProtect = Depends()):
+    try:
+        logger.debug(f"APP.GET /job/{job_id}")
+        tracing.set(x_traceid)
+        user_id = await _run_blocking(_api.map_claim_to_uid, x_remote_user)
+        client = x_real_ip
+        csrf_protect.validate_csrf(request)
+        triple = await _run_blocking(_api.api_get_job, user_id, job_id)
+        response = await _make_json_response(triple, user_id, client,
+                                             request, None)
         return response
     except Exception as e:
         m = rephrase_exception_message(e)
         logger.error(f"Api GOT AN UNHANDLED EXCEPTION: ({m})",
                      exc_info=True)
-        time.sleep(_api._bad_response_delay)
+        await _delay_bad_response(request)
         response = _make_status_500_response(m)
         return response
     pass
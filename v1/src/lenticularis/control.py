@@ -6,8 +6,11 @@
 
 import os
 import time
+import random
+import threading
 import posixpath
 import inspect
+from concurrent.futures import ThreadPoolExecutor
 import lenticularis
 from lenticularis.mc import Mc
 from lenticularis.table import get_table
@@ -15,7 +18,8 @@ from lenticularis.pooldata import Pool_State
 from lenticularis.pooldata import Api_Error
 from lenticularis.pooldata import Pool_State, Pool_Reason
 from lenticularis.pooldata import set_pool_state
-from lenticularis.pooldata import gather_pool_desc
+from lenticularis.pooldata import update_pool_state
+from lenticularis.pooldata import gather_pool_desc, gather_pool_descs
 from lenticularis.pooldata import check_user_naming
 from lenticularis.pooldata import access_mux
 from lenticularis.pooldata import ensure_user_is_authorized
@@ -28,15 +32,36 @@ from lenticularis.pooldata import get_pool_owner_for_messages
 from lenticularis.pooldata import check_pool_naming
 from lenticularis.pooldata import check_bucket_naming
 from lenticularis.pooldata import check_pool_is_well_formed
+from lenticularis.pooldata import set_record_validation
 from lenticularis.utility import get_ip_addresses
+from lenticularis.utility import configure_resolver
 from lenticularis.utility import copy_minimal_environ
 from lenticularis.utility import generate_secret_key
 from lenticularis.utility import pick_one
+from lenticularis.utility import random_str
 from lenticularis.utility import host_port
 from lenticularis.utility import rephrase_exception_message
 from lenticularis.utility import logger
 
 
+# A limit on the number of operations in a batch request.
+
+_max_batch_operations = 200
+
+# An interval to refresh the modification-time of a queued or running
+# job.  A job not refreshed in a few intervals is regarded as lost
+# (its Api worker has stopped).
+
+_job_refresh_interval = 10
+_job_stale_time = 6 * _job_refresh_interval
+
+# An interval to retry migration of the indexes, used when the expiry
+# sweeper is disabled.  Migration is retried in the sweeper thread
+# until some worker finishes it.
+
+_index_migration_interval = 60
+
+
 def erase_minio_ep(tables, pool_id):
     """Clears a MinIO endpoint."""
     try:
@@ -58,71 +83,38 @@ def erase_minio_ep(tables, pool_id):
 
 def erase_pool_data(tables, pool_id):
     """Clears database about the pool."""
-    path = tables.get_buckets_directory_of_pool(pool_id)
-    bkts = tables.list_buckets(pool_id)
-    keys = tables.list_secrets_of_pool(pool_id)
-    logger.debug(f"Api (pool={pool_id}) Deleting buckets-directory: {path}")
-    try:
-        tables.delete_buckets_directory(path)
-    except Exception as e:
-        m = rephrase_exception_message(e)
-        logger.info(f"Api (pool={pool_id}) delete_buckets_directory failed:"
-                    f" exception=({m})")
-        pass
-    bktnames = [b["name"] for b in bkts]
-    logger.debug(f"Api (pool={pool_id}) Deleting buckets: {bktnames}")
-    for b in bktnames:
-        try:
-            tables.delete_bucket(b)
-        except Exception as e:
-            m = rephrase_exception_message(e)
-            logger.info(f"Api (pool={pool_id}) delete_bucket failed:"
-                        f" exception=({m})")
-            pass
-        pass
-    keynames = [k["access_key"] for k in keys]
-    logger.debug(f"Api (pool={pool_id}) Deleting access-keys: {keynames}")
-    for k in keynames:
-        try:
-            tables.delete_xid_unconditionally("akey", k)
-        except Exception as e:
-            m = rephrase_exception_message(e)
-            logger.info(f"Api (pool={pool_id}) delete_xid failed:"
-                        f" exception=({m})")
-            pass
-        pass
-    logger.debug(f"Api (pool={pool_id}) Deleting pool states")
-    try:
-        tables.delete_pool(pool_id)
-    except Exception as e:
-        m = rephrase_exception_message(e)
-        logger.info(f"Api (pool={pool_id}) delete_pool failed:"
-                    f" exception=({m})")
-        pass
-    try:
-        tables.delete_pool_state(pool_id)
-    except Exception as e:
-        m = rephrase_exception_message(e)
-        logger.info(f"Api (pool={pool_id}) delete_pool_state failed:"
-                    f" exception=({m})")
-        pass
+    erase_pools_data(tables, [pool_id])
+    pass
+
+
+def erase_pools_data(tables, pool_ids):
+    """Clears database about the pools.  Each pool is deleted atomically,
+    and all pools are deleted in one round-trip (after reading the
+    pool descriptions).  It raises an exception on a failure.
+    """
     try:
-        tables.delete_xid_unconditionally("pool", pool_id)
+        counts = tables.delete_pools(pool_ids)
     except Exception as e:
         m = rephrase_exception_message(e)
-        logger.info(f"Api (pool={pool_id}) delete_xid failed: exception=({m})")
+        logger.error(f"Api (pools={pool_ids}) delete_pools failed:"
+                     f" exception=({m})")
+        raise
+    for (pid, (nbkts, nkeys)) in counts.items():
+        logger.debug(f"Api (pool={pid}) Deleted pool data:"
+                     f" buckets={nbkts}, access-keys={nkeys}")
         pass
     pass
 
 
 def list_user_pools(tables, uid, pool_id):
     """Lists pools owned by a user.  It checks the owner of a pool if
-    pooi-id is given.
+    pooi-id is given.  It uses the index of user to pools, which may
+    include removed pools in races.
     """
-    pools = tables.list_pools(pool_id)
-    pids = [pid for pid in pools
-            for p in [tables.get_pool(pid)]
-            if p is not None and p.get("owner_uid") == uid]
+    pids = tables.list_pools_of_user(uid)
+    if pool_id is not None:
+        pids = [pid for pid in pids if pid == pool_id]
+        pass
     return pids
 
 
@@ -183,6 +175,8 @@ class Control_Api():
         self.pkg_dir = os.path.dirname(inspect.getfile(lenticularis))
 
         api_param = api_conf["controller"]
+        configure_resolver(float(api_param.get("dns_cache_ttl", 300)),
+                           float(api_param.get("dns_negative_ttl", 30)))
         self._front_host = api_param["front_host"]
         self._front_host_ip = get_ip_addresses(self._front_host)[0]
         proxies = api_param["trusted_proxies"]
@@ -194,6 +188,19 @@ class Control_Api():
         self._mc_timeout = int(api_param["minio_mc_timeout"])
         self._max_pool_expiry = int(api_param["max_pool_expiry"])
         self.csrf_key = api_param["csrf_secret_seed"]
+        self._sweep_interval = int(api_param.get("expiry_sweep_interval",
+                                                 300))
+        self._sweep_batch = int(api_param.get("expiry_sweep_batch", 100))
+        self._job_expiry = int(api_param.get("job_expiry", 3600))
+        self._jobs = ThreadPoolExecutor(
+            max_workers=int(api_param.get("job_workers", 4)),
+            thread_name_prefix="lens3-job")
+        self._job_slots = threading.BoundedSemaphore(
+            int(api_param.get("job_queue_limit", 16)))
+        # Jobs queued or running in this worker, a job-id maps to a job.
+        self._job_lock = threading.Lock()
+        self._live_jobs = {}
+        set_record_validation(api_param.get("record_validation", "all"))
 
         ui_param = api_conf["ui"]
         self._s3_url = ui_param.get("s3_url", "")
@@ -204,8 +211,13 @@ class Control_Api():
         env = copy_minimal_environ(os.environ)
         self._env_mc = env
 
-        self._bad_response_delay = 1
         self.tables = get_table(redis)
+        # The sweeper thread also adds index entries missing for the
+        # data made before indexing (see Table.migrate_indexes()).
+        threading.Thread(target=self.sweep_expiry, daemon=True,
+                         name="lens3-sweeper").start()
+        threading.Thread(target=self.refresh_jobs, daemon=True,
+                         name="lens3-job-refresher").start()
         pass
 
     def _check_make_pool_arguments(self, user_id, pooldesc):
@@ -407,6 +419,222 @@ class Control_Api():
             raise
         pass
 
+    # Asynchronous jobs.
+
+    def _submit_job(self, user_id, op, pool_id, steps):
+        """Starts a job and returns a job-id.  Steps are a list of pairs of
+        a progress message and a function, which are run in order in a
+        thread.  A status of a job is stored in Redis to be polled by
+        any Api worker.  It raises an exception with code=503 when too
+        many jobs are accepted.
+        """
+        if not self._job_slots.acquire(blocking=False):
+            raise Api_Error(503, "Too many jobs running", None)
+        job_id = random_str(20)
+        try:
+            now = int(time.time())
+            job = {"owner": user_id, "op": op, "pool": pool_id,
+                   "status": "queued", "progress": "-", "reason": "-",
+                   "start_time": now, "modification_time": now}
+            with self._job_lock:
+                self.tables.set_job(job_id, job, self._job_expiry)
+                self._live_jobs[job_id] = job
+                pass
+            self._jobs.submit(self._run_job, job_id, job, steps)
+            return job_id
+        except Exception:
+            with self._job_lock:
+                self._live_jobs.pop(job_id, None)
+                pass
+            self._job_slots.release()
+            raise
+        pass
+
+    def _store_job(self, job_id, job, final):
+        """Stores a job status.  A finished job is removed from the live
+        jobs in the lock, so that refreshing does not overwrite the
+        final status.
+        """
+        with self._job_lock:
+            job["modification_time"] = int(time.time())
+            if final:
+                self._live_jobs.pop(job_id, None)
+                pass
+            self.tables.set_job(job_id, job, self._job_expiry)
+            pass
+        pass
+
+    def refresh_jobs(self):
+        """Refreshes the modification-time of live jobs periodically.  It
+        is run in a thread.  A job of a stopped worker is found by a
+        stale modification-time (see _api_get_job()).
+        """
+        while True:
+            time.sleep(_job_refresh_interval)
+            try:
+                with self._job_lock:
+                    now = int(time.time())
+                    for (job_id, job) in self._live_jobs.items():
+                        job["modification_time"] = now
+                        self.tables.set_job(job_id, job, self._job_expiry)
+                        pass
+                    pass
+            except Exception as e:
+                m = rephrase_exception_message(e)
+                logger.error(f"Api Refreshing jobs failed:"
+                             f" exception=({m})")
+                pass
+            pass
+        pass
+
+    def _run_job(self, job_id, job, steps):
+        op = job["op"]
+        pool_id = job["pool"]
+        try:
+            job["status"] = "running"
+            for (progress, fn) in steps:
+                job["progress"] = progress
+                self._store_job(job_id, job, False)
+                fn()
+                pass
+            job["status"] = "succeeded"
+            job["progress"] = "done"
+        except Api_Error as e:
+            job["status"] = "failed"
+            job["reason"] = f"{e}"
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.error(f"Api (pool={pool_id}) Job {op} failed:"
+                         f" job={job_id}; exception=({m})",
+                         exc_info=True)
+            job["status"] = "failed"
+            job["reason"] = m
+            pass
+        try:
+            self._store_job(job_id, job, True)
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.error(f"Api (pool={pool_id}) Storing a job status failed:"
+                         f" job={job_id}; exception=({m})")
+            with self._job_lock:
+                self._live_jobs.pop(job_id, None)
+                pass
+            pass
+        self._job_slots.release()
+        pass
+
+    # Expiry sweeper.
+
+    def sweep_expiry(self):
+        """Removes expired access-keys and disables expired pools
+        periodically.  It is run in a thread.  Api workers take turns
+        by a lock in Redis, so that a sweep runs in one worker at a
+        time.  It also retries migration of the indexes until it is
+        done, and only that when sweeping is disabled.
+        """
+        sweeping = (self._sweep_interval > 0)
+        interval = (self._sweep_interval if sweeping
+                    else _index_migration_interval)
+        owner = f"{os.uname().nodename}:{os.getpid()}"
+        migrated = self._migrate_indexes()
+        time.sleep(interval * random.random())
+        while True:
+            if not migrated:
+                migrated = self._migrate_indexes()
+                pass
+            if migrated and not sweeping:
+                return
+            try:
+                if (sweeping
+                    and self.tables.take_sweeper_turn(owner, interval)):
+                    (nkeys, npools) = self._sweep_expired_entries()
+                    if nkeys > 0 or npools > 0:
+                        logger.info(f"Api Sweeping expired entries:"
+                                    f" access-keys={nkeys},"
+                                    f" pools={npools}")
+                        pass
+                    pass
+            except Exception as e:
+                m = rephrase_exception_message(e)
+                logger.error(f"Api Sweeping expired entries failed:"
+                             f" exception=({m})")
+                pass
+            time.sleep(interval if migrated
+                       else min(interval, _index_migration_interval))
+            pass
+        pass
+
+    def _migrate_indexes(self):
+        """Runs migration of the indexes.  It returns true when the
+        indexes are current.
+        """
+        try:
+            return self.tables.migrate_indexes()
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.error(f"Api Migrating indexes failed: exception=({m})")
+            return False
+        pass
+
+    def _sweep_expired_entries(self):
+        """Sweeps expired entries in batches by the expiry indexes.  It
+        returns the numbers of removed access-keys and disabled pools.
+        """
+        now = int(time.time())
+        batch = self._sweep_batch
+        nkeys = 0
+        while True:
+            pairs = self.tables.list_expired_keys(now, batch)
+            keys = {}
+            for (key, d) in pairs:
+                keys.setdefault(d["owner"], []).append(key)
+                pass
+            for (pool_id, kk) in keys.items():
+                self._remove_expired_keys(pool_id, kk)
+                pass
+            nkeys += len(pairs)
+            if len(pairs) < batch:
+                break
+            pass
+        npools = 0
+        while True:
+            pids = self.tables.list_expired_pools(now, batch)
+            for pool_id in pids:
+                update_pool_state(self.tables, pool_id)
+                pass
+            self.tables.drop_pool_expiry(pids)
+            npools += len(pids)
+            if len(pids) < batch:
+                break
+            pass
+        return (nkeys, npools)
+
+    def _remove_expired_keys(self, pool_id, keys):
+        """Removes expired access-keys of a pool in MinIO and in Redis.  It
+        removes them in MinIO only when MinIO is running.  Otherwise,
+        they are removed at the next start of MinIO, because they are
+        no longer recorded.
+        """
+        if self.tables.get_minio_proc(pool_id) is not None:
+            try:
+                mc = self._make_mc_for_pool(pool_id)
+                with mc:
+                    for key in keys:
+                        mc.delete_secret(key)
+                        pass
+                    pass
+            except Exception as e:
+                m = rephrase_exception_message(e)
+                logger.info(f"Api (pool={pool_id}) Removing expired"
+                            f" access-keys in MinIO failed (ignored):"
+                            f" exception=({m})")
+                pass
+            pass
+        for key in keys:
+            self.tables.delete_xid_unconditionally("akey", key)
+            pass
+        pass
+
     # Query interface.
 
     def api_get_user_info(self, user_id):
@@ -415,14 +643,12 @@ class Control_Api():
             info = self._api_get_user_info(user_id)
             return (200, None, info)
         except Api_Error as e:
-            time.sleep(self._bad_response_delay)
             return (e.code, f"{e}", None)
         except Exception as e:
             m = rephrase_exception_message(e)
             logger.error((f"Api () get_user_info failed:"
                           f" user={user_id}; exception=({m})"),
                          exc_info=True)
-            time.sleep(self._bad_response_delay)
             return (500, m, None)
         pass
 
@@ -439,14 +665,12 @@ class Control_Api():
             triple = self._api_list_pools(user_id, pool_id)
             return triple
         except Api_Error as e:
-            time.sleep(self._bad_response_delay)
             return (e.code, f"{e}", None)
         except Exception as e:
             m = rephrase_exception_message(e)
             logger.error((f"Api (pool={pool_id}) list_pools failed:"
                           f" user={user_id}; exception=({m})"),
                          exc_info=True)
-            time.sleep(self._bad_response_delay)
             return (500, m, None)
         pass
 
@@ -458,61 +682,98 @@ class Control_Api():
             triple = self._api_make_pool(user_id, body)
             return triple
         except Api_Error as e:
-            time.sleep(self._bad_response_delay)
             return (e.code, f"{e}", None)
         except Exception as e:
             m = rephrase_exception_message(e)
             logger.error((f"Api (user={user_id}) make_pool failed:"
                           f" args=({body}); exception=({m})"),
                          exc_info=True)
-            time.sleep(self._bad_response_delay)
             return (500, m, None)
         pass
 
     def api_delete_pool(self, user_id, pool_id):
         """Deletes a pool.  It clears buckets and access-keys set in MinIO.
         It deletes a pool despite of the ensure_pool_state() state.
+        Deletion is done in a job, and it returns a job-id.
         """
         try:
             if not check_pool_naming(pool_id):
                 raise Api_Error(403, f"Bad pool={pool_id}", None)
-            self._api_delete_pool(user_id, pool_id)
-            return (200, None, None)
+            triple = self._api_delete_pool(user_id, pool_id)
+            return triple
         except Api_Error as e:
-            time.sleep(self._bad_response_delay)
             return (e.code, f"{e}", None)
         except Exception as e:
             m = rephrase_exception_message(e)
             logger.error((f"Api (pool={pool_id}) delete_pool failed:"
                           f" user={user_id}; exception=({m})"),
                          exc_info=True)
-            time.sleep(self._bad_response_delay)
             return (500, m, None)
         pass
 
+    def api_get_job(self, user_id, job_id):
+        """Returns a status of a job.  It also returns a pool description
+        for a job of making a pool.
+        """
+        try:
+            if not check_pool_naming(job_id):
+                raise Api_Error(403, f"Bad job-id={job_id}", None)
+            triple = self._api_get_job(user_id, job_id)
+            return triple
+        except Api_Error as e:
+            return (e.code, f"{e}", None)
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.error((f"Api (user={user_id}) get_job failed:"
+                          f" job={job_id}; exception=({m})"),
+                         exc_info=True)
+            return (500, m, None)
+        pass
+
+    def _check_make_bucket_arguments(self, body):
+        argument_keys = {"name", "bkt_policy"}
+        if (set(body.keys()) != argument_keys):
+            raise Api_Error(403, f"Bad make_bucket argument={body}", None)
+        bucket = body.get("name")
+        policy = body.get("bkt_policy")
+        if not check_bucket_naming(bucket):
+            raise Api_Error(403, f"Bad bucket name={bucket}", None)
+        if policy not in {"none", "public", "upload", "download"}:
+            raise Api_Error(403, f"Bad bucket policy={policy}", None)
+        return (bucket, policy)
+
+    def _check_make_secret_arguments(self, body):
+        argument_keys = {"key_policy", "expiration_time"}
+        if (set(body.keys()) != argument_keys):
+            raise Api_Error(403, f"Bad make_secret argument={body}", None)
+        rw = body.get("key_policy")
+        if rw not in {"readwrite", "readonly", "writeonly"}:
+            raise Api_Error(403, f"Bad access policy={rw}", None)
+        tv = body.get("expiration_time")
+        if tv is None:
+            raise Api_Error(403, f"Bad expiration={tv}", None)
+        try:
+            expiration = int(tv)
+        except ValueError:
+            raise Api_Error(403, f"Bad expiration={tv}", None)
+        if not self._check_expiration_range(expiration):
+            raise Api_Error(403, f"Bad range expiration={tv}", None)
+        return (rw, expiration)
+
     # Buckets interface.
 
     def api_make_bucket(self, user_id, pool_id, body):
-        argument_keys = {"name", "bkt_policy"}
         bucket = None
         policy = None
         try:
             if not check_pool_naming(pool_id):
                 raise Api_Error(403, f"Bad pool-id={pool_id}", None)
-            if (set(body.keys()) != argument_keys):
-                raise Api_Error(403, f"Bad make_bucket argument={body}", None)
-            bucket = body.get("name")
-            policy = body.get("bkt_policy")
-            if not check_bucket_naming(bucket):
-                raise Api_Error(403, f"Bad bucket name={bucket}", None)
-            if policy not in {"none", "public", "upload", "download"}:
-                raise Api_Error(403, f"Bad bucket policy={policy}", None)
+            (bucket, policy) = self._check_make_bucket_arguments(body)
             logger.debug(f"Api (pool={pool_id}) Adding a bucket:"
                          f" name={bucket}, policy={policy}")
             triple = self._api_make_bucket(user_id, pool_id, bucket, policy)
             return triple
         except Api_Error as e:
-            time.sleep(self._bad_response_delay)
             return (e.code, f"{e}", None)
         except Exception as e:
             m = rephrase_exception_message(e)
@@ -520,7 +781,6 @@ class Control_Api():
                           f" user={user_id}, args={body};"
                           f" exception=({m})"),
                          exc_info=True)
-            time.sleep(self._bad_response_delay)
             return (500, m, None)
         pass
 
@@ -537,7 +797,6 @@ class Control_Api():
             triple = self._api_delete_bucket(user_id, pool_id, bucket)
             return triple
         except Api_Error as e:
-            time.sleep(self._bad_response_delay)
             return (e.code, f"{e}", None)
         except Exception as e:
             m = rephrase_exception_message(e)
@@ -545,38 +804,22 @@ class Control_Api():
                           f" user={user_id}, bucket={bucket};"
                           f" exception=({m})"),
                          exc_info=True)
-            time.sleep(self._bad_response_delay)
             return (500, m, None)
         pass
 
     # Secrets interface.
 
     def api_make_secret(self, user_id, pool_id, body):
-        argument_keys = {"key_policy", "expiration_time"};
         rw = None
         expiration = None
         try:
             if not check_pool_naming(pool_id):
                 raise Api_Error(403, f"Bad pool-id={pool_id}", None)
-            if (set(body.keys()) != argument_keys):
-                raise Api_Error(403, f"Bad make_secret argument={body}", None)
-            rw = body.get("key_policy")
-            if rw not in {"readwrite", "readonly", "writeonly"}:
-                raise Api_Error(403, f"Bad access policy={rw}", None)
-            tv = body.get("expiration_time")
-            if tv is None:
-                raise Api_Error(403, f"Bad expiration={tv}", None)
-            try:
-                expiration = int(tv)
-            except ValueError:
-                raise Api_Error(403, f"Bad expiration={tv}", None)
-            if not self._check_expiration_range(expiration):
-                raise Api_Error(403, f"Bad range expiration={tv}", None)
+            (rw, expiration) = self._check_make_secret_arguments(body)
             logger.debug(f"Api (pool={pool_id}) Adding a new secret: {rw}")
             triple = self._api_make_secret(user_id, pool_id, rw, expiration)
             return triple
         except Api_Error as e:
-            time.sleep(self._bad_response_delay)
             return (e.code, f"{e}", None)
         except Exception as e:
             m = rephrase_exception_message(e)
@@ -584,7 +827,6 @@ class Control_Api():
                           f" user={user_id}, args={body};"
                           f" exception=({m})"),
                          exc_info=True)
-            time.sleep(self._bad_response_delay)
             return (500, m, None)
         pass
 
@@ -602,7 +844,6 @@ class Control_Api():
             triple = self._api_delete_secret(user_id, pool_id, access_key)
             return triple
         except Api_Error as e:
-            time.sleep(self._bad_response_delay)
             return (e.code, f"{e}", None)
         except Exception as e:
             m = rephrase_exception_message(e)
@@ -610,10 +851,81 @@ class Control_Api():
                           f" user={user_id}, key={access_key};"
                           f" exception=({m})"),
                          exc_info=True)
-            time.sleep(self._bad_response_delay)
             return (500, m, None)
         pass
 
+    # Batch interface.
+
+    def api_batch(self, user_id, pool_id, body):
+        """Applies a list of operations on buckets and access-keys.  It
+        returns the results of each operation, and a failure of an
+        operation does not stop the rest.  Operations are checked
+        here, and a bad operation is recorded as a failure.
+        """
+        try:
+            if not check_pool_naming(pool_id):
+                raise Api_Error(403, f"Bad pool-id={pool_id}", None)
+            if (set(body.keys()) != {"operations"}
+                    or not isinstance(body.get("operations"), list)):
+                raise Api_Error(403, f"Bad batch argument={body}", None)
+            operations = body.get("operations")
+            if len(operations) > _max_batch_operations:
+                raise Api_Error(403, (f"Too many batch operations:"
+                                      f" count={len(operations)}"), None)
+            ops = [self._check_batch_operation(d) for d in operations]
+            logger.debug(f"Api (pool={pool_id}) Applying a batch:"
+                         f" count={len(ops)}")
+            triple = self._api_batch(user_id, pool_id, ops)
+            return triple
+        except Api_Error as e:
+            return (e.code, f"{e}", None)
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.error((f"Api (pool={pool_id}) batch failed:"
+                          f" user={user_id};"
+                          f" exception=({m})"),
+                         exc_info=True)
+            return (500, m, None)
+        pass
+
+    def _check_batch_operation(self, d):
+        """Checks an operation of a batch.  It returns a pair of a checked
+        operation and None, or None and a failure result.
+        """
+        op = None
+        try:
+            if not isinstance(d, dict):
+                raise Api_Error(403, f"Bad batch operation={d}")
+            op = d.get("op")
+            args = {k: v for (k, v) in d.items() if k != "op"}
+            if op == "make_bucket":
+                (bucket, policy) = self._check_make_bucket_arguments(args)
+                return ({"op": op, "name": bucket, "bkt_policy": policy},
+                        None)
+            elif op == "delete_bucket":
+                bucket = args.get("name")
+                if set(args.keys()) != {"name"}:
+                    raise Api_Error(403, f"Bad delete_bucket argument={d}")
+                if not check_bucket_naming(bucket):
+                    raise Api_Error(403, f"Bad bucket name={bucket}")
+                return ({"op": op, "name": bucket}, None)
+            elif op == "make_secret":
+                (rw, expiration) = self._check_make_secret_arguments(args)
+                return ({"op": op, "key_policy": rw,
+                         "expiration_time": expiration}, None)
+            elif op == "delete_secret":
+                key = args.get("access_key")
+                if set(args.keys()) != {"access_key"}:
+                    raise Api_Error(403, f"Bad delete_secret argument={d}")
+                if not check_pool_naming(key):
+                    raise Api_Error(403, f"Bad access-key={key}")
+                return ({"op": op, "access_key": key}, None)
+            else:
+                raise Api_Error(403, f"Bad batch operation={d}")
+        except Api_Error as e:
+            return (None, {"op": op, "status": "error", "reason": f"{e}"})
+        pass
+
     # API implementation.
 
     def _api_get_user_info(self, user_id):
@@ -638,13 +950,14 @@ class Control_Api():
         self._check_make_pool_arguments(user_id, makepool)
         path = makepool["buckets_directory"]
         owner_gid = makepool["owner_gid"]
-        pool_id = self._do_make_pool(path, user_id, owner_gid)
-        # Return a pool description for Web-API.
+        (pool_id, job_id) = self._do_make_pool(path, user_id, owner_gid)
+        # Return a pool description for Web-API.  The pool is in the
+        # initial state until the job starts MinIO.
         pooldesc1 = gather_pool_desc(self.tables, pool_id)
         assert pooldesc1 is not None
         try:
             check_pool_is_well_formed(pooldesc1, None)
-            return (200, None, {"pool_desc": pooldesc1})
+            return (202, None, {"pool_desc": pooldesc1, "job_id": job_id})
         except Exception as e:
             m = rephrase_exception_message(e)
             logger.error(f"Api (pool={pool_id})"
@@ -655,23 +968,59 @@ class Control_Api():
         pass
 
     def _do_make_pool(self, path, uid, gid):
+        """Makes a pool and starts MinIO in a job.  It returns a pool-id
+        and a job-id.
+        """
         tables = self.tables
         expiration = self._determine_expiration_time()
         pool_id = _make_new_pool(tables, path, uid, gid, expiration)
-        self._activate_minio(pool_id, True)
-        return pool_id
+        steps = [("starting MinIO",
+                  lambda: self._activate_minio(pool_id, True))]
+        try:
+            job_id = self._submit_job(uid, "make_pool", pool_id, steps)
+        except Exception:
+            try:
+                erase_pool_data(tables, pool_id)
+            except Exception:
+                pass
+            raise
+        return (pool_id, job_id)
 
     def _api_delete_pool(self, user_id, pool_id):
         self._grant_access(user_id, pool_id, False)
-        ok = self._do_delete_pool(pool_id)
-        return (200, None, None)
+        steps = [("cleaning MinIO", lambda: self._clean_minio(pool_id)),
+                 ("erasing pool", lambda: self._do_delete_pool(pool_id))]
+        job_id = self._submit_job(user_id, "delete_pool", pool_id, steps)
+        return (202, None, {"job_id": job_id})
 
     def _do_delete_pool(self, pool_id):
-        self._clean_minio(pool_id)
         erase_minio_ep(self.tables, pool_id)
         erase_pool_data(self.tables, pool_id)
         return True
 
+    def _api_get_job(self, user_id, job_id):
+        self._grant_access(user_id, None, False)
+        job = self.tables.get_job(job_id)
+        if job is None:
+            raise Api_Error(404, f"Job not found: job={job_id}")
+        if job["owner"] != user_id:
+            raise Api_Error(403, f"Not the owner of a job: job={job_id}")
+        now = int(time.time())
+        if (job["status"] in {"queued", "running"}
+                and now > job["modification_time"] + _job_stale_time):
+            # The worker running the job has stopped.
+            job["status"] = "failed"
+            job["reason"] = "Job lost (Api worker stopped)"
+            job["modification_time"] = now
+            self.tables.set_job(job_id, job, self._job_expiry)
+            pass
+        pooldesc = None
+        if job["op"] == "make_pool":
+            pooldesc = gather_pool_desc(self.tables, job["pool"])
+            pass
+        return (200, None, {"job": {"job_id": job_id, **job},
+                            "pool_desc": pooldesc})
+
     def _clean_minio(self, pool_id):
         """Cleans MinIO status."""
         try:
@@ -773,13 +1122,13 @@ class Control_Api():
         self._grant_access(user_id, None, False)
         pool_list = []
         pools = list_user_pools(self.tables, user_id, pool_id)
+        descs = gather_pool_descs(self.tables, pools)
         for pid in pools:
-            pooldesc = gather_pool_desc(self.tables, pid)
-            if pooldesc is None:
-                logger.debug(f"Api (pool={pool_id}) Removing a pool in race;"
+            pooldesc = descs.get(pid)
+            if pooldesc is None or pooldesc["owner_uid"] != user_id:
+                logger.debug(f"Api (pool={pid}) Removing a pool in race;"
                              f" list-pools runs without a lock (ignored).")
                 continue
-            assert pooldesc["owner_uid"] == user_id
             pool_list.append(pooldesc)
             pass
         pool_list = sorted(pool_list, key=lambda k: k["buckets_directory"])
@@ -795,6 +1144,14 @@ class Control_Api():
         return (200, None, {"pool_desc": pooldesc})
 
     def _do_make_bucket(self, pool_id, bucket, bkt_policy):
+        mc = self._make_mc_for_pool(pool_id)
+        assert mc is not None
+        with mc:
+            self._make_bucket_with_mc(mc, pool_id, bucket, bkt_policy)
+            pass
+        pass
+
+    def _make_bucket_with_mc(self, mc, pool_id, bucket, bkt_policy):
         now = int(time.time())
         desc = {"pool": pool_id, "bkt_policy": bkt_policy,
                 "modification_time": now}
@@ -803,11 +1160,7 @@ class Control_Api():
             owner = get_pool_owner_for_messages(self.tables, holder)
             raise Api_Error(403, f"Bucket name taken: owner={owner}")
         try:
-            mc = self._make_mc_for_pool(pool_id)
-            assert mc is not None
-            with mc:
-                mc.make_bucket(bucket, bkt_policy)
-                pass
+            mc.make_bucket(bucket, bkt_policy)
         except Exception:
             self.tables.delete_bucket(bucket)
             raise
@@ -858,21 +1211,25 @@ class Control_Api():
         return (200, None, {"pool_desc": pooldesc})
 
     def _do_make_secret(self, pool_id, key_policy, expiration):
+        mc = self._make_mc_for_pool(pool_id)
+        assert mc is not None
+        with mc:
+            self._make_secret_with_mc(mc, pool_id, key_policy, expiration)
+            pass
+        pooldesc1 = gather_pool_desc(self.tables, pool_id)
+        return pooldesc1
+
+    def _make_secret_with_mc(self, mc, pool_id, key_policy, expiration):
         secret = generate_secret_key()
         info = {"secret_key": secret, "key_policy": key_policy,
                 "expiration_time": expiration}
         key = self.tables.make_unique_xid("akey", pool_id, info)
         try:
-            mc = self._make_mc_for_pool(pool_id)
-            assert mc is not None
-            with mc:
-                mc.make_secret(key, secret, key_policy)
-                pass
+            mc.make_secret(key, secret, key_policy)
         except Exception:
             self.tables.delete_xid_unconditionally("akey", key)
             raise
-        pooldesc1 = gather_pool_desc(self.tables, pool_id)
-        return pooldesc1
+        return key
 
     def _api_delete_secret(self, user_id, pool_id, access_key):
         self._grant_access(user_id, pool_id, False)
@@ -907,4 +1264,98 @@ class Control_Api():
         pooldesc1 = gather_pool_desc(self.tables, pool_id)
         return pooldesc1
 
+    # Batch handling implementation.
+
+    def _api_batch(self, user_id, pool_id, ops):
+        """Applies operations in one MC session.  It lists buckets and
+        access-keys in MinIO once for checking deletions.
+        """
+        self._activate_minio(pool_id, False)
+        self._grant_access(user_id, pool_id, True)
+        results = []
+        mc = self._make_mc_for_pool(pool_id)
+        assert mc is not None
+        with mc:
+            listing = {}
+            for (op, failure) in ops:
+                if failure is not None:
+                    results.append(failure)
+                    continue
+                results.append(self._do_batch_operation(
+                    mc, pool_id, op, listing))
+                pass
+            pass
+        pooldesc = gather_pool_desc(self.tables, pool_id)
+        return (200, None, {"pool_desc": pooldesc, "results": results})
+
+    def _do_batch_operation(self, mc, pool_id, op, listing):
+        """Performs an operation and returns its result.  Deleting a bucket
+        ignores errors in MC commands as _do_delete_bucket() does.
+        """
+        kind = op["op"]
+        result = {k: v for (k, v) in op.items()
+                  if k in {"op", "name", "access_key"}}
+        try:
+            if kind == "make_bucket":
+                self._make_bucket_with_mc(mc, pool_id, op["name"],
+                                          op["bkt_policy"])
+            elif kind == "delete_bucket":
+                bucket = op["name"]
+                ensure_bucket_owner(self.tables, bucket, pool_id)
+                try:
+                    if "buckets" not in listing:
+                        listing["buckets"] = {
+                            d.get("name") for d in mc.list_buckets()}
+                        pass
+                    if bucket not in listing["buckets"]:
+                        logger.error(f"Api (pool={pool_id}) Inconsistency"
+                                     f" found in MinIO and Lens3 in"
+                                     f" deleting a bucket: bucket={bucket}")
+                    else:
+                        mc.delete_bucket(bucket)
+                        listing["buckets"].discard(bucket)
+                        pass
+                except Exception as e:
+                    m = rephrase_exception_message(e)
+                    logger.error(f"Api (pool={pool_id}) delete_bucket"
+                                 f" failed: exception=({m})",
+                                 exc_info=True)
+                    pass
+                self.tables.delete_bucket(bucket)
+            elif kind == "make_secret":
+                key = self._make_secret_with_mc(mc, pool_id,
+                                                op["key_policy"],
+                                                op["expiration_time"])
+                result["access_key"] = key
+            elif kind == "delete_secret":
+                key = op["access_key"]
+                ensure_secret_owner_only(self.tables, key, pool_id)
+                if "secrets" not in listing:
+                    listing["secrets"] = {
+                        d.get("access_key") for d in mc.list_secrets()}
+                    pass
+                if key not in listing["secrets"]:
+                    logger.error(f"Api (pool={pool_id}) Inconsistency"
+                                 f" found in MinIO and Lens3 in deleting"
+                                 f" an access-key: access-key={key}")
+                else:
+                    mc.delete_secret(key)
+                    listing["secrets"].discard(key)
+                    pass
+                self.tables.delete_xid_unconditionally("akey", key)
+            else:
+                assert False, f"Bad batch operation={op}"
+                pass
+            result.update({"status": "success", "reason": None})
+        except Api_Error as e:
+            result.update({"status": "error", "reason": f"{e}"})
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.error(f"Api (pool={pool_id}) batch {kind} failed:"
+                         f" exception=({m})",
+                         exc_info=True)
+            result.update({"status": "error", "reason": m})
+            pass
+        return result
+
     pass
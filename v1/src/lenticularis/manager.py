@@ -17,6 +17,9 @@ start and end messages.
 import argparse
 import os
 import errno
+import pwd
+import shutil
+import stat
 from signal import signal, alarm, SIGTERM, SIGCHLD, SIGALRM, SIG_IGN
 from subprocess import Popen, DEVNULL, PIPE, TimeoutExpired
 import random
@@ -36,12 +39,15 @@ from lenticularis.pooldata import Pool_State, Pool_Reason
 from lenticularis.pooldata import set_pool_state, update_pool_state
 from lenticularis.pooldata import gather_buckets, gather_keys
 from lenticularis.pooldata import tally_manager_expiry
+from lenticularis.pooldata import check_pool_naming
+from lenticularis.tracer import tracer
 from lenticularis.utility import ERROR_EXIT_BADCONF, ERROR_EXIT_FORK
 from lenticularis.utility import generate_access_key
 from lenticularis.utility import generate_secret_key
 from lenticularis.utility import copy_minimal_environ, host_port
 from lenticularis.utility import uniform_distribution_jitter
 from lenticularis.utility import wait_line_on_stdout
+from lenticularis.utility import Phase_Timer
 from lenticularis.utility import rephrase_exception_message
 from lenticularis.utility import logger, openlog
 from lenticularis.utility import tracing
@@ -66,6 +72,17 @@ _minio_response_failure = "Unable to initialize backend"
 _minio_response_port_capability = "Insufficient permissions to use specified port"
 # _minio_response_X1 = "mkdir /XXX/.minio.sys: permission denied"
 
+# Commands run via sudo to make and remove cache directories.  They
+# need to be permitted in sudoers.
+
+_bin_mkdir = "/usr/bin/mkdir"
+_bin_rm = "/usr/bin/rm"
+
+# Interval (in seconds) of sweeping cache directories of deleted pools.
+
+_cache_sweep_interval = 3600
+
+
 def _read_stream(s):
     """Reads a stream while some is available.  It returns a pair of the
     readout and the state of a stream after reading, true on EOF.  It
@@ -101,6 +118,36 @@ def _json_loads_no_errors(s):
     pass
 
 
+# Metrics of a MinIO disk cache (in the Prometheus format) mapped to
+# the keys of a cache statistics record.
+
+_cache_metrics = {
+    "minio_cache_hits_total": "hits",
+    "minio_cache_missed_total": "misses",
+    "minio_cache_sent_bytes": "sent_bytes",
+    "minio_cache_used_bytes": "used_bytes",
+    "minio_cache_total_bytes": "total_bytes",
+}
+
+
+def _parse_cache_metrics(text):
+    """Sums values of cache metrics in the Prometheus text format."""
+    stats = {k: 0 for k in _cache_metrics.values()}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        name = line.split("{", 1)[0].split(" ", 1)[0]
+        k = _cache_metrics.get(name)
+        if k is None:
+            continue
+        try:
+            stats[k] += int(float(line.rsplit(" ", 1)[1]))
+        except (IndexError, ValueError):
+            pass
+        pass
+    return stats
+
+
 def _diagnose_minio_message(s):
     """Diagnoses messages returned at a MinIO start.  It returns 0 on a
     successful run, EAGAIN on lacking expected messages, EADDRINUSE on
@@ -159,9 +206,11 @@ class Manager():
     with expiry, which protects the activity of a manager.
     """
 
-    def __init__(self, pool_id, args, mux_conf, redis):
+    def __init__(self, pool_id, args, mux_conf, redis, phases):
         self._verbose = False
         self._alarm_section = None
+        self._phases = phases
+        self._phases_recorded = False
 
         self._pool_id = pool_id
         self._mux_host = args.host
@@ -187,12 +236,28 @@ class Manager():
                                                     self._heartbeat_interval,
                                                     self._heartbeat_timeout)
 
+        # A MinIO disk cache is optional.  A cache directory of a pool
+        # is made under the cache directory.
+
+        self._cache_directory = ctl_param.get("minio_cache_directory")
+        self._cache_quota = int(ctl_param.get("minio_cache_quota", 80))
+        self._cache_after = int(ctl_param.get("minio_cache_after", 3))
+        self._cache_watermark_low = int(
+            ctl_param.get("minio_cache_watermark_low", 70))
+        self._cache_watermark_high = int(
+            ctl_param.get("minio_cache_watermark_high", 90))
+        self._cache_enabled = False
+
         minio_param = mux_conf["minio"]
         self._bin_minio = minio_param["minio"]
         self._bin_mc = minio_param["mc"]
 
         # self.tables = get_table(mux_conf["redis"])
         self._tables = get_table(redis)
+        if tracer.enabled():
+            self._tables.trace_databases(tracer)
+            pass
+        self._startup_span = None
         pass
 
     def _sigalrm(self, n, stackframe):
@@ -221,6 +286,29 @@ class Manager():
         mns = self._tables.list_minio_procs(None)
         return [int(m["minio_ep"].split(":")[1]) for (pid, m) in mns]
 
+    def _record_startup_phases(self):
+        """Places the phases of a start-up for a Mux.  It is done once,
+        before telling a spawner or at a failure to start.
+        """
+        if self._phases_recorded:
+            return
+        self._phases_recorded = True
+        if self._startup_span is not None:
+            self._startup_span.__exit__(None, None, None)
+            pass
+        pool_id = self._pool_id
+        record = {"start": self._phases.start,
+                  "phases": self._phases.phases}
+        try:
+            self._tables.set_startup_phases(pool_id, record)
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.warning(f"Manager (pool={pool_id})"
+                           f" Recording startup phases failed (ignored):"
+                           f" exception=({m})")
+            pass
+        pass
+
     def _tell_spawner_minio_starts(self):
         # Note that a closure of stdout is not detected at the reader side.
         sys.stdout.write(f"{self._minio_ep}\n")
@@ -295,10 +383,16 @@ class Manager():
             return False
         self._minio_manager = ma1
 
+        # A span of a start-up ends at telling a spawner.
+
+        self._startup_span = tracer.trace("manager.start-minio",
+                                          tracing.get(None), pool=pool_id)
+        self._startup_span.__enter__()
         try:
             self._deregister_minio_process(clean_stale_record=True)
             ok = self._manage_minio()
         finally:
+            self._record_startup_phases()
             ma2 = tables.get_manager(pool_id)
             if ma2 == self._minio_manager:
                 tables.delete_manager(pool_id)
@@ -340,12 +434,19 @@ class Manager():
         self._env_minio["MINIO_ROOT_PASSWORD"] = self._minio_root_password
         self._env_minio["MINIO_BROWSER"] = "off"
 
-        # self._env_minio["MINIO_CACHE_DRIVES"] = f"/tmp/{self._pool_id}"
-        # self._env_minio["MINIO_CACHE_EXCLUDE"] = ""
-        # self._env_minio["MINIO_CACHE_QUOTA"] = "80"
-        # self._env_minio["MINIO_CACHE_AFTER"] = "3"
-        # self._env_minio["MINIO_CACHE_WATERMARK_LOW"] = "70"
-        # self._env_minio["MINIO_CACHE_WATERMARK_HIGH"] = "90"
+        cache = self._prepare_cache_directory(desc, user_id, group_id)
+        self._cache_enabled = (cache is not None)
+        if cache is not None:
+            self._env_minio["MINIO_CACHE_DRIVES"] = cache
+            self._env_minio["MINIO_CACHE_QUOTA"] = f"{self._cache_quota}"
+            self._env_minio["MINIO_CACHE_AFTER"] = f"{self._cache_after}"
+            self._env_minio["MINIO_CACHE_WATERMARK_LOW"] = (
+                f"{self._cache_watermark_low}")
+            self._env_minio["MINIO_CACHE_WATERMARK_HIGH"] = (
+                f"{self._cache_watermark_high}")
+            # Cache statistics are taken from the metrics of MinIO.
+            self._env_minio["MINIO_PROMETHEUS_AUTH_TYPE"] = "public"
+            pass
 
         # (poolstate, _, _) = tables.get_pool_state(self._pool_id)
         # assert poolstate in {Pool_State.INITIAL, Pool_State.READY}
@@ -360,10 +461,13 @@ class Manager():
             logger.debug(f"Manager (pool={pool_id}) tries to start MinIO:"
                          f" ports={ports}")
             pass
+        self._phases.mark("prepare")
         (p, continuable) = (None, True)
         for port in ports:
-            (p, continuable) = self._try_start_minio(port, user_id, group_id,
-                                                     directory)
+            with tracer.span("manager.exec-minio", port=port):
+                (p, continuable) = self._try_start_minio(port, user_id,
+                                                         group_id, directory)
+                pass
             if p is not None:
                 break
             if not continuable:
@@ -385,6 +489,124 @@ class Manager():
             pass
         return True
 
+    def _run_as_user(self, user, group, cmd):
+        """Runs a command as a user via sudo.  It returns true on success."""
+        pool_id = self._pool_id
+        gg = ["-g", group] if group is not None else []
+        cmd = [self._bin_sudo, "-n", "-u", user, *gg, *cmd]
+        try:
+            p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=PIPE)
+            (_, errs) = p.communicate(timeout=self._mc_timeout)
+            if p.returncode != 0:
+                logger.error(f"Manager (pool={pool_id}) Command failed:"
+                             f" command=({cmd});"
+                             f" stderr=({str(errs, 'latin-1')})")
+                return False
+            return True
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.error(f"Manager (pool={pool_id}) Command failed:"
+                         f" command=({cmd}); exception=({m})")
+            return False
+        pass
+
+    def _prepare_cache_directory(self, desc, user, group):
+        """Makes a cache directory of a pool, and returns its path.  It
+        returns None when a cache is not enabled for a pool, or when
+        the cache filesystem is filled over the high watermark.  A
+        directory is made by the owner of a pool (as MinIO runs), and
+        it is removed when a pool opts out.  Directories of deleted
+        pools are removed in heartbeating.
+        """
+        if self._cache_directory is None:
+            return None
+        pool_id = self._pool_id
+        path = os.path.join(self._cache_directory, pool_id)
+        if not desc.get("minio_cache", False):
+            if os.path.isdir(path):
+                self._run_as_user(user, group, [_bin_rm, "-rf", path])
+                pass
+            return None
+        try:
+            usage = shutil.disk_usage(self._cache_directory)
+        except OSError as e:
+            m = rephrase_exception_message(e)
+            logger.error(f"Manager (pool={pool_id}) Cache directory is not"
+                         f" accessible: exception=({m})")
+            return None
+        if (usage.used * 100 >= usage.total * self._cache_watermark_high
+            and not os.path.isdir(path)):
+            logger.warning(f"Manager (pool={pool_id}) Cache filesystem is"
+                           f" full, MinIO runs without a cache:"
+                           f" used={usage.used}, total={usage.total}")
+            return None
+        ok = self._run_as_user(user, group,
+                               [_bin_mkdir, "-p", "-m", "700", path])
+        return path if ok else None
+
+    def _check_cache_sweep(self):
+        """Sweeps cache directories at a long interval.  Each Manager does
+        it, but it is cheap when there is nothing to remove.
+        """
+        if self._cache_directory is None:
+            return
+        now = int(time.time())
+        if self._last_sweep_ts + _cache_sweep_interval < now:
+            self._last_sweep_ts = now
+            self._sweep_cache_directories()
+            pass
+        pass
+
+    def _sweep_cache_directories(self):
+        """Removes cache directories of the pools which do not exist.  It
+        only touches entries named as pool-ids which are directories
+        (not symlinks) owned by non-root users, because the cache
+        directory is world-writable.
+        """
+        pool_id = self._pool_id
+        try:
+            names = os.listdir(self._cache_directory)
+        except OSError:
+            return
+        for name in names:
+            if not check_pool_naming(name) or name == pool_id:
+                continue
+            path = os.path.join(self._cache_directory, name)
+            try:
+                st = os.lstat(path)
+                if not stat.S_ISDIR(st.st_mode) or st.st_uid == 0:
+                    continue
+                owner = pwd.getpwuid(st.st_uid).pw_name
+            except (OSError, KeyError):
+                continue
+            if self._tables.get_pool(name) is not None:
+                continue
+            logger.info(f"Manager (pool={pool_id}) Removing a cache"
+                        f" directory of a deleted pool: {path}")
+            self._run_as_user(owner, None, [_bin_rm, "-rf", path])
+            pass
+        pass
+
+    def _record_cache_stats(self):
+        """Takes cache statistics from the metrics of MinIO and stores them
+        in Redis.  Failures are ignored.
+        """
+        pool_id = self._pool_id
+        url = f"http://{self._minio_ep}/minio/v2/metrics/cluster"
+        try:
+            res = urlopen(url, timeout=self._heartbeat_timeout)
+            text = str(res.read(), "utf-8")
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.debug(f"Manager (pool={pool_id}) Getting MinIO metrics"
+                         f" failed: exception=({m})")
+            return
+        stats = _parse_cache_metrics(text)
+        stats["modification_time"] = int(time.time())
+        self._tables.set_cache_stats(pool_id, stats,
+                                     3 * self._heartbeat_interval)
+        pass
+
     def _try_start_minio(self, port, user, group, directory):
         pool_id = self._pool_id
         tables = self._tables
@@ -399,7 +621,9 @@ class Manager():
             logger.debug(f"Manager (pool={pool_id}) starting MinIO: {cmd}")
             p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=PIPE,
                       env=self._env_minio)
+            self._phases.mark("minio-exec")
             (ok, continuable) = self._wait_for_minio_to_come_up(p)
+            self._phases.mark("minio-wait")
             self._set_alarm(0, None)
             if ok:
                 logger.debug(f"Manager (pool={pool_id}) MinIO started.")
@@ -502,13 +726,16 @@ class Manager():
         assert state in {Pool_State.INITIAL, Pool_State.READY}
         try:
             if (state in {Pool_State.INITIAL} or self._minio_setup_at_start):
-                self._setup_minio(p)
+                with tracer.span("manager.setup-minio"):
+                    self._setup_minio(p)
+                    pass
                 pass
             self._register_minio_process(p.pid)
         except Exception:
             self._stop_minio(p)
             raise
         finally:
+            self._record_startup_phases()
             self._tell_spawner_minio_starts()
             pass
 
@@ -526,12 +753,18 @@ class Manager():
         tables = self._tables
         with self._mc.mc_alias_set(self._minio_root_user,
                                    self._minio_root_password):
+            self._phases.mark("mc-alias")
             try:
                 self._set_alarm(self._minio_setup_timeout, "setup-minio")
                 bkts = gather_buckets(tables, pool_id)
                 self._mc.setup_minio_on_buckets(bkts)
-                keys = gather_keys(tables, pool_id)
+                self._phases.mark("setup-buckets")
+                # Expired keys are left to be removed in MinIO.
+                now = int(time.time())
+                keys = [k for k in gather_keys(tables, pool_id)
+                        if k["expiration_time"] >= now]
                 self._mc.setup_minio_on_secrets(keys)
+                self._phases.mark("setup-secrets")
                 self._set_alarm(0, None)
             except Alarmed as e:
                 self._set_alarm(0, None)
@@ -568,6 +801,10 @@ class Manager():
         try:
             self._last_check_ts = 0
             self._last_access_ts = 0
+            # Delay the first sweep randomly to spread it among pools.
+            self._last_sweep_ts = (int(time.time())
+                                   - int(random.random()
+                                         * _cache_sweep_interval))
             while True:
                 jitter = uniform_distribution_jitter()
                 timeo = self._heartbeat_interval + jitter
@@ -597,6 +834,7 @@ class Manager():
                     self._check_pool_lifetime()
                     self._check_record_expiry()
                     self._check_minio_health()
+                    self._check_cache_sweep()
                     pass
                 pass
         except Termination as e:
@@ -624,6 +862,7 @@ class Manager():
         self._tables.set_minio_proc(self._pool_id, self._minio_proc)
         self._tables.set_minio_ep(self._pool_id, self._minio_ep)
         self._check_record_expiry()
+        self._phases.mark("register")
         pass
 
     def _check_record_expiry(self):
@@ -764,8 +1003,11 @@ class Manager():
         pool_id = self._pool_id
         tables = self._tables
         now = int(time.time())
-        # Check the status of a pool.
-        (state, reason) = update_pool_state(tables, pool_id)
+        # Check the status of a pool.  Transitions are made where the
+        # conditions change, and it just reads the state.
+        (state, reason, _) = tables.get_pool_state(pool_id)
+        if state is None:
+            raise Termination(Pool_Reason.POOL_REMOVED)
         if not state in {Pool_State.INITIAL, Pool_State.READY}:
             raise Termination(reason)
         # Check the lifetime is expired.
@@ -790,6 +1032,9 @@ class Manager():
         status = self._heartbeat_minio()
         if (status == 200):
             self._heartbeat_misses = 0
+            if self._cache_enabled:
+                self._record_cache_stats()
+                pass
         else:
             self._heartbeat_misses += 1
             pass
@@ -853,6 +1098,7 @@ class Manager():
 
 
 def main():
+    phases = Phase_Timer()
     parser = argparse.ArgumentParser()
     parser.add_argument("host")
     parser.add_argument("port")
@@ -891,7 +1137,10 @@ def main():
         pass
 
     tracing.set(args.traceid)
-    openlog(mux_conf["log_file"], **mux_conf["log_syslog"])
+    openlog(mux_conf["log_file"], **mux_conf["log_syslog"],
+            queue_size=mux_conf.get("log_queue_size"),
+            access_format=mux_conf.get("log_access_format"))
+    phases.mark("read-conf")
 
     try:
         pid = os.fork()
@@ -919,7 +1168,9 @@ def main():
                      f" {os.strerror(e.errno)}")
         pass
 
-    manager = Manager(pool_id, args, mux_conf, redis)
+    tracer.configure(mux_conf.get("tracing"), "lens3-manager")
+    manager = Manager(pool_id, args, mux_conf, redis, phases)
+    phases.mark("connect-redis")
     ok = False
     try:
         ok = manager.manager_main()
@@ -37,6 +37,7 @@ import tempfile
 import json
 from subprocess import Popen, DEVNULL, PIPE
 from lenticularis.pooldata import Api_Error
+from lenticularis.tracer import tracer
 from lenticularis.utility import remove_trailing_slash
 from lenticularis.utility import rephrase_exception_message
 from lenticularis.utility import logger
@@ -297,6 +298,13 @@ class Mc():
         return vv
 
     def _execute_cmd(self, name, args):
+        with tracer.span(f"mc.{name}") as span:
+            vv = self._run_mc_command(name, args)
+            span.set_tag("ok", vv[0])
+            return vv
+        pass
+
+    def _run_mc_command(self, name, args):
         # (Currently, it does not check the exit code of MC command.)
         assert self._alias is not None and self._config_dir is not None
         cmd = ([self.mc, f"--config-dir={self._config_dir.name}", "--json"]
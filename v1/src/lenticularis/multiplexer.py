@@ -3,7 +3,10 @@
 # Copyright (c) 2022-2023 RIKEN R-CCS
 # SPDX-License-Identifier: BSD-2-Clause
 
+import collections
 import errno
+import os
+import threading
 import time
 import random
 import posixpath
@@ -18,14 +21,29 @@ from lenticularis.pooldata import parse_s3_auth
 from lenticularis.pooldata import ensure_bucket_policy
 from lenticularis.pooldata import ensure_user_is_authorized
 from lenticularis.pooldata import ensure_mux_is_running
-from lenticularis.pooldata import ensure_pool_state
+from lenticularis.pooldata import update_pool_state
+from lenticularis.pooldata import check_pool_state
 from lenticularis.pooldata import ensure_secret_owner
 from lenticularis.pooldata import tally_manager_expiry
+from lenticularis.pooldata import set_record_validation
+from lenticularis.objcache import Object_Cache, make_cached_object
+from lenticularis.objcache import respond_from_cache
+from lenticularis.ratelimit import Rate_Limiter, slow_down_message
+from lenticularis.shaping import Bandwidth_Shaper
+from lenticularis.shaping import Throttled_Input, Throttled_Output
+from lenticularis.sigv4 import Signing_Key_Cache, verify_signature
+from lenticularis.tarpit import make_penalty_tracker
+from lenticularis.tracer import tracer
+from lenticularis.profiler import PROFILE_PATH
+from lenticularis.profiler import check_profile_request, sample_stacks
 from lenticularis.utility import host_port
 from lenticularis.utility import get_ip_addresses
+from lenticularis.utility import configure_resolver
+from lenticularis.utility import take_resolver_metrics
 from lenticularis.utility import make_typical_ip_address
 from lenticularis.utility import rephrase_exception_message
 from lenticularis.utility import log_access
+from lenticularis.utility import Phase_Timer
 from lenticularis.utility import logger
 from lenticularis.utility import tracing
 
@@ -72,6 +90,14 @@ def _check_url_error_is_connection_errors(x):
         return False
 
 
+class _Credential_Error(Api_Error):
+    """An Api_Error by a rejected access-key or signature.  Only this
+    error penalizes a client.
+    """
+
+    pass
+
+
 def _get_pool_of_probe_key(keydesc, access_synopsis):
     """Checks a key is a probe-key and returns a pool-id for which it is
     created.
@@ -100,6 +126,138 @@ def _pick_bucket_in_path(path, access_synopsis):
     return bucket
 
 
+class _Negative_Cache():
+    """A bounded LRU set of names known not to exist, such as buckets and
+    access-keys.  An entry expires after a short time.  Entries are
+    also removed by invalidation messages when names are created.
+    """
+
+    def __init__(self, size, ttl):
+        self._size = size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        pass
+
+    def contains(self, key):
+        if self._size == 0:
+            return False
+        with self._lock:
+            expiry = self._entries.get(key)
+            if expiry is None:
+                return False
+            if expiry < time.monotonic():
+                del self._entries[key]
+                return False
+            self._entries.move_to_end(key)
+            return True
+        pass
+
+    def add(self, key):
+        if self._size == 0:
+            return
+        with self._lock:
+            self._entries[key] = time.monotonic() + self._ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+                pass
+            pass
+        pass
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            pass
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            pass
+        pass
+
+    pass
+
+
+class _Pool_State_Cache():
+    """A cache of pool states.  An entry is dropped by an invalidation
+    message at a change of a state, which carries a new version.  A
+    state read concurrently with a change is not stored, when its
+    version is older than the one in the message.  An entry expires
+    after a while to cover lost messages.  A version told by a message
+    is kept for the same while, since it only matters to a read that
+    races with a change.  Expired entries and versions are pruned at
+    most once in the while.
+    """
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # A pool-id maps to a pair of a record and a fetched time.
+        self._entries = {}
+        # A pool-id maps to a pair of a version told by a message and
+        # a received time.
+        self._versions = {}
+        self._pruned = time.monotonic()
+        pass
+
+    def get(self, tables, pool_id):
+        """Returns a pool state record, or None if it does not exist."""
+        now = time.monotonic()
+        with self._lock:
+            e = self._entries.get(pool_id)
+            if e is not None and now < e[1] + self._ttl:
+                return e[0]
+            pass
+        record = tables.get_pool_state_record(pool_id)
+        if record is None:
+            return None
+        with self._lock:
+            version = record.get("version") or 0
+            (floor, _) = self._versions.get(pool_id, (0, now))
+            if version >= floor:
+                self._entries[pool_id] = (record, now)
+                pass
+            self._prune(now)
+            pass
+        return record
+
+    def invalidate(self, pool_id, version):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(pool_id, None)
+            (floor, _) = self._versions.get(pool_id, (0, now))
+            if version > floor:
+                self._versions[pool_id] = (version, now)
+                pass
+            self._prune(now)
+            pass
+        pass
+
+    def _prune(self, now):
+        """Drops expired entries and versions.  It is called in the lock.
+        """
+        if now < self._pruned + self._ttl:
+            return
+        self._pruned = now
+        limit = now - self._ttl
+        self._entries = {k: e for (k, e) in self._entries.items()
+                         if e[1] > limit}
+        self._versions = {k: e for (k, e) in self._versions.items()
+                          if e[1] > limit}
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            pass
+        pass
+
+    pass
+
+
 class Multiplexer():
     """Mux.  It forwards requests to MinIO."""
 
@@ -116,6 +274,8 @@ class Multiplexer():
         self._mux_version = "v1.2"
 
         mux_param = mux_conf["multiplexer"]
+        configure_resolver(float(mux_param.get("dns_cache_ttl", 300)),
+                           float(mux_param.get("dns_negative_ttl", 30)))
         self._front_host = mux_param["front_host"].lower()
         self._front_host_ip = get_ip_addresses(self._front_host)[0]
         proxies = mux_param["trusted_proxies"]
@@ -127,8 +287,22 @@ class Multiplexer():
 
         self._forwarding_timeout = int(mux_param["forwarding_timeout"])
         self._probe_access_timeout = int(mux_param["probe_access_timeout"])
-        self._bad_response_delay = int(mux_param["bad_response_delay"])
+        self._tarpit = make_penalty_tracker(mux_param)
+        self._verify_signature = mux_param.get("verify_signature", False)
+        self._clock_skew = float(mux_param.get("signature_clock_skew", 900))
+        self._signing_keys = Signing_Key_Cache()
+        self._rate_limiter = Rate_Limiter(mux_param)
+        nworkers = int(mux_conf["gunicorn"].get("workers", 1))
+        self._shaper = Bandwidth_Shaper(mux_param, nworkers)
+        self._metrics_interval = int(mux_param.get("metrics_interval", 60))
+        self._object_cache = Object_Cache(mux_param)
+        self._unknown_names = _Negative_Cache(
+            int(mux_param.get("negative_cache_size", 10000)),
+            float(mux_param.get("negative_cache_ttl", 30)))
         self._busy_suspension_time = int(mux_param["busy_suspension_time"])
+        self._pool_states = _Pool_State_Cache(
+            float(mux_param.get("pool_state_cache_ttl", 60)))
+        set_record_validation(mux_param.get("record_validation", "all"))
 
         ctl_param = mux_conf["minio_manager"]
         self._minio_start_timeout = int(ctl_param["minio_start_timeout"])
@@ -142,7 +316,11 @@ class Multiplexer():
                                                     self._heartbeat_interval,
                                                     self._heartbeat_timeout)
 
-        self._mux_addrs = self._list_mux_ip_addresses()
+        # Addresses of Mux'es are updated in periodic work, by the
+        # resolver cache.  _mux_addrs is replaced as a whole.
+        self._mux_addrs = set()
+        self._mux_addrs_checked = 0
+        self._update_mux_addresses(True)
         # self.scheduler = Scheduler(tables)
         pass
 
@@ -153,14 +331,51 @@ class Multiplexer():
 
     def __call__(self, environ, start_response):
         # (MEMO: environ is a dict, and start_response is a method).
+        if environ.get("PATH_INFO") == PROFILE_PATH:
+            return self._serve_profile(environ, start_response)
+        traceid = environ.get("HTTP_X_TRACEID")
+        with tracer.trace("mux.request", traceid, kind="SERVER",
+                          method=environ.get("REQUEST_METHOD"),
+                          url=environ.get("RAW_URI")):
+            return self._call_traced(environ, start_response)
+        pass
+
+    def _call_traced(self, environ, start_response):
+        # Penalties are on a client address and an access-key.  A
+        # penalized client is rejected quickly, instead of delaying a
+        # response and holding a worker thread.  Penalties are given
+        # only on rejections of credentials (_Credential_Error), not
+        # on such as missing buckets, so that errors by ordinary
+        # clients behind a shared address do not block the address.
+        # Accesses from the front-host address are by Api (probes),
+        # and they are penalized only on the access-key.  Otherwise,
+        # a failed probe would block Api for all users.
+        client_addr = environ.get("HTTP_X_REAL_IP")
+        access_key = parse_s3_auth(environ.get("HTTP_AUTHORIZATION"))
+        by_api = (client_addr == self._front_host_ip)
+        penalty_keys = [("addr", None if by_api else client_addr),
+                        ("key", access_key)]
+        penalty_keys = [k for k in penalty_keys if k[1] is not None]
+        penalty = max((self._tarpit.remaining(k) for k in penalty_keys),
+                      default=0)
+        if penalty > 0:
+            tracer.current_span().set_tag("status", 503)
+            log_access("503", client_addr, _fake_user_id(access_key),
+                       environ.get("REQUEST_METHOD"), environ.get("RAW_URI"))
+            start_response("503", [("Retry-After", f"{int(penalty) + 1}")])
+            return []
         try:
             return self._process_request(environ, start_response)
         except Api_Error as e:
+            tracer.current_span().set_tag("status", e.code)
             logger.error(f"Mux ({self._mux_host}) Work failed:"
                          f" exception=({e})",
                          exc_info=self._verbose)
-            # Delay returning a response for a while.
-            time.sleep(self._bad_response_delay)
+            if isinstance(e, _Credential_Error):
+                for k in penalty_keys:
+                    self._tarpit.penalize(k)
+                    pass
+                pass
             status = f"{e.code}"
             start_response(status, [])
             return []
@@ -172,6 +387,38 @@ class Multiplexer():
         start_response("500", [])
         return []
 
+    def _serve_profile(self, environ, start_response):
+        """Runs a sampling profiler on this worker for seconds given by a
+        query, and returns stacks in the collapsed format.  See
+        profiler.py.
+        """
+        peer_addr = environ.get("REMOTE_ADDR")
+        forwarded = (environ.get("HTTP_X_REAL_IP") is not None
+                     or environ.get("HTTP_X_FORWARDED_FOR") is not None)
+        token = environ.get("HTTP_X_LENS3_PROFILE_TOKEN")
+        if not check_profile_request(self.tables, peer_addr, forwarded,
+                                     token):
+            logger.error(f"Mux ({self._mux_host}) Bad profiling request:"
+                         f" remote={peer_addr}")
+            start_response("403", [])
+            return []
+        q = urllib.parse.parse_qs(environ.get("QUERY_STRING", ""))
+        try:
+            seconds = float(q.get("seconds", ["10"])[0])
+        except ValueError:
+            start_response("400", [])
+            return []
+        logger.info(f"Mux ({self._mux_host}) Profiling started:"
+                    f" pid={os.getpid()}, seconds={seconds}")
+        stacks = sample_stacks(seconds)
+        if stacks is None:
+            start_response("409", [])
+            return []
+        body = stacks.encode()
+        start_response("200", [("Content-Type", "text/plain"),
+                               ("Content-Length", f"{len(body)}")])
+        return [body]
+
     def periodic_work(self):
         interval = self._periodic_work_interval
         logger.debug(f"Mux ({self._mux_host}) periodic work started:"
@@ -181,6 +428,7 @@ class Multiplexer():
         while True:
             try:
                 self._register_mux()
+                self._update_mux_addresses(True)
             except Exception as e:
                 m = rephrase_exception_message(e)
                 logger.error(f"Mux ({self._mux_host}) periodic work failed:"
@@ -191,9 +439,108 @@ class Multiplexer():
             pass
         pass
 
-    def _list_mux_ip_addresses(self):
+    def reconcile_rate_limits(self):
+        """Exchanges counts of requests for rate limiting.  It is run in a
+        thread.
+        """
+        interval = self._rate_limiter.sync_interval
+        while True:
+            try:
+                self._rate_limiter.reconcile(self.tables)
+            except Exception as e:
+                m = rephrase_exception_message(e)
+                logger.error(f"Mux ({self._mux_host}) Reconciling rate"
+                             f" limits failed: exception=({m})")
+                pass
+            time.sleep(interval)
+            pass
+        pass
+
+    def publish_metrics(self):
+        """Stores metrics of this worker in Redis periodically.  It is run
+        in a thread.
+        """
+        interval = self._metrics_interval
+        ep = host_port(self._mux_host, self._mux_port)
+        worker = f"{ep}:{os.getpid()}"
+        while True:
+            time.sleep(interval)
+            try:
+                record = {
+                    "mux": ep,
+                    "pid": os.getpid(),
+                    "interval": interval,
+                    "time": int(time.time()),
+                    "pools": self._shaper.take_metrics(),
+                    "object_cache": self._object_cache.take_stats(),
+                    "dns": take_resolver_metrics(),
+                }
+                self.tables.set_mux_metrics(worker, record, 3 * interval)
+            except Exception as e:
+                m = rephrase_exception_message(e)
+                logger.error(f"Mux ({self._mux_host}) Publishing metrics"
+                             f" failed: exception=({m})")
+                pass
+            pass
+        pass
+
+    def listen_invalidation(self):
+        """Receives invalidation messages and drops the entries from the
+        negative cache.  It is run in a thread.  It clears the cache
+        at (re)subscribing, since messages may be missed while
+        disconnected.
+        """
+        while True:
+            try:
+                p = self.tables.subscribe_invalidation()
+                self._unknown_names.clear()
+                self._pool_states.clear()
+                for m in p.listen():
+                    if m.get("type") != "message":
+                        continue
+                    (kind, _, name) = m["data"].partition(":")
+                    self._unknown_names.discard((kind, name))
+                    if kind == "pool_state":
+                        (pool_id, _, version) = name.partition("/")
+                        self._pool_states.invalidate(pool_id,
+                                                     int(version or 0))
+                    elif kind == "object":
+                        (bucket, _, key) = name.partition("/")
+                        self._object_cache.discard((bucket, key))
+                    elif kind == "bucket":
+                        self._object_cache.discard_bucket(name)
+                        pass
+                    pass
+            except Exception as e:
+                m = rephrase_exception_message(e)
+                logger.error(f"Mux ({self._mux_host}) Listening to"
+                             f" invalidation failed: exception=({m})")
+                self._unknown_names.clear()
+                self._pool_states.clear()
+                time.sleep(10)
+                pass
+            pass
+        pass
+
+    def _update_mux_addresses(self, block):
+        """Updates the addresses of Mux'es.  It does not wait for DNS
+        unless block, and then, hosts not in the resolver cache are
+        added at a later update.
+        """
         muxs = self.tables.list_mux_eps()
-        return {addr for (h, _) in muxs for addr in get_ip_addresses(h)}
+        addrs = set()
+        for (h, _) in muxs:
+            try:
+                addrs.update(get_ip_addresses(h, block))
+            except Exception as e:
+                m = rephrase_exception_message(e)
+                logger.warning(f"Mux ({self._mux_host}) Resolving"
+                               f" a Mux host failed: host={h};"
+                               f" exception=({m})")
+                pass
+            pass
+        self._mux_addrs = addrs
+        pass
 
     def _register_mux(self):
         if self._verbose:
@@ -201,29 +548,40 @@ class Multiplexer():
                          f" (periodically).")
             pass
         ep = host_port(self._mux_host, self._mux_port)
-        ok = self.tables.set_mux_expiry(ep, self._mux_expiry)
-        if ok:
-            return
         now = int(time.time())
         mux_desc = {"host": self._mux_host, "port": self._mux_port,
                     "start_time": self._start_time,
                     "modification_time": now}
-        self.tables.set_mux(ep, mux_desc)
-        self.tables.set_mux_expiry(ep, self._mux_expiry)
+        self.tables.register_mux(ep, mux_desc, self._mux_expiry)
         pass
 
-    def _awake_suspended_pool(self, pool_id):
-        """Wakes up a suspended pool after a while."""
+    def _check_pool_state(self, pool_id, pooldesc):
+        """Checks a pool accepts accesses by a cached state.  Transitions
+        are made where the conditions change (see update_pool_state()).
+        It makes transitions which are found at an access: a wake-up
+        of a suspended pool after a while, and an expiry of a pool
+        which is not yet swept.  A pool description is optional.
+        """
         tables = self.tables
-        (state1, reason1, ts) = tables.get_pool_state(pool_id)
-        if state1 == Pool_State.SUSPENDED:
-            now = int(time.time())
+        record = self._pool_states.get(tables, pool_id)
+        if record is None:
+            raise Api_Error(403, f"Pool inoperable")
+        state = Pool_State(record["state"])
+        now = int(time.time())
+        if state == Pool_State.SUSPENDED:
+            ts = record["modification_time"]
             if (ts + self._busy_suspension_time) < now:
-                state2 = Pool_State.INITIAL
-                reason2 = Pool_Reason.NORMAL
-                set_pool_state(tables, pool_id, Pool_State.INITIAL, reason2)
+                state = Pool_State.INITIAL
+                reason = Pool_Reason.NORMAL
+                set_pool_state(tables, pool_id, state, reason)
                 pass
             pass
+        elif (pooldesc is not None
+              and state in {Pool_State.INITIAL, Pool_State.READY}
+              and pooldesc["expiration_time"] <= now):
+            (state, _) = update_pool_state(tables, pool_id)
+            pass
+        check_pool_state(pool_id, state, False)
         pass
 
     # def _wrap_res(self, res, environ, headers, sniff=False, sniff_marker=""):
@@ -234,8 +592,12 @@ class Multiplexer():
     #         return file_wrapper(res)
     #     pass
 
-    def _response_output(self, res, environ):
-        """Returns an iterator of a response body."""
+    def _response_output(self, res, environ, flow):
+        """Returns an iterator of a response body.  It is throttled when a
+        flow is given.
+        """
+        if flow is not None:
+            return Throttled_Output(res, flow)
         # The file wrapper can be "wsgiref.util.FileWrapper" or
         # "gunicorn.http.wsgi.FileWrapper".
         file_wrapper = environ["wsgi.file_wrapper"]
@@ -248,9 +610,63 @@ class Multiplexer():
     #         pass
     #     return rinput
 
-    def _request_input(self, environ):
-        """Returns a stream of a request body."""
+    def _store_in_cache(self, cache_key, res, r_headers, q_headers):
+        """Reads a response body of a whole object and stores it in the
+        cache, when it is small.  It returns a cached object or None.
+        """
+        if res.status != 200 or "RANGE" in q_headers:
+            self._object_cache.count(False, 0)
+            return None
+        size = next((v for (k, v) in r_headers
+                     if k.lower() == "content-length"), None)
+        if size is None or not self._object_cache.fits(int(size)):
+            self._object_cache.count(False, 0)
+            return None
+        o = make_cached_object(r_headers, res.read())
+        res.close()
+        self._object_cache.count(False, 0)
+        if o is None:
+            return None
+        self._object_cache.put(cache_key, o)
+        return o
+
+    def _invalidate_object(self, method, path, query):
+        """Drops an object on a modification, and tells the other Mux'es.
+        It drops all objects of a bucket on a bucket-level request to
+        delete objects ("POST /bucket?delete", DeleteObjects), because
+        the keys are only in the request body.
+        """
+        (bucket, _, key) = path.lstrip("/").partition("/")
+        if bucket == "":
+            return
+        if key == "":
+            q = urllib.parse.parse_qs(query, keep_blank_values=True)
+            if not (method == "POST" and "delete" in q):
+                return
+            pass
+        try:
+            if key == "":
+                self._object_cache.discard_bucket(bucket)
+                self.tables.publish_invalidation("bucket", bucket)
+            else:
+                self._object_cache.discard((bucket, key))
+                self.tables.publish_invalidation("object",
+                                                 f"{bucket}/{key}")
+                pass
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.error(f"Mux ({self._mux_host}) Publishing invalidation"
+                         f" failed: exception=({m})")
+            pass
+        pass
+
+    def _request_input(self, environ, flow):
+        """Returns a stream of a request body.  It is throttled when a
+        flow is given.
+        """
         rinput = environ.get("wsgi.input")
+        if flow is not None and rinput is not None:
+            return Throttled_Input(rinput, flow)
         return rinput
 
     def _check_forwarding_host_trusted(self, peer_addr):
@@ -259,10 +675,14 @@ class Multiplexer():
         ip = make_typical_ip_address(peer_addr)
         if (ip in self._trusted_proxies or ip in self._mux_addrs):
             return True
-        self._mux_addrs = self._list_mux_ip_addresses()
-        if ip in self._mux_addrs:
-            return True
-        return False
+        # Check new Mux'es at most once a second, without waiting for
+        # DNS.
+        now = time.monotonic()
+        if now - self._mux_addrs_checked < 1:
+            return False
+        self._mux_addrs_checked = now
+        self._update_mux_addresses(False)
+        return ip in self._mux_addrs
 
     def _start_service(self, pool_id, probing):
         """Runs a MinIO service.  It returns an endpoint or None when starting
@@ -276,6 +696,7 @@ class Multiplexer():
         """
         # CURRENTLY, IT STARTS A SERVICE ON A LOCAL HOST.
 
+        phases = Phase_Timer()
         now = int(time.time())
         ma = {
             "mux_host": self._mux_host,
@@ -290,6 +711,7 @@ class Multiplexer():
 
         # This request wins the role to start a manager.
 
+        phases.mark("take-manager")
         ok = self.tables.set_manager_expiry(pool_id, self._manager_expiry)
         if not ok:
             logger.warning(f"Mux ({self._mux_host}) Setting expiry failed:"
@@ -313,7 +735,10 @@ class Multiplexer():
 
         if ep is None:
             # Run MinIO on a local host.
+            phases.mark("prepare")
+            spawn_start = time.time()
             ep0 = self._spawner.start_spawner(pool_id)
+            self._record_startup(pool_id, phases, spawn_start, ep0)
             return ep0
         else:
             # assert probing == False
@@ -326,6 +751,39 @@ class Multiplexer():
             return None
         pass
 
+    def _record_startup(self, pool_id, phases, spawn_start, ep):
+        """Stores a startup record of a pool.  It merges the phases of a
+        manager into the spawning phase.  The manager part is split
+        into booting (until a manager starts), the manager phases, and
+        handing-over (until a Mux gets the result).
+        """
+        try:
+            phases.mark("spawn")
+            mp = self.tables.take_startup_phases(pool_id)
+            if mp is not None:
+                spawn = phases.phases.pop()
+                boot = max(0, round((mp["start"] - spawn_start) * 1000))
+                inner = sum(ms for (_, ms) in mp["phases"])
+                handover = max(0, spawn[1] - boot - inner)
+                phases.phases += ([["manager-boot", boot]]
+                                  + mp["phases"]
+                                  + [["manager-handover", handover]])
+                pass
+            record = {
+                "mux": host_port(self._mux_host, self._mux_port),
+                "ok": ep is not None,
+                "start_time": int(phases.start),
+                "total": phases.elapsed(),
+                "phases": phases.phases,
+            }
+            self.tables.add_startup_record(pool_id, record)
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.warning(f"Mux ({self._mux_host}) Recording startup failed"
+                           f" (ignored): pool={pool_id}; exception=({m})")
+            pass
+        pass
+
     def _wait_for_service_starts(self, pool_id):
         logger.debug(f"Mux ({self._mux_host}) Waiting for service.")
         limit = (int(time.time()) + self._minio_start_timeout
@@ -397,9 +855,11 @@ class Multiplexer():
 
         access_synopsis = [client_addr, fake_user, request_method, request_url]
 
-        logger.debug(f"Mux ({self._mux_host}) Got a request:"
-                     f" {request_method} {request_url};"
-                     f" remote=({client_addr}), auth=({authorization})")
+        # (Logging in the request path is lazy to skip formatting).
+
+        logger.debug("Mux (%s) Got a request: %s %s; remote=(%s), auth=(%s)",
+                     self._mux_host, request_method, request_url,
+                     client_addr, authorization)
 
         if not self._check_forwarding_host_trusted(peer_addr):
             logger.error(f"Mux ({self._mux_host}) Got a request from"
@@ -408,19 +868,21 @@ class Multiplexer():
             log_access("403", *access_synopsis)
             raise Api_Error(403, f"Bad access from remote={client_addr}")
 
+        cache_key = None
         if path == "/":
             # Access to "/" is only allowed by a probe-access from Api.
             if access_key is None:
                 log_access("401", *access_synopsis)
-                raise Api_Error(401, "Bad access to /: (no access-key)")
+                raise _Credential_Error(401, "Bad access to /:"
+                                        " (no access-key)")
             probe_key = self.tables.get_xid("akey", access_key)
             pool_id = _get_pool_of_probe_key(probe_key, access_synopsis)
             if pool_id is None:
                 log_access("401", *access_synopsis)
-                raise Api_Error(401, "Bad access to /: (not a probe-key)")
+                raise _Credential_Error(401, "Bad access to /:"
+                                        " (not a probe-key)")
             assert probe_key is not None
-            self._awake_suspended_pool(pool_id)
-            ensure_pool_state(self.tables, pool_id, False)
+            self._check_pool_state(pool_id, None)
             if self._verbose:
                 logger.debug(f"Mux ({self._mux_host}) Probe-accessing"
                              f" on pool={pool_id}")
@@ -429,41 +891,92 @@ class Multiplexer():
             try:
                 probe_key = None
                 bucket = _pick_bucket_in_path(path, access_synopsis)
+                # Names known not to exist are rejected without Redis.
+                if (access_key is not None
+                    and self._unknown_names.contains(("akey", access_key))):
+                    raise _Credential_Error(403, f"Non-existing access-key:"
+                                            f" {access_key}")
+                if self._unknown_names.contains(("bucket", bucket)):
+                    raise Api_Error(404, f"Bad URL, no bucket: {bucket}")
                 bucketdesc = self.tables.get_bucket(bucket)
                 if bucketdesc is None:
-                    log_access("404", *access_synopsis)
+                    self._unknown_names.add(("bucket", bucket))
                     raise Api_Error(404, f"Bad URL, no bucket: {bucket}")
                 pool_id = bucketdesc["pool"]
                 pooldesc = self.tables.get_pool(pool_id)
                 assert pooldesc is not None
                 user_id = pooldesc.get("owner_uid")
-                self._awake_suspended_pool(pool_id)
                 ensure_user_is_authorized(self.tables, user_id)
-                ensure_pool_state(self.tables, pool_id, False)
-                ensure_secret_owner(self.tables, access_key, pool_id)
+                self._check_pool_state(pool_id, pooldesc)
+                try:
+                    keydesc = ensure_secret_owner(self.tables, access_key,
+                                                  pool_id)
+                    if self._verify_signature and keydesc is not None:
+                        verify_signature(environ, path_and_query,
+                                         keydesc["secret_key"],
+                                         self._signing_keys,
+                                         self._clock_skew)
+                        pass
+                except Api_Error as e:
+                    if (e.code == 403 and access_key is not None
+                        and self.tables.get_xid("akey", access_key) is None):
+                        self._unknown_names.add(("akey", access_key))
+                        pass
+                    raise _Credential_Error(e.code, *e.args)
                 ensure_bucket_policy(bucket, bucketdesc, access_key)
             except Api_Error as e:
-                logger.debug(f"Mux ({self._mux_host}) Access check failed:"
-                             f" exception=({e})")
+                logger.debug("Mux (%s) Access check failed: exception=(%s)",
+                             self._mux_host, e)
                 log_access(f"{e.code}", *access_synopsis)
                 # Reraise an error with a less-informative message.
                 # raise Api_Error(e.code, failure_message1)
                 raise
+            wait = self._rate_limiter.acquire(access_key, pool_id,
+                                              client_addr,
+                                              pooldesc.get("rate_limit"))
+            if wait > 0:
+                log_access("503", *access_synopsis)
+                tracer.current_span().set_tag("status", 503)
+                body = slow_down_message(path)
+                start_response("503", [("Content-Type", "application/xml"),
+                                       ("Content-Length", f"{len(body)}"),
+                                       ("Retry-After", f"{int(wait) + 1}")])
+                return [body]
+            if not self._object_cache.check_bypass(environ):
+                cache_key = self._object_cache.key_of(
+                    request_method, access_key, bucketdesc, path, u.query)
+                pass
             if self._verbose:
                 logger.debug(f"Mux ({self._mux_host}) Accessing"
                              f" for bucket={path} and pool={pool_id}")
                 pass
             pass
 
+        # Serve an object validated recently without accessing MinIO.
+
+        if cache_key is not None:
+            cached = self._object_cache.get_fresh(cache_key)
+            if cached is not None:
+                (status, r_headers, response) = respond_from_cache(
+                    cached, environ)
+                self._object_cache.count(True, len(cached.body))
+                log_access(status, *access_synopsis)
+                start_response(status, r_headers)
+                return response
+            pass
+
         # SET A TIMESTAMP HERE AS EARLY AS POSSIBLE.  It is not to
         # stop the service during processing a request.
 
         assert pool_id is not None
+        tracer.current_span().set_tag("pool", pool_id)
         self.tables.set_access_timestamp(pool_id)
 
         minio_ep = self.tables.get_minio_ep(pool_id)
         if minio_ep is None:
-            minio_ep = self._start_service(pool_id, True)
+            with tracer.span("mux.start-service", pool=pool_id):
+                minio_ep = self._start_service(pool_id, True)
+                pass
             if minio_ep is None:
                 log_access("503", *access_synopsis)
                 raise Api_Error(503, f"Cannot start MinIO for pool={pool_id}")
@@ -493,9 +1006,22 @@ class Multiplexer():
             q_headers["CONTENT-LENGTH"] = content_length
             pass
 
+        # Validate a cached object by an ETag.  A range is served from
+        # the cached object.
+
+        cached = None
+        if cache_key is not None:
+            cached = self._object_cache.get(cache_key)
+            if cached is not None:
+                q_headers["IF-NONE-MATCH"] = cached.etag
+                q_headers.pop("RANGE", None)
+                pass
+            pass
+
         url = f"http://{minio_ep}{path_and_query}"
 
-        rinput = self._request_input(environ)
+        flow = self._shaper.open_flow(pool_id, pooldesc.get("bandwidth"))
+        rinput = self._request_input(environ, flow)
 
         # logger.error(f"AHO q_headers=({q_headers})")
 
@@ -504,15 +1030,36 @@ class Multiplexer():
         failure_message2 = (f"Mux ({self._mux_host}) urlopen failure:"
                             f" url={url} for {request_method} {request_url};")
         try:
-            res = urlopen(req, timeout=self._forwarding_timeout)
+            with tracer.span("mux.forward", kind="CLIENT", url=url) as span:
+                res = urlopen(req, timeout=self._forwarding_timeout)
+                span.set_tag("status", res.status)
+                pass
             status = f"{res.status}"
             r_headers = res.getheaders()
-            response = self._response_output(res, environ)
+            o = None
+            if cache_key is not None:
+                o = self._store_in_cache(cache_key, res, r_headers,
+                                         q_headers)
+                pass
+            if o is not None:
+                (status, r_headers, response) = respond_from_cache(
+                    o, environ)
+            else:
+                response = self._response_output(res, environ, flow)
+                pass
         except HTTPError as e:
-            logger.error(failure_message2 + f" exception=({e})")
-            status = f"{e.code}"
-            r_headers = [(k, e.headers[k]) for k in e.headers]
-            response = self._response_output(e, environ)
+            if e.code == 304 and cached is not None:
+                e.close()
+                self._object_cache.touch(cached)
+                self._object_cache.count(True, len(cached.body))
+                (status, r_headers, response) = respond_from_cache(
+                    cached, environ)
+            else:
+                logger.error(failure_message2 + f" exception=({e})")
+                status = f"{e.code}"
+                r_headers = [(k, e.headers[k]) for k in e.headers]
+                response = self._response_output(e, environ, flow)
+                pass
         except URLError as e:
             if _check_url_error_is_connection_errors(e):
                 # "Connection refused" etc.
@@ -532,9 +1079,20 @@ class Multiplexer():
             response = []
             pass
 
+        if flow is not None and isinstance(response, list):
+            flow.close()
+            pass
+
+        if (self._object_cache.enabled()
+            and request_method not in {"GET", "HEAD"}):
+            self._invalidate_object(request_method, path,
+                                    environ.get("QUERY_STRING", ""))
+            pass
+
         content_length_downstream = next((v for (k, v) in r_headers
                                           if k.lower() == "content-length"),
                                          None)
+        tracer.current_span().set_tag("status", status)
         log_access(status, *access_synopsis,
                    upstream=content_length,
                    downstream=content_length_downstream)
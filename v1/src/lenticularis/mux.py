@@ -13,6 +13,7 @@ from lenticularis.multiplexer import Multiplexer
 from lenticularis.table import get_table
 from lenticularis.table import read_redis_conf
 from lenticularis.table import get_conf
+from lenticularis.tracer import tracer
 from lenticularis.utility import rephrase_exception_message
 from lenticularis.utility import host_port
 from lenticularis.utility import logger, openlog
@@ -32,10 +33,16 @@ def app():
                          f" exception=({m})\n")
         return None
 
-    openlog(mux_conf["log_file"], **mux_conf["log_syslog"])
+    openlog(mux_conf["log_file"], **mux_conf["log_syslog"],
+            queue_size=mux_conf.get("log_queue_size"),
+            access_format=mux_conf.get("log_access_format"))
     logger.info(f"START Mux ({mux_name or ''}).")
 
     tables = get_table(redis)
+    tracer.configure(mux_conf.get("tracing"), "lens3-mux")
+    if tracer.enabled():
+        tables.trace_databases(tracer)
+        pass
 
     mux_host = mux_conf["multiplexer"]["mux_node_name"]
     if mux_host is None or len(mux_host) == 0:
@@ -52,5 +59,8 @@ def app():
 
     atexit.register((lambda: mux.__del__()))
     threading.Thread(target=mux.periodic_work, daemon=True).start()
+    threading.Thread(target=mux.listen_invalidation, daemon=True).start()
+    threading.Thread(target=mux.reconcile_rate_limits, daemon=True).start()
+    threading.Thread(target=mux.publish_metrics, daemon=True).start()
 
     return mux
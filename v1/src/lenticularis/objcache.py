@@ -0,0 +1,334 @@
+"""An object cache in Lens3-Mux.  It keeps small objects of anonymous
+GET requests on buckets of "public" or "download" policy.  A cached
+object is validated by an ETag with MinIO (If-None-Match), unless it
+was validated recently.  The cache has a memory tier and an optional
+disk tier.  Both tiers are local to a worker process.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Objects are invalidated on PUT/POST/DELETE through a Mux.  Other
+# Mux'es are told by invalidation messages in Redis (see
+# Table.publish_invalidation()), and validation by ETags covers lost
+# messages.  The disk tier keeps objects evicted from the memory tier
+# in files under "object_cache_directory/pid".
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+_cacheable_policies = {"public", "download"}
+
+# Response headers which are not kept in the cache.
+
+_uncached_headers = {
+    "content-length", "content-range", "accept-ranges", "date",
+    "connection", "keep-alive", "transfer-encoding", "x-amz-request-id",
+    "x-amz-id-2"}
+
+# Conditional request headers which bypass the cache.
+
+_bypass_headers = [
+    "HTTP_IF_MATCH", "HTTP_IF_MODIFIED_SINCE", "HTTP_IF_UNMODIFIED_SINCE"]
+
+
+class Cached_Object():
+    """An object in the cache.  Headers are a list of response headers
+    without Content-Length.
+    """
+
+    def __init__(self, etag, headers, body, validated):
+        self.etag = etag
+        self.headers = headers
+        self.body = body
+        self.validated = validated
+        pass
+
+    pass
+
+
+class Object_Cache():
+    """A two-tier LRU cache of objects keyed by (bucket, object-key)."""
+
+    def __init__(self, param):
+        self._memory_size = int(param.get("object_cache_size", 0))
+        self._max_object = int(param.get("object_cache_max_object",
+                                         1024 * 1024))
+        self._fresh_time = float(param.get("object_cache_fresh_time", 0))
+        directory = param.get("object_cache_directory")
+        self._disk_size = int(param.get("object_cache_disk_size", 0))
+        self._directory = None
+        if directory is not None and self._disk_size > 0:
+            self._directory = os.path.join(directory, f"{os.getpid()}")
+            shutil.rmtree(self._directory, ignore_errors=True)
+            os.makedirs(self._directory, exist_ok=True)
+            pass
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self._memory_used = 0
+        # A key maps to a size of a file in the disk tier.
+        self._disk = collections.OrderedDict()
+        self._disk_used = 0
+        self._stats = {"hits": 0, "misses": 0, "validations": 0,
+                       "bytes_saved": 0}
+        pass
+
+    def enabled(self):
+        return self._memory_size > 0
+
+    def key_of(self, method, access_key, bucketdesc, path, query):
+        """Returns a cache key of a request, or None if it is not
+        cacheable.
+        """
+        if (self._memory_size == 0 or method != "GET"
+            or access_key is not None or query != ""
+            or bucketdesc["bkt_policy"] not in _cacheable_policies):
+            return None
+        (bucket, _, key) = path.lstrip("/").partition("/")
+        if key == "":
+            return None
+        return (bucket, key)
+
+    def check_bypass(self, environ):
+        """Checks conditional headers which the cache does not handle."""
+        return any(environ.get(h) is not None for h in _bypass_headers)
+
+    def get(self, key):
+        with self._lock:
+            o = self._memory.get(key)
+            if o is not None:
+                self._memory.move_to_end(key)
+                return o
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+            pass
+        o = self._read_file(key)
+        if o is not None:
+            self.put(key, o)
+            pass
+        return o
+
+    def get_fresh(self, key):
+        """Returns an object if it was validated recently."""
+        if self._fresh_time == 0:
+            return None
+        o = self.get(key)
+        if o is None or time.time() - o.validated > self._fresh_time:
+            return None
+        return o
+
+    def fits(self, size):
+        return size <= self._max_object
+
+    def put(self, key, o):
+        size = len(o.body)
+        if not self.fits(size):
+            return
+        evicted = []
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= len(old.body)
+                pass
+            self._memory[key] = o
+            self._memory_used += size
+            while self._memory_used > self._memory_size:
+                (k, v) = self._memory.popitem(last=False)
+                self._memory_used -= len(v.body)
+                evicted.append((k, v))
+                pass
+            pass
+        for (k, v) in evicted:
+            self._write_file(k, v)
+            pass
+        pass
+
+    def touch(self, o):
+        """Records a validation of an object."""
+        o.validated = time.time()
+        with self._lock:
+            self._stats["validations"] += 1
+            pass
+        pass
+
+    def discard(self, key):
+        with self._lock:
+            o = self._memory.pop(key, None)
+            if o is not None:
+                self._memory_used -= len(o.body)
+                pass
+            pass
+        self._remove_file(key)
+        pass
+
+    def discard_bucket(self, bucket):
+        with self._lock:
+            keys = ([k for k in self._memory if k[0] == bucket]
+                    + [k for k in self._disk if k[0] == bucket])
+            pass
+        for k in keys:
+            self.discard(k)
+            pass
+        pass
+
+    def count(self, hit, size):
+        with self._lock:
+            if hit:
+                self._stats["hits"] += 1
+                self._stats["bytes_saved"] += size
+            else:
+                self._stats["misses"] += 1
+                pass
+            pass
+        pass
+
+    def take_stats(self):
+        """Returns statistics of hits and misses, and resets them."""
+        with self._lock:
+            s = dict(self._stats)
+            for k in self._stats:
+                self._stats[k] = 0
+                pass
+            s["memory_used"] = self._memory_used
+            s["disk_used"] = self._disk_used
+            pass
+        return s
+
+    def _file_path(self, key):
+        h = hashlib.sha256(f"{key[0]}/{key[1]}".encode()).hexdigest()
+        return os.path.join(self._directory, h)
+
+    def _write_file(self, key, o):
+        if self._directory is None or len(o.body) > self._disk_size:
+            return
+        path = self._file_path(key)
+        meta = json.dumps({"etag": o.etag, "headers": o.headers,
+                           "validated": o.validated}).encode()
+        try:
+            with open(path, "wb") as f:
+                f.write(len(meta).to_bytes(4, "big"))
+                f.write(meta)
+                f.write(o.body)
+                pass
+        except OSError:
+            return
+        removals = []
+        with self._lock:
+            size = self._disk.pop(key, 0)
+            self._disk_used -= size
+            self._disk[key] = len(o.body)
+            self._disk_used += len(o.body)
+            while self._disk_used > self._disk_size:
+                (k, v) = self._disk.popitem(last=False)
+                self._disk_used -= v
+                removals.append(k)
+                pass
+            pass
+        for k in removals:
+            self._unlink(k)
+            pass
+        pass
+
+    def _read_file(self, key):
+        try:
+            with open(self._file_path(key), "rb") as f:
+                n = int.from_bytes(f.read(4), "big")
+                meta = json.loads(f.read(n))
+                body = f.read()
+                pass
+        except (OSError, ValueError):
+            return None
+        return Cached_Object(meta["etag"], [tuple(h) for h in meta["headers"]],
+                             body, meta["validated"])
+
+    def _remove_file(self, key):
+        if self._directory is None:
+            return
+        with self._lock:
+            size = self._disk.pop(key, None)
+            if size is None:
+                return
+            self._disk_used -= size
+            pass
+        self._unlink(key)
+        pass
+
+    def _unlink(self, key):
+        try:
+            os.unlink(self._file_path(key))
+        except OSError:
+            pass
+        pass
+
+    pass
+
+
+def make_cached_object(headers, body):
+    """Makes an object from a response of MinIO, or returns None if it
+    has no ETag.
+    """
+    hh = [(k, v) for (k, v) in headers
+          if k.lower() not in _uncached_headers]
+    etag = next((v for (k, v) in hh if k.lower() == "etag"), None)
+    if etag is None:
+        return None
+    return Cached_Object(etag, hh, body, time.time())
+
+
+def _parse_range(range_, size):
+    """Parses a single byte range.  It returns a pair (start, end) with an
+    inclusive end, "bad" if it is unsatisfiable, or None if it is not
+    handled (then, a whole object is returned).
+    """
+    if not range_.startswith("bytes=") or "," in range_:
+        return None
+    (s, _, e) = range_[len("bytes="):].strip().partition("-")
+    try:
+        if s == "":
+            n = int(e)
+            if n == 0:
+                return "bad"
+            return (max(0, size - n), size - 1)
+        start = int(s)
+        end = int(e) if e != "" else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return "bad"
+    return (start, min(end, size - 1))
+
+
+def respond_from_cache(o, environ):
+    """Makes a response (status, headers, body) for an object, honoring
+    If-None-Match and Range request headers.
+    """
+    inm = environ.get("HTTP_IF_NONE_MATCH")
+    if inm is not None and (inm.strip() == "*"
+                            or o.etag in [t.strip() for t in inm.split(",")]):
+        return ("304", list(o.headers), [])
+    size = len(o.body)
+    range_ = environ.get("HTTP_RANGE")
+    r = _parse_range(range_, size) if range_ is not None else None
+    if r == "bad":
+        return ("416", [("Content-Range", f"bytes */{size}"),
+                        ("Content-Length", "0")], [])
+    elif r is not None:
+        (start, end) = r
+        body = o.body[start:end + 1]
+        headers = o.headers + [("Accept-Ranges", "bytes"),
+                               ("Content-Range",
+                                f"bytes {start}-{end}/{size}"),
+                               ("Content-Length", f"{len(body)}")]
+        return ("206", headers, [body])
+    else:
+        headers = o.headers + [("Accept-Ranges", "bytes"),
+                               ("Content-Length", f"{size}")]
+        return ("200", headers, [o.body])
+    pass
@@ -6,13 +6,19 @@
 import re
 import enum
 import time
-import jsonschema
+import concurrent.futures
 from urllib.request import Request, urlopen
 import urllib.error
 from lenticularis.utility import host_port
 from lenticularis.utility import rephrase_exception_message
 from lenticularis.utility import logger
 from lenticularis.utility import tracing
+from lenticularis.yamlconf import compiled_validator
+
+# Records are always checked on writes.  Checking on reads can be
+# skipped by the "writes" mode of record_validation.
+
+_validate_reads = True
 
 
 class Api_Error(Exception):
@@ -162,6 +168,25 @@ def _pool_desc_schema():
             "minio_state": {"type": "string"},
             "minio_reason": {"type": "string"},
             "modification_time": {"type": "integer"},
+            "rate_limit": {
+                "type": "object",
+                "properties": {
+                    "rate": {"type": "number"},
+                    "burst": {"type": "number"},
+                },
+                "required": ["rate", "burst"],
+                "additionalProperties": False,
+            },
+            "bandwidth": {
+                "type": "object",
+                "properties": {
+                    "rate": {"type": "number"},
+                    "weight": {"type": "number"},
+                },
+                "required": ["rate", "weight"],
+                "additionalProperties": False,
+            },
+            "minio_cache": {"type": "boolean"},
         },
         "required": [
             "pool_name",
@@ -184,6 +209,9 @@ def _pool_desc_schema():
 
 
 def set_pool_state(tables, pool_id, state, reason):
+    """Stores a pool state.  A change is published with a version, and
+    readers which cache states drop the old one (see the Mux).
+    """
     (o, _, _) = tables.get_pool_state(pool_id)
     logger.debug(f"Manager (pool={pool_id}):"
                  f" pool-state change: {o} to {state}")
@@ -193,8 +221,10 @@ def set_pool_state(tables, pool_id, state, reason):
 
 def update_pool_state(tables, pool_id):
     """Checks changes of the user and pool setting, and updates the state.
-    This code should be placed at a location where it is called
-    periodically.  It returns a pair of a status and a reason.
+    It is called when the inputs change: at enabling/disabling a user,
+    at an expiry of a pool (by the sweeper in Api), and at a start of
+    MinIO.  It stores a state only when it changes.  It returns a pair
+    of a status and a reason.
     """
     desc = tables.get_pool(pool_id)
     if desc is None:
@@ -214,12 +244,13 @@ def update_pool_state(tables, pool_id):
     if u is None:
         reason = Pool_Reason.USER_REMOVED
         set_pool_state(tables, pool_id, Pool_State.INOPERABLE, reason)
-        return (False, reason)
+        return (Pool_State.INOPERABLE, reason)
     now = int(time.time())
     enabled = u["enabled"]
     unexpired = now < desc["expiration_time"]
     online = desc["online_status"]
     ok = (enabled and unexpired and online)
+    reason0 = reason
     if ok:
         if state in {Pool_State.DISABLED}:
             # It forces to setup MinIO by a transition to initial,
@@ -240,8 +271,22 @@ def update_pool_state(tables, pool_id):
         else:
             reason = Pool_Reason.NORMAL
             pass
-        set_pool_state(tables, pool_id, Pool_State.DISABLED, reason)
-        return (state, reason)
+        if not (state == Pool_State.DISABLED and reason == reason0):
+            set_pool_state(tables, pool_id, Pool_State.DISABLED, reason)
+            pass
+        return (Pool_State.DISABLED, reason)
+    pass
+
+
+def update_pools_of_user(tables, user_id):
+    """Updates the states of the pools of a user, after a change of the
+    user setting.
+    """
+    for pool_id in tables.list_pools_of_user(user_id):
+        if tables.get_pool(pool_id) is not None:
+            update_pool_state(tables, pool_id)
+            pass
+        pass
     pass
 
 
@@ -277,6 +322,12 @@ def ensure_mux_is_running(tables):
 
 def ensure_pool_state(tables, pool_id, reject_initial_state):
     (state, reason) = update_pool_state(tables, pool_id)
+    check_pool_state(pool_id, state, reject_initial_state)
+    pass
+
+
+def check_pool_state(pool_id, state, reject_initial_state):
+    """Raises an error when a state does not accept accesses."""
     if state == Pool_State.INITIAL:
         if reject_initial_state:
             logger.error(f"Manager (pool={pool_id}) is in initial state.")
@@ -316,10 +367,10 @@ def ensure_bucket_owner(tables, bucket, pool_id):
 
 def ensure_secret_owner(tables, access_key, pool_id):
     """Checks an access-key belongs to a given pool, and also checks a key
-    is not expired.  Note that it accepts access-key=None.
+    is not expired.  Note that it accepts access-key=None.  It returns
+    a key record, or None for access-key=None.
     """
-    _ensure_secret_owner(tables, access_key, pool_id, True)
-    pass
+    return _ensure_secret_owner(tables, access_key, pool_id, True)
 
 
 def ensure_secret_owner_only(tables, access_key, pool_id):
@@ -332,7 +383,7 @@ def ensure_secret_owner_only(tables, access_key, pool_id):
 
 def _ensure_secret_owner(tables, access_key, pool_id, check_expiration):
     if access_key is None:
-        return
+        return None
     keydesc = tables.get_xid("akey", access_key)
     if keydesc is None:
         raise Api_Error(403, f"Non-existing access-key: {access_key}")
@@ -343,7 +394,7 @@ def _ensure_secret_owner(tables, access_key, pool_id, check_expiration):
         if keydesc.get("expiration_time") < now:
             raise Api_Error(403, f"Expired access-key: {access_key}")
         pass
-    pass
+    return keydesc
 
 
 # def _drop_non_ui_info_from_keys(access_key):
@@ -454,10 +505,23 @@ def parse_s3_auth(authorization):
     return None
 
 
+def set_record_validation(mode):
+    """Sets a validation mode of records, "all" or "writes".  Records
+    are checked only on writes in the "writes" mode.
+    """
+    global _validate_reads
+    assert mode in {"all", "writes"}
+    _validate_reads = (mode == "all")
+    pass
+
+
+def validating_reads():
+    return _validate_reads
+
+
 def check_pool_is_well_formed(pooldesc, user_):
     """Checks a pool record is well-formed."""
-    schema = _pool_desc_schema()
-    jsonschema.validate(instance=pooldesc, schema=schema)
+    compiled_validator(_pool_desc_schema).validate(pooldesc)
     # for bucket in pooldesc.get("buckets", []):
     #     _check_bkt_policy(bucket["bkt_policy"])
     #     pass
@@ -517,34 +581,46 @@ def gather_pool_desc(tables, pool_id):
     """Returns a pool record.  It reconstructs a record by gathering
     data scattered in the database.
     """
-    pooldesc = tables.get_pool(pool_id)
-    if pooldesc is None:
-        return None
-    bd = tables.get_buckets_directory_of_pool(pool_id)
-    assert pooldesc["pool_name"] == pool_id
-    assert pooldesc["buckets_directory"] == bd
-    assert pooldesc["buckets_directory"] is not None
-    #
-    # Gather buckets.
-    #
-    bkts = gather_buckets(tables, pool_id)
-    pooldesc["buckets"] = bkts
-    #
-    # Gather access-keys.
-    #
-    keys = gather_keys(tables, pool_id)
-    pooldesc["secrets"] = keys
-    #
-    # Gather dynamic states.
-    #
-    (state, reason, _) = tables.get_pool_state(pool_id)
-    pooldesc["minio_state"] = str(state)
-    pooldesc["minio_reason"] = str(reason)
-    user_id = pooldesc["owner_uid"]
-    u = tables.get_user(user_id)
-    pooldesc["user_enabled_status"] = u["enabled"]
-    check_pool_is_well_formed(pooldesc, None)
-    return pooldesc
+    return gather_pool_descs(tables, [pool_id]).get(pool_id)
+
+
+def gather_pool_descs(tables, pool_ids):
+    """Returns a dict of pool-id to a pool record.  It gathers records of
+    pools in bulk, using the indexes of buckets and access-keys.  A
+    missing pool is dropped.
+    """
+    pools = tables.get_pools_in_bulk(pool_ids)
+    pids = list(pools.keys())
+    bkts = tables.list_buckets_of_pools(pids)
+    keys = tables.list_secrets_of_pools(pids)
+    users = {}
+    descs = {}
+    for (pool_id, (record, (state, reason, _))) in pools.items():
+        pooldesc = record.to_dict()
+        assert pooldesc["pool_name"] == pool_id
+        assert pooldesc["buckets_directory"] is not None
+        #
+        # Gather buckets and access-keys.
+        #
+        pooldesc["buckets"] = sorted(bkts[pool_id], key=lambda k: k["name"])
+        pooldesc["secrets"] = _sort_keys(keys[pool_id])
+        #
+        # Gather dynamic states.
+        #
+        pooldesc["minio_state"] = str(state)
+        pooldesc["minio_reason"] = str(reason)
+        user_id = pooldesc["owner_uid"]
+        if user_id not in users:
+            users[user_id] = tables.get_user(user_id)
+            pass
+        u = users[user_id]
+        pooldesc["user_enabled_status"] = u["enabled"]
+        if _validate_reads:
+            check_pool_is_well_formed(pooldesc, None)
+            pass
+        descs[pool_id] = pooldesc
+        pass
+    return descs
 
 
 def gather_buckets(tables, pool_id):
@@ -564,6 +640,10 @@ def gather_keys(tables, pool_id):
     used).
     """
     keys1 = tables.list_secrets_of_pool(pool_id)
+    return _sort_keys(keys1)
+
+
+def _sort_keys(keys1):
     keys2 = sorted(keys1, key=lambda k: k["modification_time"])
     keys3 = [k for k in keys2
              if (k is not None and k.get("secret_key") != "")]
@@ -571,49 +651,147 @@ def gather_keys(tables, pool_id):
     return keys3
 
 
+def dump_db_records(tables, batch_size=500):
+    """Returns an iterator of records of confs, users, and pools for
+    restoring.  A record is a dict with one key "conf", "user", or
+    "pool".  Pools are scanned and gathered in batches, so that it
+    does not hold all pools in memory.
+    """
+    for e in tables.list_confs():
+        yield {"conf": e}
+        pass
+    for id in tables.list_users():
+        u = tables.get_user(id)
+        if u is not None:
+            yield {"user": u}
+            pass
+        pass
+    batch = []
+    for id in tables.scan_pools():
+        batch.append(id)
+        if len(batch) >= batch_size:
+            yield from _dump_pools(tables, batch)
+            batch = []
+            pass
+        pass
+    yield from _dump_pools(tables, batch)
+    pass
+
+
+def _dump_pools(tables, pool_ids):
+    if len(pool_ids) == 0:
+        return
+    descs = gather_pool_descs(tables, pool_ids)
+    for id in pool_ids:
+        if id in descs:
+            yield {"pool": descs[id]}
+            pass
+        pass
+    pass
+
+
 def dump_db(tables):
-    """Returns a record of confs, users, and pools for restoring."""
-    # Collect confs:
-    confs = tables.list_confs()
-    # Collect users:
-    user_list = tables.list_users()
-    users = [tables.get_user(id) for id in user_list]
-    # Collect pools:
-    pool_list = tables.list_pools(None)
-    pools = [gather_pool_desc(tables, id) for id in pool_list]
+    """Returns a record of confs, users, and pools for restoring.  It is
+    the old format of a dump holding everything in one record.
+    """
+    confs = []
+    users = []
+    pools = []
+    for r in dump_db_records(tables):
+        if "conf" in r:
+            confs.append(r["conf"])
+        elif "user" in r:
+            users.append(r["user"])
+        else:
+            pools.append(r["pool"])
+            pass
+        pass
     return {"confs": confs, "users": users, "pools": pools}
 
 
 def restore_db(tables, record):
-    """Restores confs, users and pools from a dump file.  Note that the
-    dumper uses gather_pool_desc() and the restorer performs the
-    reverse in _restore_pool().  It does not restore MinIO state of a
-    pool ("minio_state" and "minio_reason").  Call after resetting a
-    database.  It is an error if some entries are already occupied: a
+    """Restores confs, users and pools from a dump of the old format (see
+    dump_db()).  See restore_db_records().
+    """
+    records = ([{"conf": e} for e in record.get("confs", [])]
+               + [{"user": e} for e in record.get("users", [])]
+               + [{"pool": e} for e in record.get("pools", [])])
+    restore_db_records(tables, records)
+    pass
+
+
+def restore_db_records(tables, records, nthreads=1, batch_size=100,
+                       progress=None):
+    """Restores confs, users and pools from records (see
+    dump_db_records()).  Note that the dumper uses gather_pool_descs()
+    and the restorer performs the reverse in _restore_pool().  It does
+    not restore MinIO state of a pool ("minio_state" and
+    "minio_reason").  Call after resetting a database.  It is an error
+    if some entries are already occupied by other pools: a
     buckets-directory, bucket names, and access-keys, (or etc.).
-    Pools are given new pool-ids.
+    Pools are restored in batches by nthreads threads.  It skips
+    existing pools, so that a failed restoring can be resumed by
+    running it again.  It calls progress(restored, skipped) after each
+    batch.  Records of users should precede records of pools.
     """
-    confs = record.get("confs", [])
-    users = record.get("users", [])
-    pools = record.get("pools", [])
-    # Restore Confs.
-    for e in confs:
-        tables.set_conf(e)
-        pass
-    # Restore Users.
-    for e in users:
-        tables.set_user(e)
+    restored = 0
+    skipped = 0
+
+    def restore_batch(batch):
+        nonlocal restored, skipped
+        existing = tables.get_pools_in_bulk(
+            [d["pool_name"] for d in batch])
+        todo = [d for d in batch if d["pool_name"] not in existing]
+        if nthreads > 1 and len(todo) > 1:
+            for _ in executor.map(lambda d: _restore_pool(tables, d), todo):
+                pass
+        else:
+            for d in todo:
+                _restore_pool(tables, d)
+                pass
+            pass
+        restored += len(todo)
+        skipped += len(batch) - len(todo)
+        if progress is not None:
+            progress(restored, skipped)
+            pass
         pass
-    # Restore Pools.
-    for pooldesc in pools:
-        _restore_pool(tables, pooldesc)
+
+    executor = (concurrent.futures.ThreadPoolExecutor(max_workers=nthreads)
+                if nthreads > 1 else None)
+    try:
+        batch = []
+        for r in records:
+            if "conf" in r:
+                tables.set_conf(r["conf"])
+            elif "user" in r:
+                tables.add_user(r["user"])
+            elif "pool" in r:
+                batch.append(r["pool"])
+                if len(batch) >= batch_size:
+                    restore_batch(batch)
+                    batch = []
+                    pass
+            else:
+                raise Exception(f"Bad record in a dump: {list(r.keys())}")
+            pass
+        if len(batch) > 0:
+            restore_batch(batch)
+            pass
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+            pass
         pass
-    pass
+    return (restored, skipped)
 
 
 def _restore_pool(tables, pooldesc):
-    """Restores a pool.  Call this after restoring users."""
-    now = int(time.time())
+    """Restores a pool.  Call this after restoring users.  It stores the
+    pool description last, so that a pool partially restored is
+    restored again at resuming.  An entry already held by the same pool
+    is taken as restored.
+    """
     user_id = pooldesc["owner_uid"]
     owner_gid = pooldesc["owner_gid"]
     u = tables.get_user(user_id)
@@ -621,58 +799,71 @@ def _restore_pool(tables, pooldesc):
         raise Api_Error(401, f"Bad user (unknown): {user_id}")
     if owner_gid not in u["groups"]:
         raise Api_Error(401, f"Bad group for a user: {owner_gid}")
-    #
-    # Restore a pool.
-    #
     pool_id = pooldesc["pool_name"]
-    entry1 = {
-        "pool_name": pooldesc["pool_name"],
-        "owner_uid": pooldesc["owner_uid"],
-        "owner_gid": pooldesc["owner_gid"],
-        "buckets_directory": pooldesc["buckets_directory"],
-        "probe_key": pooldesc["probe_key"],
-        "expiration_time": pooldesc["expiration_time"],
-        "online_status": pooldesc["online_status"],
-        "modification_time": pooldesc["modification_time"],
-    }
-    tables.set_pool(pool_id, entry1)
-    # tables.set_pool_state(pool_id, state, reason)
     #
     # Restore a buckets-directory.
     #
     path = pooldesc["buckets_directory"]
-    tables.set_ex_buckets_directory(path, pool_id)
+    (ok, holder) = tables.set_ex_buckets_directory(path, pool_id)
+    if not ok and holder != pool_id:
+        owner = get_pool_owner_for_messages(tables, holder)
+        raise Api_Error(403, f"Buckets-directory taken: owner={owner}")
     #
     # Restore buckets.
     #
-    bkts = pooldesc["buckets"]
-    for b in bkts:
-        bucket = b["name"];
-        entry2 = {
+    entries2 = {}
+    for b in pooldesc["buckets"]:
+        entries2[b["name"]] = {
             "pool": b["pool"],
             "bkt_policy": b["bkt_policy"],
             "modification_time": b["modification_time"],
         }
-        (ok, holder) = tables.set_ex_bucket(bucket, entry2)
-        if not ok:
-            owner = get_pool_owner_for_messages(tables, holder)
-            raise Api_Error(403, f"Bucket name taken: owner={owner}")
+        pass
+    if len(entries2) > 0:
+        results = tables.set_ex_buckets(entries2)
+        for (bucket, (ok, holder)) in results.items():
+            if not ok and holder != entries2[bucket]["pool"]:
+                owner = get_pool_owner_for_messages(tables, holder)
+                raise Api_Error(403, f"Bucket name taken: owner={owner}")
+            pass
         pass
     #
     # Restore access-keys.
     #
-    keys = pooldesc["secrets"]
-    for k in keys:
-        xid = k["access_key"]
-        entry3 = {
+    entries3 = {}
+    for k in pooldesc["secrets"]:
+        entries3[k["access_key"]] = {
             "owner": k["owner"],
             "secret_key": k["secret_key"],
             "key_policy": k["key_policy"],
             "expiration_time": k["expiration_time"],
             "modification_time": k["modification_time"],
         }
-        ok = tables.set_ex_xid(xid, "akey", entry3)
-        if not ok:
-            raise Api_Error(400, "Duplicate access-key: {key}")
         pass
+    if len(entries3) > 0:
+        results = tables.set_ex_xids("akey", entries3)
+        for (key, (ok, holder)) in results.items():
+            if not ok and holder != entries3[key]["owner"]:
+                raise Api_Error(400, f"Duplicate access-key: {key}")
+            pass
+        pass
+    #
+    # Restore a pool.
+    #
+    entry1 = {
+        "pool_name": pooldesc["pool_name"],
+        "owner_uid": pooldesc["owner_uid"],
+        "owner_gid": pooldesc["owner_gid"],
+        "buckets_directory": pooldesc["buckets_directory"],
+        "probe_key": pooldesc["probe_key"],
+        "expiration_time": pooldesc["expiration_time"],
+        "online_status": pooldesc["online_status"],
+        "modification_time": pooldesc["modification_time"],
+    }
+    for k in ["rate_limit", "bandwidth", "minio_cache"]:
+        if k in pooldesc:
+            entry1[k] = pooldesc[k]
+            pass
+        pass
+    tables.set_pool(pool_id, entry1)
     pass
@@ -0,0 +1,84 @@
+"""A sampling profiler for live Mux and Api workers.  It samples the
+stacks of all threads periodically and returns them in the collapsed
+stack format, which is taken by flamegraph tools ("flamegraph.pl" or
+"speedscope").  It costs nothing until a profiling is requested.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# A profiling is requested by an endpoint "/.lens3/profile" of a Mux
+# or an Api.  It is guarded: it accepts only a direct access from the
+# loopback (not via a proxy), and it needs a one-time token, which is
+# placed in Redis by lens3-admin.
+
+import collections
+import os
+import sys
+import threading
+import time
+
+
+PROFILE_PATH = "/.lens3/profile"
+PROFILE_TOKEN_HEADER = "X-LENS3-PROFILE-TOKEN"
+
+_sampling_interval = 0.005
+_max_duration = 300
+_loopback_addresses = {"127.0.0.1", "::1", "::ffff:127.0.0.1"}
+
+_profiling_lock = threading.Lock()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def _collapse_stack(thread_name, frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+        pass
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+def sample_stacks(duration, interval=_sampling_interval):
+    """Samples stacks of all threads other than the calling thread for a
+    duration in seconds.  It returns a text of the collapsed stacks,
+    or None if another profiling is running.
+    """
+    duration = min(max(0, duration), _max_duration)
+    if not _profiling_lock.acquire(blocking=False):
+        return None
+    try:
+        myself = threading.get_ident()
+        counts = collections.Counter()
+        limit = time.monotonic() + duration
+        while time.monotonic() < limit:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for (ident, frame) in sys._current_frames().items():
+                if ident == myself:
+                    continue
+                name = names.get(ident, f"thread-{ident}")
+                counts[_collapse_stack(name, frame)] += 1
+                pass
+            time.sleep(interval)
+            pass
+    finally:
+        _profiling_lock.release()
+        pass
+    lines = [f"{stack} {n}" for (stack, n) in counts.most_common()]
+    return "\n".join(lines) + "\n"
+
+
+def check_profile_request(tables, peer_addr, forwarded, token):
+    """Checks a profiling request is from the loopback not via a proxy,
+    and it has a valid one-time token.
+    """
+    if peer_addr not in _loopback_addresses or forwarded:
+        return False
+    if token is None or token == "":
+        return False
+    return tables.take_profile_token(token)
@@ -0,0 +1,153 @@
+"""Rate limiting in Lens3-Mux.  Requests are limited by token buckets
+keyed by an access-key, a pool, and a client address.  Buckets are
+local to a worker process, and counts of requests are exchanged in
+Redis periodically, so that the limits hold across workers and Mux
+nodes approximately.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Time is divided in epochs of the sync interval.  At a sync, a worker
+# adds its counts to the counters of the current epoch in Redis, and
+# reads the totals of the previous epoch.  The counts by the others
+# (the totals minus its own counts) are taken from the tokens.  A
+# bucket can go below zero, and then, it rejects requests until
+# refilled.  The limits are loose by an epoch of delay.
+
+import collections
+import threading
+import time
+from xml.sax.saxutils import escape
+
+
+class Rate_Limiter():
+    """Token buckets of access-keys, pools, and client addresses.  A rate
+    is in requests per second.  Zero rate means no limit.
+    """
+
+    def __init__(self, param, capacity=10000):
+        self._rates = {
+            "key": float(param.get("rate_limit_per_key", 0)),
+            "pool": float(param.get("rate_limit_per_pool", 0)),
+            "addr": float(param.get("rate_limit_per_address", 0)),
+        }
+        self._burst_time = float(param.get("rate_limit_burst_time", 1))
+        self.sync_interval = float(param.get("rate_limit_sync_interval", 1))
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        # A name "kind:id" maps to [tokens, last-time, used-count].
+        self._buckets = collections.OrderedDict()
+        # Counts of this worker by epochs, for the last two epochs.
+        self._own_counts = {}
+        self._deducted_epoch = None
+        pass
+
+    def _refill(self, name, rate, burst, now):
+        b = self._buckets.get(name)
+        if b is None:
+            b = [burst, now, 0]
+            self._buckets[name] = b
+            while len(self._buckets) > self._capacity:
+                self._buckets.popitem(last=False)
+                pass
+        else:
+            b[0] = min(burst, b[0] + (now - b[1]) * rate)
+            b[1] = now
+            self._buckets.move_to_end(name)
+            pass
+        return b
+
+    def acquire(self, access_key, pool_id, client_addr, pool_limit):
+        """Takes a token from each bucket.  It returns zero if a request is
+        admitted, or seconds to wait otherwise.  A pool_limit is a
+        "rate_limit" entry of a pool record, which overrides the
+        setting for pools.
+        """
+        limits = []
+        if access_key is not None and self._rates["key"] > 0:
+            limits.append((f"key:{access_key}", self._rates["key"], None))
+            pass
+        if pool_limit is not None:
+            limits.append((f"pool:{pool_id}", float(pool_limit["rate"]),
+                           float(pool_limit["burst"])))
+        elif self._rates["pool"] > 0:
+            limits.append((f"pool:{pool_id}", self._rates["pool"], None))
+            pass
+        if client_addr is not None and self._rates["addr"] > 0:
+            limits.append((f"addr:{client_addr}", self._rates["addr"], None))
+            pass
+        if limits == []:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            bb = []
+            wait = 0
+            for (name, rate, burst) in limits:
+                if burst is None:
+                    burst = max(1.0, rate * self._burst_time)
+                    pass
+                b = self._refill(name, rate, burst, now)
+                if b[0] < 1:
+                    wait = max(wait, (1 - b[0]) / rate)
+                    pass
+                bb.append(b)
+                pass
+            if wait > 0:
+                return wait
+            for b in bb:
+                b[0] -= 1
+                b[2] += 1
+                pass
+            pass
+        return 0
+
+    def reconcile(self, tables):
+        """Exchanges counts of requests with the other workers via Redis."""
+        epoch = int(time.time() // self.sync_interval)
+        with self._lock:
+            counts = {}
+            for (name, b) in self._buckets.items():
+                if b[2] > 0:
+                    counts[name] = b[2]
+                    b[2] = 0
+                    pass
+                pass
+            own = self._own_counts.setdefault(epoch, collections.Counter())
+            own.update(counts)
+            for e in list(self._own_counts):
+                if e < epoch - 1:
+                    del self._own_counts[e]
+                    pass
+                pass
+            previous = dict(self._own_counts.get(epoch - 1, {}))
+            pass
+        names = list(previous)
+        if counts == {} and names == []:
+            return
+        expiry = max(2, int(3 * self.sync_interval))
+        totals = tables.exchange_rate_counts(epoch, counts, names, expiry)
+        with self._lock:
+            if self._deducted_epoch == epoch - 1:
+                return
+            self._deducted_epoch = epoch - 1
+            for (name, total) in totals.items():
+                others = total - previous.get(name, 0)
+                b = self._buckets.get(name)
+                if b is not None and others > 0:
+                    b[0] -= others
+                    pass
+                pass
+            pass
+        pass
+
+    pass
+
+
+def slow_down_message(resource):
+    """Returns a body of an S3 "SlowDown" error response."""
+    return ("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+            "<Error><Code>SlowDown</Code>"
+            "<Message>Please reduce your request rate.</Message>"
+            f"<Resource>{escape(resource)}</Resource>"
+            "</Error>").encode()
@@ -0,0 +1,194 @@
+"""Records stored in Redis.  A record is a small object with slots, and
+it is read like a dict (it is a Mapping).  A record is encoded in
+compact json, which is a list of a version followed by the values in
+the order of the fields.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# A json list is cheaper to parse than a json object, and a record
+# keeps the decoded list as is, which is smaller than a dict.  Readers
+# accept the records of the old encoding (json objects), which are
+# rewritten in the new encoding at the next update.  A missing
+# optional field is stored as null, and it does not appear in keys().
+# A version is incremented when fields change, and a decoder should
+# accept older versions.  Fields are only added as optional ones at
+# the end, so that a record of an older version is read by filling
+# the missing fields by null.
+
+import collections.abc
+import json
+
+
+class Record(collections.abc.Mapping):
+    """A base of records.  A subclass defines _fields and _optional, the
+    names of required and optional fields.  Values are kept in a list
+    as decoded, whose first element is a version.
+    """
+
+    __slots__ = ("_values",)
+    _version = 1
+    _fields = ()
+    _optional = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        names = cls._fields + cls._optional
+        cls._index = {k: i + 1 for (i, k) in enumerate(names)}
+        pass
+
+    def __init__(self, values):
+        self._values = values
+        pass
+
+    @classmethod
+    def from_dict(cls, d):
+        """Makes a record from a dict.  It checks the keys."""
+        keys = set(d.keys())
+        assert (set(cls._fields) <= keys
+                <= set(cls._fields) | set(cls._optional)), (
+                    f"Bad keys of {cls.__name__}: {sorted(keys)}")
+        return cls([cls._version]
+                   + [d.get(k) for k in cls._fields + cls._optional])
+
+    @classmethod
+    def decode(cls, v):
+        """Decodes a record, or returns None for None.  It accepts the old
+        encoding (a json object).
+        """
+        if v is None:
+            return None
+        if v[0] != "[":
+            return cls.from_dict(json.loads(v))
+        vv = json.loads(v)
+        n = len(cls._index) + 1
+        if vv[0] != cls._version:
+            assert 1 <= vv[0] < cls._version and len(vv) <= n, (
+                f"Bad record of {cls.__name__}: {v}")
+            vv = [cls._version, *vv[1:]] + [None] * (n - len(vv))
+            pass
+        assert len(vv) == n, f"Bad record of {cls.__name__}: {v}"
+        return cls(vv)
+
+    def encode(self):
+        return json.dumps(self._values, separators=(",", ":"))
+
+    def to_dict(self):
+        return {k: self._values[self._index[k]] for k in self.keys()}
+
+    def keys(self):
+        if self._optional == ():
+            return list(self._fields)
+        return ([*self._fields]
+                + [k for k in self._optional
+                   if self._values[self._index[k]] is not None])
+
+    def __getitem__(self, k):
+        i = self._index.get(k)
+        if i is None:
+            raise KeyError(k)
+        v = self._values[i]
+        if v is None and k in self._optional:
+            raise KeyError(k)
+        return v
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+    pass
+
+
+def encode_record(cls, d):
+    """Encodes a record or a dict as a record of a class.  It checks the
+    keys of a dict.
+    """
+    r = d if isinstance(d, cls) else cls.from_dict(d)
+    return r.encode()
+
+
+class Pool_Record(Record):
+    """A pool description (po:)."""
+
+    __slots__ = ()
+    _fields = (
+        "pool_name", "owner_uid", "owner_gid", "buckets_directory",
+        "probe_key", "online_status", "expiration_time", "modification_time")
+    _optional = ("rate_limit", "bandwidth", "minio_cache")
+
+    pass
+
+
+class Pool_State_Record(Record):
+    """A pool state (ps:).  A version is incremented at each change
+    (version 2 of the record).
+    """
+
+    __slots__ = ()
+    _version = 2
+    _fields = ("state", "reason", "modification_time")
+    _optional = ("version",)
+
+    pass
+
+
+class Bucket_Record(Record):
+    """A bucket description (bk:)."""
+
+    __slots__ = ()
+    _fields = ("pool", "bkt_policy", "modification_time")
+
+    pass
+
+
+class Pool_Id_Record(Record):
+    """A pool-id reservation (pi:)."""
+
+    __slots__ = ()
+    _fields = ("owner", "modification_time")
+
+    pass
+
+
+class Access_Key_Record(Record):
+    """An access-key description (ky:)."""
+
+    __slots__ = ()
+    _fields = ("owner", "secret_key", "key_policy", "expiration_time",
+               "modification_time")
+
+    pass
+
+
+class Manager_Record(Record):
+    """A manager process (ma:)."""
+
+    __slots__ = ()
+    _fields = ("mux_host", "mux_port", "start_time")
+
+    pass
+
+
+class Minio_Proc_Record(Record):
+    """A MinIO process (mn:)."""
+
+    __slots__ = ()
+    _fields = ("minio_ep", "minio_pid", "admin", "password", "mux_host",
+               "mux_port", "manager_pid", "modification_time")
+
+    pass
+
+
+class Mux_Record(Record):
+    """A Mux description (mx:)."""
+
+    __slots__ = ()
+    _fields = ("host", "port", "start_time", "modification_time")
+
+    pass
@@ -0,0 +1,185 @@
+"""Bandwidth shaping in Lens3-Mux.  It limits the byte-rates of request
+and response bodies forwarded between clients and MinIO, by pools and
+by a node.  A node budget is shared by the active pools (the pools
+transferring bodies) in proportion to their weights.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# A rate of a pool is min(pool-rate, node-rate * weight / sum of
+# weights of active pools), and it is recalculated on each chunk.  A
+# node-rate is divided by the number of workers, because workers are
+# separate processes.  Shaping sleeps in a worker thread, and it holds
+# the thread while throttling.  Streams are not wrapped when no rate
+# applies to a pool.
+
+import collections
+import threading
+import time
+
+
+_min_burst = 64 * 1024
+_burst_time = 0.25
+_chunk_size = 64 * 1024
+
+
+class Bandwidth_Shaper():
+    """Token buckets of bytes of pools.  It also counts bytes and
+    throttled time of pools as metrics.
+    """
+
+    def __init__(self, param, nworkers):
+        node_rate = float(param.get("bandwidth_per_node", 0))
+        self._node_rate = node_rate / max(1, nworkers)
+        self._pool_rate = float(param.get("bandwidth_per_pool", 0))
+        self._lock = threading.Lock()
+        # A pool maps to [tokens, last-time] of an active pool.
+        self._buckets = {}
+        # A pool maps to [number-of-flows, weight] of an active pool.
+        self._active = {}
+        self._metrics = collections.defaultdict(
+            lambda: {"upload": 0, "download": 0, "throttled": 0.0})
+        pass
+
+    def open_flow(self, pool_id, pool_limit):
+        """Returns a flow of a pool to be throttled, or None if no limits
+        apply.  A pool_limit is a "bandwidth" entry of a pool record.
+        """
+        rate = self._pool_rate
+        weight = 1.0
+        if pool_limit is not None:
+            rate = float(pool_limit["rate"]) or rate
+            weight = float(pool_limit["weight"])
+            pass
+        if rate == 0 and self._node_rate == 0:
+            return None
+        with self._lock:
+            a = self._active.setdefault(pool_id, [0, weight])
+            a[0] += 1
+            a[1] = weight
+            pass
+        return _Flow(self, pool_id, rate)
+
+    def _close_flow(self, pool_id):
+        with self._lock:
+            a = self._active.get(pool_id)
+            if a is not None:
+                a[0] -= 1
+                if a[0] <= 0:
+                    del self._active[pool_id]
+                    self._buckets.pop(pool_id, None)
+                    pass
+                pass
+            pass
+        pass
+
+    def _consume(self, pool_id, pool_rate, n, direction):
+        now = time.monotonic()
+        with self._lock:
+            rate = pool_rate if pool_rate > 0 else float("inf")
+            a = self._active.get(pool_id)
+            if self._node_rate > 0 and a is not None:
+                total = sum(w for (_, w) in self._active.values())
+                rate = min(rate, self._node_rate * a[1] / total)
+                pass
+            burst = max(_min_burst, rate * _burst_time)
+            b = self._buckets.get(pool_id)
+            if b is None:
+                b = [burst, now]
+                self._buckets[pool_id] = b
+                pass
+            b[0] = min(burst, b[0] + (now - b[1]) * rate)
+            b[1] = now
+            b[0] -= n
+            wait = (-b[0] / rate) if b[0] < 0 else 0
+            m = self._metrics[pool_id]
+            m[direction] += n
+            m["throttled"] += wait
+            pass
+        if wait > 0:
+            time.sleep(wait)
+            pass
+        pass
+
+    def take_metrics(self):
+        """Returns metrics by pools, and resets them."""
+        with self._lock:
+            m = dict(self._metrics)
+            self._metrics.clear()
+            pass
+        return m
+
+    pass
+
+
+class _Flow():
+    """A transfer of a body of a pool."""
+
+    def __init__(self, shaper, pool_id, rate):
+        self._shaper = shaper
+        self._pool_id = pool_id
+        self._rate = rate
+        self._closed = False
+        pass
+
+    def consume(self, n, direction):
+        if n > 0:
+            self._shaper._consume(self._pool_id, self._rate, n, direction)
+            pass
+        pass
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._shaper._close_flow(self._pool_id)
+            pass
+        pass
+
+    pass
+
+
+class Throttled_Input():
+    """A request body stream which throttles reading.  It is passed to
+    urlopen as data.
+    """
+
+    def __init__(self, stream, flow):
+        self._stream = stream
+        self._flow = flow
+        pass
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self._flow.consume(len(data), "upload")
+        return data
+
+    pass
+
+
+class Throttled_Output():
+    """A response body iterator which throttles writing.  A WSGI server
+    calls close() at the end.
+    """
+
+    def __init__(self, response, flow):
+        self._response = response
+        self._flow = flow
+        pass
+
+    def __iter__(self):
+        while True:
+            data = self._response.read(_chunk_size)
+            if not data:
+                break
+            self._flow.consume(len(data), "download")
+            yield data
+            pass
+        pass
+
+    def close(self):
+        self._flow.close()
+        self._response.close()
+        pass
+
+    pass
@@ -0,0 +1,172 @@
+"""Verification of AWS Signature V4.  Lens3-Mux optionally checks a
+signature of a request with a secret in the access-key record, so that
+a badly signed request is rejected before it wakes up a MinIO
+instance.  Only signatures in an Authorization header are checked.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# A signing-key is derived by four HMAC operations from a secret, a
+# date, a region, and a service.  It is cached, since it changes only
+# daily.  Then, checking a signature costs two SHA256 operations and
+# one HMAC operation.  See "Authenticating Requests (AWS Signature
+# Version 4)" in the Amazon S3 documents.
+
+import calendar
+import collections
+import hashlib
+import hmac
+import threading
+import time
+import urllib.parse
+from lenticularis.pooldata import Api_Error
+
+
+_algorithm = "AWS4-HMAC-SHA256"
+
+
+class Signing_Key_Cache():
+    """A bounded LRU cache of signing-keys."""
+
+    def __init__(self, capacity=1000):
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._keys = collections.OrderedDict()
+        pass
+
+    def get(self, secret, date, region, service):
+        k = (secret, date, region, service)
+        with self._lock:
+            v = self._keys.get(k)
+            if v is not None:
+                self._keys.move_to_end(k)
+                return v
+            pass
+        v = _derive_signing_key(secret, date, region, service)
+        with self._lock:
+            self._keys[k] = v
+            while len(self._keys) > self._capacity:
+                self._keys.popitem(last=False)
+                pass
+            pass
+        return v
+
+    pass
+
+
+def _derive_signing_key(secret, date, region, service):
+    k = f"AWS4{secret}".encode()
+    for m in (date, region, service, "aws4_request"):
+        k = hmac.new(k, m.encode(), hashlib.sha256).digest()
+        pass
+    return k
+
+
+def _parse_authorization(authorization):
+    """Returns a triple (credential, signed-headers, signature) from an
+    Authorization header, or None if it is malformed.
+    """
+    if not authorization.startswith(_algorithm):
+        return None
+    fields = {}
+    for c in authorization[len(_algorithm):].split(","):
+        (k, _, v) = c.strip().partition("=")
+        fields[k] = v
+        pass
+    credential = fields.get("Credential")
+    signed = fields.get("SignedHeaders")
+    signature = fields.get("Signature")
+    if credential is None or signed is None or signature is None:
+        return None
+    return (credential, signed, signature)
+
+
+def _header_value(environ, name):
+    if name == "content-type":
+        v = environ.get("CONTENT_TYPE")
+    elif name == "content-length":
+        v = environ.get("CONTENT_LENGTH")
+    else:
+        v = environ.get("HTTP_" + name.upper().replace("-", "_"))
+        pass
+    if v is None:
+        return None
+    return " ".join(v.split())
+
+
+def _parse_amz_date(amzdate):
+    """Parses a date like "20230401T000000Z".  It avoids strptime which is
+    slow.
+    """
+    if len(amzdate) != 16 or amzdate[8] != "T" or amzdate[15] != "Z":
+        return None
+    try:
+        return calendar.timegm((int(amzdate[0:4]), int(amzdate[4:6]),
+                                int(amzdate[6:8]), int(amzdate[9:11]),
+                                int(amzdate[11:13]), int(amzdate[13:15]),
+                                0, 0, 0))
+    except ValueError:
+        return None
+    pass
+
+
+def _canonical_query(query):
+    pairs = urllib.parse.parse_qsl(query, keep_blank_values=True)
+    qq = sorted((urllib.parse.quote(k, safe="-_.~"),
+                 urllib.parse.quote(v, safe="-_.~"))
+                for (k, v) in pairs)
+    return "&".join(f"{k}={v}" for (k, v) in qq)
+
+
+def verify_signature(environ, path_and_query, secret, signing_keys,
+                     clock_skew):
+    """Checks a signature of a request, or raises an Api_Error(403).  A
+    path_and_query is the one in the request line as is.
+    """
+    authorization = environ.get("HTTP_AUTHORIZATION")
+    auth = _parse_authorization(authorization or "")
+    if auth is None:
+        raise Api_Error(403, "Bad signature: malformed authorization")
+    (credential, signed, signature) = auth
+    scope = credential.split("/", 1)[-1]
+    s = scope.split("/")
+    if len(s) != 4 or s[3] != "aws4_request":
+        raise Api_Error(403, f"Bad signature: malformed scope: {scope}")
+    (date, region, service, _) = s
+
+    amzdate = _header_value(environ, "x-amz-date")
+    if amzdate is None:
+        raise Api_Error(403, "Bad signature: missing x-amz-date")
+    t = _parse_amz_date(amzdate)
+    if t is None:
+        raise Api_Error(403, f"Bad signature: bad x-amz-date: {amzdate}")
+    if abs(time.time() - t) > clock_skew:
+        raise Api_Error(403, f"Request time too skewed: {amzdate}")
+    if amzdate[:8] != date:
+        raise Api_Error(403, f"Bad signature: date mismatch: {scope}")
+
+    payload_hash = _header_value(environ, "x-amz-content-sha256")
+    if payload_hash is None:
+        raise Api_Error(403, "Bad signature: missing x-amz-content-sha256")
+
+    headers = []
+    for h in signed.split(";"):
+        v = _header_value(environ, h)
+        if v is None:
+            raise Api_Error(403, f"Bad signature: missing header: {h}")
+        headers.append(f"{h}:{v}\n")
+        pass
+
+    (path, _, query) = path_and_query.partition("?")
+    uri = urllib.parse.quote(urllib.parse.unquote(path), safe="/-_.~")
+    canonical = "\n".join([environ.get("REQUEST_METHOD"), uri,
+                           _canonical_query(query), "".join(headers),
+                           signed, payload_hash])
+    tosign = "\n".join([_algorithm, amzdate, scope,
+                        hashlib.sha256(canonical.encode()).hexdigest()])
+    key = signing_keys.get(secret, date, region, service)
+    expected = hmac.new(key, tosign.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, signature):
+        raise Api_Error(403, "Bad signature: signature mismatch")
+    pass
@@ -0,0 +1,99 @@
+"""A snapshot of the databases for reporting in lens3-admin.  It reads
+all entries in one pass over the databases, and keeps them in memory
+indexed by pools.  Reports are made from a snapshot without accessing
+Redis further.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# A snapshot is not atomic.  Entries are scanned while the service is
+# running, and an entry may be missing or stale due to concurrent
+# updates.  Entries of buckets and access-keys are indexed by the
+# owners in the records, not by the index sets ("pb:" and "pk:"),
+# thus, a snapshot does not depend on a consistency of the indexes.
+
+from lenticularis.pooldata import _sort_keys
+
+
+class Snapshot():
+    """Entries of the databases.  Entries are dicts of an id to a
+    record, except for buckets and access-keys, which are dicts of a
+    pool-id to a list of records (with "name" or "access_key" added).
+    """
+
+    def __init__(self):
+        self.confs = {}
+        self.users = {}
+        self.pools = {}
+        self.pool_states = {}
+        self.buckets_directories = {}
+        self.managers = {}
+        self.minio_procs = {}
+        self.muxs = {}
+        self.minio_eps = {}
+        self.buckets = {}
+        self.access_timestamps = {}
+        self.user_timestamps = {}
+        self.pool_ids = {}
+        self.access_keys = {}
+        self.buckets_of_pool = {}
+        self.keys_of_pool = {}
+        pass
+
+    def pool_desc(self, pool_id):
+        """Returns a pool description as gather_pool_desc() does, or None.
+        """
+        record = self.pools.get(pool_id)
+        if record is None:
+            return None
+        pooldesc = record.to_dict()
+        bkts = self.buckets_of_pool.get(pool_id, [])
+        pooldesc["buckets"] = sorted(bkts, key=lambda k: k["name"])
+        pooldesc["secrets"] = _sort_keys(self.keys_of_pool.get(pool_id, []))
+        state = self.pool_states.get(pool_id)
+        pooldesc["minio_state"] = (state["state"] if state is not None
+                                   else "None")
+        pooldesc["minio_reason"] = (state["reason"] if state is not None
+                                    else "None")
+        u = self.users.get(pooldesc["owner_uid"])
+        pooldesc["user_enabled_status"] = (u["enabled"] if u is not None
+                                           else False)
+        return pooldesc
+
+    pass
+
+
+def load_snapshot(tables, batch_size=1000):
+    """Takes a snapshot of the databases by a single scan of each
+    database (see Table.scan_snapshot()).
+    """
+    snap = Snapshot()
+    slots = {
+        "conf": snap.confs,
+        "user": snap.users,
+        "pool": snap.pools,
+        "pool_state": snap.pool_states,
+        "buckets_directory": snap.buckets_directories,
+        "manager": snap.managers,
+        "minio_proc": snap.minio_procs,
+        "mux": snap.muxs,
+        "minio_ep": snap.minio_eps,
+        "bucket": snap.buckets,
+        "access_timestamp": snap.access_timestamps,
+        "user_timestamp": snap.user_timestamps,
+        "pool_id": snap.pool_ids,
+        "access_key": snap.access_keys,
+    }
+    for (kind, id, v) in tables.scan_snapshot(batch_size):
+        slots[kind][id] = v
+        pass
+    for (name, d) in snap.buckets.items():
+        snap.buckets_of_pool.setdefault(d["pool"], []).append(
+            {"name": name, **d})
+        pass
+    for (key, d) in snap.access_keys.items():
+        snap.keys_of_pool.setdefault(d["owner"], []).append(
+            {"access_key": key, **d})
+        pass
+    return snap
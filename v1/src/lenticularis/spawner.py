@@ -11,6 +11,7 @@ from lenticularis.utility import wait_line_on_stdout
 from lenticularis.utility import rephrase_exception_message
 from lenticularis.utility import logger
 from lenticularis.utility import tracing
+from lenticularis.tracer import tracer
 
 
 class Spawner():
@@ -34,7 +35,9 @@ class Spawner():
         """Runs MinIO on a local host.  It returns an endpoint or None on
         failure.
         """
-        ok = self._start_manager(pool_id)
+        with tracer.span("spawner.start-manager"):
+            ok = self._start_manager(pool_id)
+            pass
         if not ok:
             return None
         ep = self.tables.get_minio_ep(pool_id)
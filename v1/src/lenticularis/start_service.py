@@ -28,7 +28,9 @@ def _run_mux():
                          f" exception=({m})\n")
         return
 
-    openlog(mux_conf["log_file"], **mux_conf["log_syslog"])
+    openlog(mux_conf["log_file"], **mux_conf["log_syslog"],
+            queue_size=mux_conf.get("log_queue_size"),
+            access_format=mux_conf.get("log_access_format"))
     servicename = "lenticularis-mux"
     logger.info("Start {servicename} service.")
 
@@ -59,7 +61,9 @@ def _run_api():
                          f" exception=({m})\n")
         return
 
-    openlog(api_conf["log_file"], **api_conf["log_syslog"])
+    openlog(api_conf["log_file"], **api_conf["log_syslog"],
+            queue_size=api_conf.get("log_queue_size"),
+            access_format=api_conf.get("log_access_format"))
     servicename = "lenticularis-api"
     logger.info(f"Start {servicename} service.")
 
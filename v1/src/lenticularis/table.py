@@ -8,11 +8,16 @@ database, while it is implemented by a couple of databases inside.
 import time
 import os
 import json
-import jsonschema
 import redis
 from redis import Redis
 from lenticularis.yamlconf import redis_json_schema
+from lenticularis.yamlconf import compiled_validator
 from lenticularis.pooldata import Pool_State, Pool_Reason
+from lenticularis.records import encode_record
+from lenticularis.records import Pool_Record, Pool_State_Record
+from lenticularis.records import Bucket_Record, Pool_Id_Record
+from lenticularis.records import Access_Key_Record, Manager_Record
+from lenticularis.records import Minio_Proc_Record, Mux_Record
 from lenticularis.utility import rephrase_exception_message
 from lenticularis.utility import generate_access_key
 from lenticularis.utility import logger
@@ -27,6 +32,70 @@ _MONOKEY_DB = 4
 
 _limit_of_xid_generation_loop = 30
 
+# A version of the indexes (the index sets and the expiry indexes).
+# It is incremented when an index is added, to let the indexes be
+# rebuilt once for the data made before.
+
+_index_version = 2
+
+# A Pub/Sub channel to tell creations of entries to the caches in
+# processes (such as the negative cache in Mux).
+
+_invalidation_channel = "lens3:invalidate"
+
+# A script to delete the data of a pool atomically.  It spans the
+# databases by SELECT, and it selects back the database of the
+# connection at the end (Redis before 7.0 keeps a selection made in a
+# script).  Entries are read from the indexes, and buckets and
+# access-keys are deleted only when they are owned by the pool.  A
+# record is a json list [version, owner, ...] or an old json object
+# (see records.py).  ARGV is: pool-id, buckets-directory (or ""),
+# owner-uid (or ""), the numbers of the storage, routing, and monokey
+# databases, and the invalidation channel.  It tells deletions of
+# buckets and the pool state to the caches in Mux'es.  It returns the numbers of deleted
+# buckets and access-keys.
+
+_delete_pool_script = """
+local pid, path, uid = ARGV[1], ARGV[2], ARGV[3]
+local function owned(v, field)
+  if not v then return false end
+  local r = cjson.decode(v)
+  if r[1] ~= nil then return r[2] == pid end
+  return r[field] == pid
+end
+redis.call("SELECT", ARGV[6])
+local nkeys = 0
+for _, k in ipairs(redis.call("SMEMBERS", "pk:" .. pid)) do
+  if owned(redis.call("GET", "ky:" .. k), "owner") then
+    redis.call("DEL", "ky:" .. k)
+    redis.call("ZREM", "ke:", k)
+    nkeys = nkeys + 1
+  end
+end
+redis.call("DEL", "pk:" .. pid, "pi:" .. pid)
+redis.call("SELECT", ARGV[5])
+local nbkts = 0
+for _, b in ipairs(redis.call("SMEMBERS", "pb:" .. pid)) do
+  if owned(redis.call("GET", "bk:" .. b), "pool") then
+    redis.call("DEL", "bk:" .. b)
+    redis.call("PUBLISH", ARGV[7], "bucket:" .. b)
+    nbkts = nbkts + 1
+  end
+end
+redis.call("DEL", "pb:" .. pid)
+redis.call("SELECT", ARGV[4])
+if path ~= "" and redis.call("GET", "bd:" .. path) == pid then
+  redis.call("DEL", "bd:" .. path)
+end
+if uid ~= "" then
+  redis.call("SREM", "up:" .. uid, pid)
+end
+redis.call("DEL", "po:" .. pid, "ps:" .. pid)
+redis.call("ZREM", "pe:", pid)
+redis.call("PUBLISH", ARGV[7], "pool_state:" .. pid)
+return {nbkts, nkeys}
+"""
+
 
 def read_redis_conf(conf_file):
     """Reads conf.json file and returns a record for a Redis connection.
@@ -42,7 +111,12 @@ def read_redis_conf(conf_file):
         m = rephrase_exception_message(e)
         raise Exception(f"Reading a conf file failed: {conf_file}:"
                         f" exception=({m})")
-    schema = {
+    compiled_validator(_redis_conf_schema).validate(conf)
+    return conf["redis"]
+
+
+def _redis_conf_schema():
+    return {
         "type": "object",
         "properties": {
             "redis": redis_json_schema
@@ -52,8 +126,6 @@ def read_redis_conf(conf_file):
         ],
         "additionalProperties": True,
     }
-    jsonschema.validate(instance=conf, schema=schema)
-    return conf["redis"]
 
 
 def get_table(redis):
@@ -138,6 +210,52 @@ def _scan_table(r, prefix, target):
     pass
 
 
+def _scan_values(r, decoders, batch_size):
+    """Returns an iterator of triples (kind, id, value) of all entries of
+    the prefixes in the database.  Decoders is a dict of a prefix to a
+    pair of a kind and a decoder of a value.  It scans all keys once,
+    and takes values by MGET for each page of a scan.  MGET returns
+    None for a key of a non-string type, and such entries are dropped.
+    """
+    cursor = "0"
+    while cursor != 0:
+        (cursor, data) = r.scan(cursor=cursor, count=batch_size)
+        keys = [k for k in data if k[:3] in decoders]
+        vv = r.mget(keys) if len(keys) > 0 else []
+        for (k, v) in zip(keys, vv):
+            if v is None:
+                continue
+            (kind, decode) = decoders[k[:3]]
+            yield (kind, k[3:], decode(v))
+            pass
+        pass
+    pass
+
+
+def _rebuild_index(r, prefix, index, prune):
+    """Adds members to index sets, where an index is a dict of a set.  It
+    also removes members not in the index when prune.  Pruning has a
+    race with concurrent additions.
+    """
+    with r.pipeline(transaction=False) as p:
+        for (k, members) in index.items():
+            if len(members) > 0:
+                p.sadd(f"{prefix}{k}", *members)
+                pass
+            pass
+        p.execute()
+        pass
+    if not prune:
+        return
+    for k in list(_scan_table(r, prefix, None)):
+        stale = r.smembers(f"{prefix}{k}") - index.get(k, set())
+        if len(stale) > 0:
+            r.srem(f"{prefix}{k}", *stale)
+            pass
+        pass
+    pass
+
+
 class Table():
     """Redis databases."""
 
@@ -147,6 +265,7 @@ class Table():
         self._process_table = process
         self._routing_table = routing
         self._monokey_table = monokey
+        self._indexes_current = False
         pass
 
     # Setting-Table:
@@ -177,6 +296,13 @@ class Table():
     def list_users(self):
         return self._setting_table.list_users()
 
+    def set_profile_token(self, token, timeout):
+        self._setting_table.set_profile_token(token, timeout)
+        pass
+
+    def take_profile_token(self, token):
+        return self._setting_table.take_profile_token(token)
+
     # Storage-Table:
 
     def set_pool(self, pool_id, pooldesc):
@@ -190,12 +316,24 @@ class Table():
         self._storage_table.delete_pool(pool_id)
         pass
 
+    def scan_pools(self):
+        """Returns an iterator of pool-ids."""
+        return self._storage_table.scan_pools()
+
     def list_pools(self, pool_id):
         """Returns a ID list of pools if argument is None.  Or, it just checks
         existence of a pool.
         """
         return self._storage_table.list_pools(pool_id)
 
+    def list_pools_of_user(self, user_id):
+        if not self.indexes_are_current():
+            return self._storage_table.scan_pools_of_user(user_id)
+        return self._storage_table.list_pools_of_user(user_id)
+
+    def get_pools_in_bulk(self, pool_ids):
+        return self._storage_table.get_pools_in_bulk(pool_ids)
+
     def set_ex_buckets_directory(self, path, pool_id):
         return self._storage_table.set_ex_buckets_directory(path, pool_id)
 
@@ -210,8 +348,11 @@ class Table():
         return self._storage_table.list_buckets_directories()
 
     def set_pool_state(self, pool_id, state, reason):
-        self._storage_table.set_pool_state(pool_id, state, reason)
-        pass
+        return self._storage_table.set_pool_state(pool_id, state, reason)
+
+    def get_pool_state_record(self, pool_id):
+        """Returns a pool state record with a version, or None."""
+        return self._storage_table.get_pool_state_record(pool_id)
 
     def get_pool_state(self, pool_id):
         return self._storage_table.get_pool_state(pool_id)
@@ -249,13 +390,10 @@ class Table():
     def list_minio_procs(self, pool_id):
         return self._process_table.list_minio_procs(pool_id)
 
-    def set_mux(self, mux_ep, mux_desc):
-        self._process_table.set_mux(mux_ep, mux_desc)
+    def register_mux(self, mux_ep, mux_desc, timeout):
+        self._process_table.register_mux(mux_ep, mux_desc, timeout)
         pass
 
-    def set_mux_expiry(self, mux_ep, timeout):
-        return self._process_table.set_mux_expiry(mux_ep, timeout)
-
     def get_mux(self, mux_ep):
         return self._process_table.get_mux(mux_ep)
 
@@ -269,11 +407,57 @@ class Table():
     def list_mux_eps(self):
         return self._process_table.list_mux_eps()
 
+    def set_startup_phases(self, pool_id, record):
+        self._process_table.set_startup_phases(pool_id, record)
+        pass
+
+    def take_startup_phases(self, pool_id):
+        return self._process_table.take_startup_phases(pool_id)
+
+    def add_startup_record(self, pool_id, record):
+        self._process_table.add_startup_record(pool_id, record)
+        pass
+
+    def get_startup_records(self, pool_id):
+        return self._process_table.get_startup_records(pool_id)
+
+    def list_startup_records(self):
+        return self._process_table.list_startup_records()
+
+    def set_mux_metrics(self, worker, record, expiry):
+        self._process_table.set_mux_metrics(worker, record, expiry)
+        pass
+
+    def list_mux_metrics(self):
+        return self._process_table.list_mux_metrics()
+
+    def set_cache_stats(self, pool_id, record, expiry):
+        self._process_table.set_cache_stats(pool_id, record, expiry)
+        pass
+
+    def list_cache_stats(self):
+        return self._process_table.list_cache_stats()
+
+    def set_job(self, job_id, record, expiry):
+        self._process_table.set_job(job_id, record, expiry)
+        pass
+
+    def get_job(self, job_id):
+        return self._process_table.get_job(job_id)
+
+    def exchange_rate_counts(self, epoch, counts, names, expiry):
+        return self._process_table.exchange_rate_counts(
+            epoch, counts, names, expiry)
+
     # Routing-Table:
 
     def set_ex_bucket(self, bucket, desc):
         return self._routing_table.set_ex_bucket(bucket, desc)
 
+    def set_ex_buckets(self, descs):
+        """Registers buckets in bulk, used at database restoring."""
+        return self._routing_table.set_ex_buckets(descs)
+
     def get_bucket(self, bucket):
         return self._routing_table.get_bucket(bucket)
 
@@ -282,7 +466,14 @@ class Table():
         pass
 
     def list_buckets(self, pool_id):
-        return self._routing_table.list_buckets(pool_id)
+        if pool_id is not None:
+            return self.list_buckets_of_pools([pool_id])[pool_id]
+        return self._routing_table.list_buckets(None)
+
+    def list_buckets_of_pools(self, pool_ids):
+        if not self.indexes_are_current():
+            return self._routing_table.scan_buckets_of_pools(pool_ids)
+        return self._routing_table.list_buckets_of_pools(pool_ids)
 
     def set_minio_ep(self, pool_id, ep):
         self._routing_table.set_minio_ep(pool_id, ep)
@@ -333,6 +524,10 @@ class Table():
         """Inserts an id, used at database restoring."""
         return self._monokey_table.set_ex_xid(xid, usage, desc)
 
+    def set_ex_xids(self, usage, descs):
+        """Inserts ids in bulk, used at database restoring."""
+        return self._monokey_table.set_ex_xids(usage, descs)
+
     def get_xid(self, usage, xid):
         return self._monokey_table.get_xid(usage, xid)
 
@@ -341,7 +536,140 @@ class Table():
         pass
 
     def list_secrets_of_pool(self, pool_id):
-        return self._monokey_table.list_secrets_of_pool(pool_id)
+        return self.list_secrets_of_pools([pool_id])[pool_id]
+
+    def list_secrets_of_pools(self, pool_ids):
+        if not self.indexes_are_current():
+            return self._monokey_table.scan_secrets_of_pools(pool_ids)
+        return self._monokey_table.list_secrets_of_pools(pool_ids)
+
+    # Indexes:
+
+    def rebuild_indexes(self, prune):
+        """Rebuilds indexes of user to pools, pool to buckets, and pool to
+        access-keys.  It only adds missing entries unless prune.
+        """
+        self._storage_table.rebuild_user_pools_index(prune)
+        self._routing_table.rebuild_pool_buckets_index(prune)
+        self._monokey_table.rebuild_pool_keys_index(prune)
+        pass
+
+    def rebuild_expiry_indexes(self):
+        """Adds missing entries to the expiry indexes of pools and
+        access-keys.
+        """
+        self._storage_table.rebuild_pool_expiry_index()
+        self._monokey_table.rebuild_key_expiry_index()
+        pass
+
+    def indexes_are_current(self):
+        """Checks the index version in Redis.  Listings fall back to
+        scanning while the indexes are not current, that is, until
+        migration finishes in some worker.  A true result is kept in
+        the process, because the version only increases.
+        """
+        if not self._indexes_current:
+            v = self._setting_table.get_index_version()
+            self._indexes_current = (v >= _index_version)
+            pass
+        return self._indexes_current
+
+    def migrate_indexes(self, timeout=600):
+        """Rebuilds the indexes once for the data made before indexing.
+        It is skipped when the index version in Redis is current.  A
+        worker takes a lock for the timeout, so that only one worker
+        rebuilds at a time.  It should be called repeatedly, because
+        a worker which dies in migration leaves the version old, and
+        the lock lets another worker retry after the timeout.  It
+        returns true when the indexes are current.
+        """
+        if self.indexes_are_current():
+            return True
+        if not self._setting_table.take_index_migration(timeout):
+            return False
+        self.rebuild_indexes(False)
+        self.rebuild_expiry_indexes()
+        self.set_index_version()
+        return True
+
+    def set_index_version(self):
+        """Records the indexes are current (after rebuilding them)."""
+        self._setting_table.set_index_version(_index_version)
+        self._indexes_current = True
+        pass
+
+    # Expiry indexes:
+
+    def list_expired_pools(self, now, limit):
+        return self._storage_table.list_expired_pools(now, limit)
+
+    def drop_pool_expiry(self, pool_ids):
+        self._storage_table.drop_pool_expiry(pool_ids)
+        pass
+
+    def list_expired_keys(self, now, limit):
+        return self._monokey_table.list_expired_keys(now, limit)
+
+    def take_sweeper_turn(self, owner, timeout):
+        return self._process_table.take_sweeper_turn(owner, timeout)
+
+    # Pool teardown:
+
+    def delete_pools(self, pool_ids):
+        """Deletes the data of pools: a pool description, a pool state, a
+        buckets-directory, buckets, access-keys, a pool-id, and the
+        index entries.  Each pool is deleted atomically by a script,
+        and the scripts for all pools are sent in one pipeline.  It
+        returns a dict of pool-id to a pair of the numbers of deleted
+        buckets and access-keys.
+        """
+        # The script is loaded in the first round-trip and called by
+        # EVALSHA.  (A registered script object is not used, because
+        # it does not load a script in a pipeline of a wrapped client).
+        # The script reads the indexes, and entries of the pools are
+        # added beforehand while the indexes are not current.
+        if not self.indexes_are_current():
+            self._routing_table.index_buckets_of_pools(pool_ids)
+            self._monokey_table.index_secrets_of_pools(pool_ids)
+            pass
+        storage = self._storage_table
+        with storage.db.pipeline(transaction=False) as p:
+            p.script_load(_delete_pool_script)
+            for pid in pool_ids:
+                p.get(f"{storage._pool_desc_prefix}{pid}")
+                pass
+            (sha, *vv) = p.execute()
+            pass
+        args = []
+        for (pid, v) in zip(pool_ids, vv):
+            desc = Pool_Record.decode(v)
+            if desc is not None:
+                path = desc["buckets_directory"]
+                uid = desc["owner_uid"]
+            else:
+                # A buckets-directory may remain after a failure.
+                path = storage.get_buckets_directory_of_pool(pid) or ""
+                uid = ""
+                pass
+            args.append([pid, path, uid, _STORAGE_DB, _ROUTING_DB,
+                         _MONOKEY_DB, _invalidation_channel])
+            pass
+        with storage.db.pipeline(transaction=False) as p:
+            for a in args:
+                p.evalsha(sha, 0, *a)
+                pass
+            rr = p.execute()
+            pass
+        return {pid: tuple(r) for (pid, r) in zip(pool_ids, rr)}
+
+    # Invalidation messages:
+
+    def publish_invalidation(self, kind, name):
+        self._routing_table.publish_invalidation(kind, name)
+        pass
+
+    def subscribe_invalidation(self):
+        return self._routing_table.subscribe_invalidation()
 
     # Clear tables.
 
@@ -351,6 +679,33 @@ class Table():
         self._process_table.clear_all(everything=everything)
         self._routing_table.clear_all(everything=everything)
         self._monokey_table.clear_all(everything=everything)
+        if everything:
+            self._indexes_current = False
+            pass
+        pass
+
+    def trace_databases(self, tracer):
+        """Wraps Redis clients to record calls as spans."""
+        for t in [self._setting_table, self._storage_table,
+                  self._process_table, self._routing_table,
+                  self._monokey_table]:
+            t.db = tracer.traced_redis(t.db)
+            pass
+        pass
+
+    def scan_snapshot(self, batch_size=1000):
+        """Returns an iterator of triples (kind, id, value) of entries in
+        all the databases.  It is used to take a snapshot (see
+        snapshot.py).  Kinds are: "conf", "user", "pool",
+        "pool_state", "buckets_directory", "manager", "minio_proc",
+        "mux", "minio_ep", "bucket", "access_timestamp",
+        "user_timestamp", "pool_id", and "access_key".
+        """
+        for t in [self._setting_table, self._storage_table,
+                  self._process_table, self._routing_table,
+                  self._monokey_table]:
+            yield from _scan_values(t.db, t._snapshot_decoders, batch_size)
+            pass
         pass
 
     def print_all(self):
@@ -388,6 +743,21 @@ class Table_Common():
         _wait_for_redis(self.db)
         pass
 
+    def publish_invalidation(self, kind, name):
+        """Tells the processes that cache data that an entry is created or
+        changed.  A message is "kind:name".  Channels are shared by
+        the databases in Redis.
+        """
+        self.db.publish(_invalidation_channel, f"{kind}:{name}")
+        pass
+
+    def subscribe_invalidation(self):
+        """Returns a Redis PubSub object subscribing invalidation messages.
+        """
+        p = self.db.pubsub(ignore_subscribe_messages=True)
+        p.subscribe(_invalidation_channel)
+        return p
+
     pass
 
 
@@ -395,10 +765,18 @@ class _Setting_Table(Table_Common):
     _conf_prefix = "cf:"
     _user_info_prefix = "uu:"
     _user_claim_prefix = "um:"
+    _profile_token_prefix = "pf:"
+    _index_version_key = "ix:version"
+    _index_migration_key = "ix:migration"
 
     _user_info_keys = {
         "uid", "claim", "groups", "enabled", "modification_time"}
 
+    _snapshot_decoders = {
+        _conf_prefix: ("conf", json.loads),
+        _user_info_prefix: ("user", json.loads),
+    }
+
     def _delete_claim(self, uid):
         """Deletes a claim associated to a uid.  It scans the database to find
         an entry associated to a uid.  (This is paranoiac because it
@@ -414,6 +792,19 @@ class _Setting_Table(Table_Common):
             pass
         return
 
+    def get_index_version(self):
+        v = self.db.get(self._index_version_key)
+        return int(v) if v is not None else 0
+
+    def set_index_version(self, version):
+        self.db.set(self._index_version_key, version)
+        pass
+
+    def take_index_migration(self, timeout):
+        ok = self.db.set(self._index_migration_key, os.getpid(),
+                         nx=True, ex=timeout)
+        return bool(ok)
+
     def set_conf(self, conf):
         assert "subject" in conf
         sub = conf["subject"]
@@ -508,11 +899,25 @@ class _Setting_Table(Table_Common):
         keyi = _scan_table(self.db, self._user_info_prefix, None)
         return list(keyi)
 
+    def set_profile_token(self, token, timeout):
+        """Places a one-time token to permit a profiling."""
+        key = f"{self._profile_token_prefix}{token}"
+        self.db.set(key, "1", ex=timeout)
+        pass
+
+    def take_profile_token(self, token):
+        """Consumes a one-time token.  It returns true if it existed."""
+        key = f"{self._profile_token_prefix}{token}"
+        return self.db.delete(key) == 1
+
     def clear_all(self, everything):
+        _delete_all(self.db, self._profile_token_prefix)
         if everything:
             _delete_all(self.db, self._user_info_prefix)
             _delete_all(self.db, self._user_claim_prefix)
             _delete_all(self.db, self._conf_prefix)
+            _delete_all(self.db, self._index_version_key)
+            _delete_all(self.db, self._index_migration_key)
             pass
         pass
 
@@ -527,51 +932,82 @@ class _Storage_Table(Table_Common):
     _pool_desc_prefix = "po:"
     _pool_state_prefix = "ps:"
     _buckets_directory_prefix = "bd:"
+    _user_pools_prefix = "up:"
+    _pool_expiry_key = "pe:"
 
-    # A pool description is semi-static partial state, which will be
-    # amended by such as an enabled state.
+    _snapshot_decoders = {
+        _pool_desc_prefix: ("pool", Pool_Record.decode),
+        _pool_state_prefix: ("pool_state", Pool_State_Record.decode),
+        _buckets_directory_prefix: ("buckets_directory", str),
+    }
 
-    _pool_desc_keys = {
-        "pool_name", "owner_uid", "owner_gid", "buckets_directory",
-        "probe_key", "online_status", "expiration_time", "modification_time"}
+    # A pool description is semi-static partial state, which will be
+    # amended by such as an enabled state.  See Pool_Record for the
+    # keys.  A "rate_limit" entry is optional, which is {"rate",
+    # "burst"}.  A "bandwidth" entry is optional, which is {"rate",
+    # "weight"}.  A "minio_cache" entry is optional, which is a
+    # boolean.
 
-    _pool_state_keys = {
-        "state", "reason", "modification_time"}
+    # The expiry index ("pe:") is a sorted set of pool-ids scored by
+    # expiration times.  An entry is dropped when the pool is disabled
+    # by the sweeper.
 
     def set_pool(self, pool_id, pooldesc):
-        assert set(pooldesc.keys()) == self._pool_desc_keys
         key = f"{self._pool_desc_prefix}{pool_id}"
-        v = json.dumps(pooldesc)
-        self.db.set(key, v)
+        v = encode_record(Pool_Record, pooldesc)
+        with self.db.pipeline() as p:
+            p.set(key, v)
+            p.sadd(f"{self._user_pools_prefix}{pooldesc['owner_uid']}",
+                   pool_id)
+            p.zadd(self._pool_expiry_key,
+                   {pool_id: pooldesc["expiration_time"]})
+            p.execute()
+            pass
         pass
 
     def get_pool(self, pool_id):
         key = f"{self._pool_desc_prefix}{pool_id}"
         v = self.db.get(key)
-        pooldesc = (json.loads(v)
-                    if v is not None else None)
-        return pooldesc
+        return Pool_Record.decode(v)
 
     def delete_pool(self, pool_id):
-        self.db.delete(f"{self._pool_desc_prefix}{pool_id}")
+        pooldesc = self.get_pool(pool_id)
+        with self.db.pipeline() as p:
+            p.delete(f"{self._pool_desc_prefix}{pool_id}")
+            p.zrem(self._pool_expiry_key, pool_id)
+            if pooldesc is not None:
+                p.srem(f"{self._user_pools_prefix}{pooldesc['owner_uid']}",
+                       pool_id)
+                pass
+            p.execute()
+            pass
         pass
 
     def set_pool_state(self, pool_id, state : Pool_State, reason):
+        """Stores a pool state with a version incremented, and publishes
+        it as "pool_state:pool-id/version".  It returns the version.
+        """
         assert reason is not None
-        now = int(time.time())
-        record = {"state": str(state), "reason": reason,
-                  "modification_time": now}
-        assert set(record.keys()) == self._pool_state_keys
         key = f"{self._pool_state_prefix}{pool_id}"
-        v = json.dumps(record)
-        self.db.set(key, v)
-        pass
+
+        def update(p):
+            old = Pool_State_Record.decode(p.get(key))
+            version = (old.get("version") or 0) + 1 if old is not None else 1
+            now = int(time.time())
+            record = Pool_State_Record([Pool_State_Record._version,
+                                        str(state), reason, now, version])
+            p.multi()
+            p.set(key, record.encode())
+            p.publish(_invalidation_channel,
+                      f"pool_state:{pool_id}/{version}")
+            return version
+
+        return self.db.transaction(update, key, value_from_callable=True)
 
     def get_pool_state(self, pool_id):
         key = f"{self._pool_state_prefix}{pool_id}"
         v = self.db.get(key)
-        record = (json.loads(v)
-                  if v is not None else None)
+        record = Pool_State_Record.decode(v)
         if record is not None:
             state = Pool_State(record["state"])
             reason = record["reason"]
@@ -583,6 +1019,11 @@ class _Storage_Table(Table_Common):
             pass
         return (state, reason, ts)
 
+    def get_pool_state_record(self, pool_id):
+        key = f"{self._pool_state_prefix}{pool_id}"
+        v = self.db.get(key)
+        return Pool_State_Record.decode(v)
+
     def delete_pool_state(self, pool_id):
         key = f"{self._pool_state_prefix}{pool_id}"
         self.db.delete(key)
@@ -592,6 +1033,87 @@ class _Storage_Table(Table_Common):
         keyi = _scan_table(self.db, self._pool_desc_prefix, pool_id)
         return list(keyi)
 
+    def scan_pools(self):
+        return _scan_table(self.db, self._pool_desc_prefix, None)
+
+    def list_pools_of_user(self, user_id):
+        """Returns pool-ids of a user by the index.  The index may include
+        removed pools in races.
+        """
+        return list(self.db.smembers(f"{self._user_pools_prefix}{user_id}"))
+
+    def scan_pools_of_user(self, user_id):
+        """Returns pool-ids of a user by scanning pools, used while the
+        index is not current.
+        """
+        pids = list(_scan_table(self.db, self._pool_desc_prefix, None))
+        pools = self.get_pools_in_bulk(pids) if len(pids) > 0 else {}
+        return [pid for (pid, (d, _)) in pools.items()
+                if d["owner_uid"] == user_id]
+
+    def get_pools_in_bulk(self, pool_ids):
+        """Returns a dict of pool-id to a pair of a pool record and a state
+        triple (as get_pool_state()), in one round-trip.  A missing
+        pool is dropped.
+        """
+        with self.db.pipeline(transaction=False) as p:
+            for pid in pool_ids:
+                p.get(f"{self._pool_desc_prefix}{pid}")
+                p.get(f"{self._pool_state_prefix}{pid}")
+                pass
+            vv = p.execute()
+            pass
+        pools = {}
+        for (i, pid) in enumerate(pool_ids):
+            (v, w) = (vv[2 * i], vv[2 * i + 1])
+            if v is None:
+                continue
+            r = Pool_State_Record.decode(w)
+            state = ((Pool_State(r["state"]), r["reason"],
+                      r["modification_time"])
+                     if r is not None else (None, None, None))
+            pools[pid] = (Pool_Record.decode(v), state)
+            pass
+        return pools
+
+    def rebuild_user_pools_index(self, prune):
+        index = {}
+        for pid in _scan_table(self.db, self._pool_desc_prefix, None):
+            d = self.get_pool(pid)
+            if d is not None:
+                index.setdefault(d["owner_uid"], set()).add(pid)
+                pass
+            pass
+        _rebuild_index(self.db, self._user_pools_prefix, index, prune)
+        pass
+
+    def list_expired_pools(self, now, limit):
+        """Returns at most limit pool-ids expired at the time now, by the
+        expiry index.
+        """
+        return self.db.zrangebyscore(self._pool_expiry_key, "-inf", now,
+                                     start=0, num=limit)
+
+    def drop_pool_expiry(self, pool_ids):
+        if len(pool_ids) > 0:
+            self.db.zrem(self._pool_expiry_key, *pool_ids)
+            pass
+        pass
+
+    def rebuild_pool_expiry_index(self):
+        """Adds entries missing in the expiry index.  It skips pools
+        already disabled by expiration.
+        """
+        pids = list(_scan_table(self.db, self._pool_desc_prefix, None))
+        pools = self.get_pools_in_bulk(pids) if len(pids) > 0 else {}
+        entries = {pid: d["expiration_time"]
+                   for (pid, (d, (_, reason, _))) in pools.items()
+                   if reason != Pool_Reason.POOL_EXPIRED}
+        if len(entries) > 0:
+            self.db.zadd(self._pool_expiry_key, entries, nx=True)
+            pass
+        pass
+
     def set_ex_buckets_directory(self, path, pool_id):
         """Registers atomically a directory.  At a failure, a returned current
         owner information can be None due to a race (but practically
@@ -637,8 +1159,10 @@ class _Storage_Table(Table_Common):
 
     def clear_all(self, everything):
         _delete_all(self.db, self._pool_desc_prefix)
+        _delete_all(self.db, self._pool_expiry_key)
         _delete_all(self.db, self._buckets_directory_prefix)
         _delete_all(self.db, self._pool_state_prefix)
+        _delete_all(self.db, self._user_pools_prefix)
         pass
 
     def print_all(self):
@@ -652,16 +1176,45 @@ class _Process_Table(Table_Common):
     _minio_manager_prefix = "ma:"
     _minio_process_prefix = "mn:"
     _mux_desc_prefix = "mx:"
+    _mux_registry_key = "mr:"
+    _startup_phases_prefix = "sp:"
+    _startup_record_prefix = "su:"
+    _rate_count_prefix = "rc:"
+    _mux_metrics_prefix = "mt:"
+    _cache_stats_prefix = "cs:"
+    _sweeper_lock_key = "sw:"
+    _job_prefix = "jb:"
+
+    _snapshot_decoders = {
+        _minio_manager_prefix: ("manager", Manager_Record.decode),
+        _minio_process_prefix: ("minio_proc", Minio_Proc_Record.decode),
+        _mux_desc_prefix: ("mux", Mux_Record.decode),
+    }
+
+    # Startup records are kept for the last some starts of a pool.
+    # Phases of a manager are placed temporarily and taken by a Mux.
 
-    _minio_manager_desc_keys = {
-        "mux_host", "mux_port", "start_time"}
+    _startup_record_keep = 20
+    _startup_phases_expiry = 300
 
-    _minio_process_desc_keys = {
-        "minio_ep", "minio_pid", "admin", "password",
-        "mux_host", "mux_port", "manager_pid", "modification_time"}
+    _startup_phases_keys = {"start", "phases"}
 
-    _mux_desc_keys = {
-        "host", "port", "start_time", "modification_time"}
+    _startup_record_keys = {
+        "mux", "ok", "start_time", "total", "phases"}
+
+    # See Manager_Record, Minio_Proc_Record, and Mux_Record for the
+    # keys of the records of managers, MinIO processes, and Mux'es.
+
+    _mux_metrics_keys = {
+        "mux", "pid", "interval", "time", "pools", "object_cache", "dns"}
+
+    _cache_stats_keys = {
+        "hits", "misses", "sent_bytes", "used_bytes", "total_bytes",
+        "modification_time"}
+
+    _job_keys = {
+        "owner", "op", "pool", "status", "progress", "reason",
+        "start_time", "modification_time"}
 
     def set_ex_manager(self, pool_id, desc):
         """Registers atomically a manager process.  It returns OK/NG, paired
@@ -669,9 +1222,8 @@ class _Process_Table(Table_Common):
         a failure, a returned current owner information can be None due
         to a race (but practically never).
         """
-        assert set(desc.keys()) == self._minio_manager_desc_keys
         key = f"{self._minio_manager_prefix}{pool_id}"
-        v = json.dumps(desc)
+        v = encode_record(Manager_Record, desc)
         ok = self.db.setnx(key, v)
         if ok:
             return (True, None)
@@ -688,7 +1240,7 @@ class _Process_Table(Table_Common):
     def get_manager(self, pool_id):
         key = f"{self._minio_manager_prefix}{pool_id}"
         v = self.db.get(key)
-        return json.loads(v) if v is not None else None
+        return Manager_Record.decode(v)
 
     def delete_manager(self, pool_id):
         key = f"{self._minio_manager_prefix}{pool_id}"
@@ -696,16 +1248,15 @@ class _Process_Table(Table_Common):
         pass
 
     def set_minio_proc(self, pool_id, procdesc):
-        assert set(procdesc.keys()) == self._minio_process_desc_keys
         key = f"{self._minio_process_prefix}{pool_id}"
-        v = json.dumps(procdesc)
+        v = encode_record(Minio_Proc_Record, procdesc)
         self.db.set(key, v)
         pass
 
     def get_minio_proc(self, pool_id):
         key = f"{self._minio_process_prefix}{pool_id}"
         v = self.db.get(key)
-        return json.loads(v) if v is not None else None
+        return Minio_Proc_Record.decode(v)
 
     def delete_minio_proc(self, pool_id):
         key = f"{self._minio_process_prefix}{pool_id}"
@@ -720,25 +1271,33 @@ class _Process_Table(Table_Common):
               if v is not None]
         return vv
 
-    def set_mux(self, mux_ep, mux_desc):
-        assert set(mux_desc.keys()) == self._mux_desc_keys
+    def register_mux(self, mux_ep, mux_desc, timeout):
+        """Stores a Mux description and refreshes its expiry in the
+        registry, in one round-trip.  It also drops expired entries.
+        """
         key = f"{self._mux_desc_prefix}{mux_ep}"
-        v = json.dumps(mux_desc)
-        self.db.set(key, v)
+        v = encode_record(Mux_Record, mux_desc)
+        now = time.time()
+        with self.db.pipeline() as p:
+            p.set(key, v, ex=timeout)
+            p.zadd(self._mux_registry_key, {mux_ep: now + timeout})
+            p.zremrangebyscore(self._mux_registry_key, "-inf", now)
+            p.execute()
+            pass
         pass
 
-    def set_mux_expiry(self, mux_ep, timeout):
-        key = f"{self._mux_desc_prefix}{mux_ep}"
-        return self.db.expire(key, timeout)
-
     def get_mux(self, mux_ep):
         key = f"{self._mux_desc_prefix}{mux_ep}"
         v = self.db.get(key)
-        return json.loads(v) if v is not None else None
+        return Mux_Record.decode(v)
 
     def delete_mux(self, mux_ep):
         key = f"{self._mux_desc_prefix}{mux_ep}"
-        self.db.delete(key)
+        with self.db.pipeline() as p:
+            p.delete(key)
+            p.zrem(self._mux_registry_key, mux_ep)
+            p.execute()
+            pass
         pass
 
     def list_muxs(self):
@@ -749,14 +1308,139 @@ class _Process_Table(Table_Common):
               if v is not None]
         return vv
 
+    def take_sweeper_turn(self, owner, timeout):
+        """Takes a turn to run the expiry sweeper.  It returns true when
+        no other has taken it in the timeout.  The lock is not
+        released, so that a sweep runs at most once in the timeout in
+        the site.
+        """
+        ok = self.db.set(self._sweeper_lock_key, owner, nx=True, ex=timeout)
+        return bool(ok)
+
     def list_mux_eps(self):
-        """Retruns a list of (host, port)."""
-        keyi = _scan_table(self.db, self._mux_desc_prefix, None)
-        eps = [(desc["host"], desc["port"])
-               for (_, desc) in ((ep, self.get_mux(ep)) for ep in keyi)
-               if desc is not None]
+        """Retruns a list of (host, port) of live Mux'es by the registry."""
+        now = time.time()
+        vv = self.db.zrangebyscore(self._mux_registry_key, now, "+inf")
+        eps = []
+        for ep in vv:
+            (h, _, p) = ep.rpartition(":")
+            eps.append((h.strip("[]"), int(p)))
+            pass
         return sorted(eps)
 
+    def set_startup_phases(self, pool_id, record):
+        """Places the phases of a manager which are merged by a Mux into
+        a startup record.
+        """
+        assert set(record.keys()) == self._startup_phases_keys
+        key = f"{self._startup_phases_prefix}{pool_id}"
+        v = json.dumps(record)
+        self.db.set(key, v, ex=self._startup_phases_expiry)
+        pass
+
+    def take_startup_phases(self, pool_id):
+        """Gets and removes the phases of a manager."""
+        key = f"{self._startup_phases_prefix}{pool_id}"
+        with self.db.pipeline() as p:
+            p.get(key)
+            p.delete(key)
+            (v, _) = p.execute()
+            pass
+        return json.loads(v) if v is not None else None
+
+    def add_startup_record(self, pool_id, record):
+        """Adds a startup record in a list, which keeps the last ones."""
+        assert set(record.keys()) == self._startup_record_keys
+        key = f"{self._startup_record_prefix}{pool_id}"
+        v = json.dumps(record, separators=(",", ":"))
+        with self.db.pipeline() as p:
+            p.lpush(key, v)
+            p.ltrim(key, 0, self._startup_record_keep - 1)
+            p.execute()
+            pass
+        pass
+
+    def get_startup_records(self, pool_id):
+        """Returns startup records of a pool, the newest first."""
+        key = f"{self._startup_record_prefix}{pool_id}"
+        vv = self.db.lrange(key, 0, -1)
+        return [json.loads(v) for v in vv]
+
+    def list_startup_records(self):
+        """Returns a list of (pool_id, records) of all pools."""
+        keyi = _scan_table(self.db, self._startup_record_prefix, None)
+        vv = [(i, v)
+              for (i, v)
+              in ((i, self.get_startup_records(i)) for i in keyi)
+              if v != []]
+        return vv
+
+    def set_mux_metrics(self, worker, record, expiry):
+        """Stores metrics of a Mux worker, where a worker is "ep:pid"."""
+        assert set(record.keys()) == self._mux_metrics_keys
+        key = f"{self._mux_metrics_prefix}{worker}"
+        v = json.dumps(record, separators=(",", ":"))
+        self.db.set(key, v, ex=expiry)
+        pass
+
+    def list_mux_metrics(self):
+        """Returns a list of metrics records of Mux workers."""
+        keyi = _scan_table(self.db, self._mux_metrics_prefix, None)
+        vv = (self.db.get(f"{self._mux_metrics_prefix}{i}") for i in keyi)
+        return [json.loads(v) for v in vv if v is not None]
+
+    def set_cache_stats(self, pool_id, record, expiry):
+        """Stores statistics of a MinIO disk cache of a pool."""
+        assert set(record.keys()) == self._cache_stats_keys
+        key = f"{self._cache_stats_prefix}{pool_id}"
+        v = json.dumps(record, separators=(",", ":"))
+        self.db.set(key, v, ex=expiry)
+        pass
+
+    def list_cache_stats(self):
+        """Returns a list of (pool_id, record) of cache statistics."""
+        keyi = _scan_table(self.db, self._cache_stats_prefix, None)
+        vv = ((i, self.db.get(f"{self._cache_stats_prefix}{i}"))
+              for i in keyi)
+        return [(i, json.loads(v)) for (i, v) in vv if v is not None]
+
+    def set_job(self, job_id, record, expiry):
+        """Stores a status of an asynchronous job of Api.  A record is
+        rewritten at each step of a job, and it expires after a job
+        finishes.
+        """
+        assert set(record.keys()) == self._job_keys
+        key = f"{self._job_prefix}{job_id}"
+        v = json.dumps(record, separators=(",", ":"))
+        self.db.set(key, v, ex=expiry)
+        pass
+
+    def get_job(self, job_id):
+        key = f"{self._job_prefix}{job_id}"
+        v = self.db.get(key)
+        return json.loads(v) if v is not None else None
+
+    def exchange_rate_counts(self, epoch, counts, names, expiry):
+        """Adds counts of requests in an epoch, and returns the totals of
+        the names in the previous epoch.  It is done in one round-trip.
+        A key is "rc:name:epoch".
+        """
+        prefix = self._rate_count_prefix
+        with self.db.pipeline(transaction=False) as p:
+            for (name, n) in counts.items():
+                key = f"{prefix}{name}:{epoch}"
+                p.incrby(key, n)
+                p.expire(key, expiry)
+                pass
+            for name in names:
+                p.get(f"{prefix}{name}:{epoch - 1}")
+                pass
+            vv = p.execute()
+            pass
+        vv = vv[2 * len(counts):]
+        return {name: (int(v) if v is not None else 0)
+                for (name, v) in zip(names, vv)}
+
     def clear_all(self, everything):
         """Clears Redis DB.  It leaves entires for multiplexers unless
         everything.
@@ -764,6 +1448,14 @@ class _Process_Table(Table_Common):
         _delete_all(self.db, self._minio_manager_prefix)
         _delete_all(self.db, self._minio_process_prefix)
         _delete_all(self.db, self._mux_desc_prefix)
+        _delete_all(self.db, self._mux_registry_key)
+        _delete_all(self.db, self._startup_phases_prefix)
+        _delete_all(self.db, self._startup_record_prefix)
+        _delete_all(self.db, self._rate_count_prefix)
+        _delete_all(self.db, self._mux_metrics_prefix)
+        _delete_all(self.db, self._cache_stats_prefix)
+        _delete_all(self.db, self._sweeper_lock_key)
+        _delete_all(self.db, self._job_prefix)
         pass
 
     def print_all(self):
@@ -776,10 +1468,18 @@ class _Process_Table(Table_Common):
 class _Routing_Table(Table_Common):
     _minio_ep_prefix = "ep:"
     _bucket_prefix = "bk:"
+    _pool_buckets_prefix = "pb:"
     _access_timestamp_prefix = "ts:"
     _user_timestamp_prefix = "us:"
 
-    _bucket_desc_keys = {"pool", "bkt_policy", "modification_time"}
+    _snapshot_decoders = {
+        _minio_ep_prefix: ("minio_ep", str),
+        _bucket_prefix: ("bucket", Bucket_Record.decode),
+        _access_timestamp_prefix: ("access_timestamp", int),
+        _user_timestamp_prefix: ("user_timestamp", int),
+    }
+
+    # See Bucket_Record for the keys of a bucket record.
 
     def set_minio_ep(self, pool_id, ep):
         assert isinstance(ep, str)
@@ -810,34 +1510,127 @@ class _Routing_Table(Table_Common):
         a failure, a returned current owner information can be None due
         to a race (but practically never).
         """
-        assert set(desc.keys()) == self._bucket_desc_keys
         key = f"{self._bucket_prefix}{bucket}"
-        v = json.dumps(desc)
+        v = encode_record(Bucket_Record, desc)
         ok = self.db.setnx(key, v)
         if ok:
+            self.db.sadd(f"{self._pool_buckets_prefix}{desc['pool']}", bucket)
+            self.publish_invalidation("bucket", bucket)
             return (True, None)
         # Race, returns failure.
         o = self.get_bucket(bucket)
         return (False, o.get("pool") if o is not None else None)
 
+    def set_ex_buckets(self, descs):
+        """Registers buckets as set_ex_bucket() in bulk, in two or three
+        round-trips.  It returns a dict of a bucket to a pair as
+        set_ex_bucket().
+        """
+        names = list(descs.keys())
+        with self.db.pipeline(transaction=False) as p:
+            for b in names:
+                p.setnx(f"{self._bucket_prefix}{b}",
+                        encode_record(Bucket_Record, descs[b]))
+                pass
+            oks = p.execute()
+            pass
+        with self.db.pipeline(transaction=False) as p:
+            for (b, ok) in zip(names, oks):
+                if ok:
+                    pool = descs[b]["pool"]
+                    p.sadd(f"{self._pool_buckets_prefix}{pool}", b)
+                    p.publish(_invalidation_channel, f"bucket:{b}")
+                    pass
+                pass
+            p.execute()
+            pass
+        failed = [b for (b, ok) in zip(names, oks) if not ok]
+        holders = (self.db.mget([f"{self._bucket_prefix}{b}" for b in failed])
+                   if len(failed) > 0 else [])
+        results = {b: (True, None) for (b, ok) in zip(names, oks) if ok}
+        for (b, v) in zip(failed, holders):
+            o = Bucket_Record.decode(v)
+            results[b] = (False, o.get("pool") if o is not None else None)
+            pass
+        return results
+
     def get_bucket(self, bucket):
         key = f"{self._bucket_prefix}{bucket}"
         v = self.db.get(key)
-        return json.loads(v) if v is not None else None
+        return Bucket_Record.decode(v)
 
     def delete_bucket(self, bucket):
         key = f"{self._bucket_prefix}{bucket}"
-        self.db.delete(key)
+        desc = self.get_bucket(bucket)
+        with self.db.pipeline() as p:
+            p.delete(key)
+            if desc is not None:
+                p.srem(f"{self._pool_buckets_prefix}{desc['pool']}", bucket)
+                pass
+            p.execute()
+            pass
         pass
 
     def list_buckets(self, pool_id):
+        """Lists buckets of a pool by the index, or all buckets by scanning
+        when pool-id is None.
+        """
+        if pool_id is not None:
+            return self.list_buckets_of_pools([pool_id])[pool_id]
         keyi = _scan_table(self.db, self._bucket_prefix, None)
         bkts = [{"name": name, **d}
                 for (name, d)
                 in [(i, self.get_bucket(i)) for i in keyi]
-                if (d is not None
-                    and (pool_id is None or d.get("pool") == pool_id))]
+                if d is not None]
         return bkts
+
+    def list_buckets_of_pools(self, pool_ids):
+        """Returns a dict of pool-id to a list of buckets.  It takes two
+        round-trips, for the index and the records.
+        """
+        with self.db.pipeline(transaction=False) as p:
+            for pid in pool_ids:
+                p.smembers(f"{self._pool_buckets_prefix}{pid}")
+                pass
+            names = p.execute()
+            pass
+        pairs = [(pid, b) for (pid, bb) in zip(pool_ids, names) for b in bb]
+        keys = [f"{self._bucket_prefix}{b}" for (_, b) in pairs]
+        vv = self.db.mget(keys) if len(keys) > 0 else []
+        bkts = {pid: [] for pid in pool_ids}
+        for ((pid, b), v) in zip(pairs, vv):
+            d = Bucket_Record.decode(v)
+            if d is not None and d.get("pool") == pid:
+                bkts[pid].append({"name": b, **d})
+                pass
+            pass
+        return bkts
+
+    def scan_buckets_of_pools(self, pool_ids):
+        """Returns a dict of pool-id to a list of buckets by scanning
+        buckets, used while the index is not current.
+        """
+        bkts = {pid: [] for pid in pool_ids}
+        for b in self.list_buckets(None):
+            if b.get("pool") in bkts:
+                bkts[b["pool"]].append(b)
+                pass
+            pass
+        return bkts
+
+    def index_buckets_of_pools(self, pool_ids):
+        """Adds index entries of buckets of the pools."""
+        bkts = self.scan_buckets_of_pools(pool_ids)
+        index = {pid: {b["name"] for b in bb} for (pid, bb) in bkts.items()}
+        _rebuild_index(self.db, self._pool_buckets_prefix, index, False)
+        pass
+
+    def rebuild_pool_buckets_index(self, prune):
+        index = {}
+        for b in self.list_buckets(None):
+            index.setdefault(b["pool"], set()).add(b["name"])
+            pass
+        _rebuild_index(self.db, self._pool_buckets_prefix, index, prune)
         pass
 
     def set_access_timestamp(self, pool_id):
@@ -895,6 +1688,7 @@ class _Routing_Table(Table_Common):
     def clear_all(self, everything):
         _delete_all(self.db, self._minio_ep_prefix)
         _delete_all(self.db, self._bucket_prefix)
+        _delete_all(self.db, self._pool_buckets_prefix)
         _delete_all(self.db, self._access_timestamp_prefix)
         _delete_all(self.db, self._user_timestamp_prefix)
         pass
@@ -911,16 +1705,21 @@ class _Monokey_Table(Table_Common):
 
     _pid_prefix = "pi:"
     _key_prefix = "ky:"
+    _pool_keys_prefix = "pk:"
+    _key_expiry_key = "ke:"
 
-    _pid_desc_keys = {"owner", "modification_time"}
-    _key_desc_keys = {"owner", "secret_key", "key_policy",
-                      "expiration_time", "modification_time"}
+    _snapshot_decoders = {
+        _pid_prefix: ("pool_id", Pool_Id_Record.decode),
+        _key_prefix: ("access_key", Access_Key_Record.decode),
+    }
+
+    # See Pool_Id_Record and Access_Key_Record for the keys.
 
     def _choose_prefix_by_usage(self, usage):
         if usage == "pool":
-            return (self._pid_prefix, self._pid_desc_keys)
+            return (self._pid_prefix, Pool_Id_Record)
         elif usage == "akey":
-            return (self._key_prefix, self._key_desc_keys)
+            return (self._key_prefix, Access_Key_Record)
         else:
             assert usage in self._usage_keys
             return (None, None)
@@ -931,7 +1730,7 @@ class _Monokey_Table(Table_Common):
         access-key (usage="akey").
         """
         assert usage in self._usage_keys
-        (prefix, desckeys) = self._choose_prefix_by_usage(usage)
+        (prefix, record) = self._choose_prefix_by_usage(usage)
         now = int(time.time())
         if usage == "pool":
             assert len(info) == 0
@@ -943,14 +1742,15 @@ class _Monokey_Table(Table_Common):
             assert usage in self._usage_keys
             desc = {}
             pass
-        assert set(desc.keys()) == desckeys
-        v = json.dumps(desc)
+        v = encode_record(record, desc)
         xid_generation_loops = 0
         while True:
             xid = generate_access_key()
             key = f"{prefix}{xid}"
             ok = self.db.setnx(key, v)
             if ok:
+                self._add_key_to_index(usage, xid, desc)
+                self.publish_invalidation(usage, xid)
                 return xid
             xid_generation_loops += 1
             assert xid_generation_loops < _limit_of_xid_generation_loop
@@ -960,28 +1760,95 @@ class _Monokey_Table(Table_Common):
 
     def set_ex_xid(self, xid, usage, desc):
         assert usage in self._usage_keys
-        (prefix, desckeys) = self._choose_prefix_by_usage(usage)
-        assert set(desc.keys()) == desckeys
+        (prefix, record) = self._choose_prefix_by_usage(usage)
         key = f"{prefix}{xid}"
-        v = json.dumps(desc)
+        v = encode_record(record, desc)
         ok = self.db.setnx(key, v)
+        if ok:
+            self._add_key_to_index(usage, xid, desc)
+            self.publish_invalidation(usage, xid)
+            pass
         return ok
 
+    def set_ex_xids(self, usage, descs):
+        """Inserts ids as set_ex_xid() in bulk, in two or three
+        round-trips.  It returns a dict of an id to a pair of OK/NG
+        and an owner of an existing id when it fails.
+        """
+        assert usage in self._usage_keys
+        (prefix, record) = self._choose_prefix_by_usage(usage)
+        xids = list(descs.keys())
+        with self.db.pipeline(transaction=False) as p:
+            for xid in xids:
+                p.setnx(f"{prefix}{xid}", encode_record(record, descs[xid]))
+                pass
+            oks = p.execute()
+            pass
+        with self.db.pipeline(transaction=False) as p:
+            for (xid, ok) in zip(xids, oks):
+                if ok:
+                    if usage == "akey":
+                        d = descs[xid]
+                        p.sadd(f"{self._pool_keys_prefix}{d['owner']}", xid)
+                        if d["secret_key"] != "":
+                            p.zadd(self._key_expiry_key,
+                                   {xid: d["expiration_time"]})
+                            pass
+                        pass
+                    p.publish(_invalidation_channel, f"{usage}:{xid}")
+                    pass
+                pass
+            p.execute()
+            pass
+        failed = [xid for (xid, ok) in zip(xids, oks) if not ok]
+        holders = (self.db.mget([f"{prefix}{xid}" for xid in failed])
+                   if len(failed) > 0 else [])
+        results = {xid: (True, None) for (xid, ok) in zip(xids, oks) if ok}
+        for (xid, v) in zip(failed, holders):
+            o = record.decode(v)
+            results[xid] = (False, o.get("owner") if o is not None else None)
+            pass
+        return results
+
+    def _add_key_to_index(self, usage, xid, desc):
+        """Adds an access-key to the index of a pool and to the expiry
+        index.  A probe-key (with an empty secret) is not in the
+        expiry index, because it is removed with the pool.
+        """
+        if usage == "akey":
+            with self.db.pipeline() as p:
+                p.sadd(f"{self._pool_keys_prefix}{desc['owner']}", xid)
+                if desc["secret_key"] != "":
+                    p.zadd(self._key_expiry_key,
+                           {xid: desc["expiration_time"]})
+                    pass
+                p.execute()
+                pass
+            pass
+        pass
+
     def get_xid(self, usage, xid):
         assert usage in self._usage_keys
-        (prefix, desckeys) = self._choose_prefix_by_usage(usage)
+        (prefix, record) = self._choose_prefix_by_usage(usage)
         key = f"{prefix}{xid}"
         v = self.db.get(key)
-        desc = json.loads(v) if v is not None else None
-        assert (set(desc.keys()) == desckeys
-                if desc is not None else True)
-        return desc
+        return record.decode(v)
 
     def delete_xid_unconditionally(self, usage, xid):
         assert usage in self._usage_keys
-        (prefix, desckeys) = self._choose_prefix_by_usage(usage)
+        (prefix, _) = self._choose_prefix_by_usage(usage)
         key = f"{prefix}{xid}"
-        self.db.delete(key)
+        desc = self.get_xid(usage, xid) if usage == "akey" else None
+        with self.db.pipeline() as p:
+            p.delete(key)
+            if usage == "akey":
+                p.zrem(self._key_expiry_key, xid)
+                pass
+            if desc is not None:
+                p.srem(f"{self._pool_keys_prefix}{desc['owner']}", xid)
+                pass
+            p.execute()
+            pass
         pass
 
     def list_secrets_of_pool(self, pool_id):
@@ -989,15 +1856,97 @@ class _Monokey_Table(Table_Common):
         A probe-key is an access-key but has no corresponding
         secret-key.
         """
-        keyi = _scan_table(self.db, self._key_prefix, None)
-        keys = [{"access_key": i, **d}
-                for (i, d) in [(i, self.get_xid("akey", i)) for i in keyi]
-                if (d is not None and d["owner"] == pool_id)]
-        return keys
+        return self.list_secrets_of_pools([pool_id])[pool_id]
+
+    def list_secrets_of_pools(self, pool_ids):
+        """Returns a dict of pool-id to a list of secrets.  It takes two
+        round-trips, for the index and the records.
+        """
+        with self.db.pipeline(transaction=False) as p:
+            for pid in pool_ids:
+                p.smembers(f"{self._pool_keys_prefix}{pid}")
+                pass
+            names = p.execute()
+            pass
+        pairs = [(pid, k) for (pid, kk) in zip(pool_ids, names) for k in kk]
+        keys = [f"{self._key_prefix}{k}" for (_, k) in pairs]
+        vv = self.db.mget(keys) if len(keys) > 0 else []
+        secrets = {pid: [] for pid in pool_ids}
+        for ((pid, k), v) in zip(pairs, vv):
+            d = Access_Key_Record.decode(v)
+            if d is not None and d["owner"] == pid:
+                secrets[pid].append({"access_key": k, **d})
+                pass
+            pass
+        return secrets
+
+    def scan_secrets_of_pools(self, pool_ids):
+        """Returns a dict of pool-id to a list of secrets by scanning
+        access-keys, used while the index is not current.
+        """
+        secrets = {pid: [] for pid in pool_ids}
+        for k in _scan_table(self.db, self._key_prefix, None):
+            d = self.get_xid("akey", k)
+            if d is not None and d["owner"] in secrets:
+                secrets[d["owner"]].append({"access_key": k, **d})
+                pass
+            pass
+        return secrets
+
+    def index_secrets_of_pools(self, pool_ids):
+        """Adds index entries of access-keys of the pools."""
+        secrets = self.scan_secrets_of_pools(pool_ids)
+        index = {pid: {k["access_key"] for k in kk}
+                 for (pid, kk) in secrets.items()}
+        _rebuild_index(self.db, self._pool_keys_prefix, index, False)
+        pass
+
+    def rebuild_pool_keys_index(self, prune):
+        index = {}
+        for k in _scan_table(self.db, self._key_prefix, None):
+            d = self.get_xid("akey", k)
+            if d is not None:
+                index.setdefault(d["owner"], set()).add(k)
+                pass
+            pass
+        _rebuild_index(self.db, self._pool_keys_prefix, index, prune)
+        pass
+
+    def list_expired_keys(self, now, limit):
+        """Returns at most limit pairs of an access-key and its record,
+        which are expired at the time now, by the expiry index.  It
+        drops entries of removed keys from the index.
+        """
+        xids = self.db.zrangebyscore(self._key_expiry_key, "-inf", now,
+                                     start=0, num=limit)
+        keys = [f"{self._key_prefix}{xid}" for xid in xids]
+        vv = self.db.mget(keys) if len(keys) > 0 else []
+        pairs = [(xid, Access_Key_Record.decode(v))
+                 for (xid, v) in zip(xids, vv)]
+        stale = [xid for (xid, d) in pairs if d is None]
+        if len(stale) > 0:
+            self.db.zrem(self._key_expiry_key, *stale)
+            pass
+        return [(xid, d) for (xid, d) in pairs if d is not None]
+
+    def rebuild_key_expiry_index(self):
+        entries = {}
+        for k in _scan_table(self.db, self._key_prefix, None):
+            d = self.get_xid("akey", k)
+            if d is not None and d["secret_key"] != "":
+                entries[k] = d["expiration_time"]
+                pass
+            pass
+        if len(entries) > 0:
+            self.db.zadd(self._key_expiry_key, entries, nx=True)
+            pass
+        pass
 
     def clear_all(self, everything):
         _delete_all(self.db, self._pid_prefix)
         _delete_all(self.db, self._key_prefix)
+        _delete_all(self.db, self._key_expiry_key)
+        _delete_all(self.db, self._pool_keys_prefix)
         pass
 
     def print_all(self):
@@ -0,0 +1,83 @@
+"""Penalties on bad requests.  A tracker counts bad requests by a key
+(a client address or an access-key), and returns a delay which
+escalates with repeated bad requests.  Lens3-Api delays a bad
+response by an async timer.  Lens3-Mux does not delay, but it rejects
+requests from a penalized client quickly until the delay passes,
+because a delay would occupy a worker thread.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# A delay is (bad_response_delay * bad_response_escalation^(n-1)) for
+# the n-th bad request, and it is capped by bad_response_delay_max.
+# A count is forgotten after bad_response_window seconds without bad
+# requests.  Trackers are local to a worker process.
+
+import collections
+import threading
+import time
+
+
+class Penalty_Tracker():
+    """Counts bad requests by keys.  It keeps a bounded number of keys
+    and drops the least recently penalized ones.
+    """
+
+    def __init__(self, delay, max_delay, escalation, window,
+                 capacity=10000):
+        self._delay = delay
+        self._max_delay = max(delay, max_delay)
+        self._escalation = max(1.0, escalation)
+        self._window = window
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        # A key maps to [count, last-time, penalized-until].
+        self._penalties = collections.OrderedDict()
+        pass
+
+    def penalize(self, key, now=None):
+        """Counts a bad request and returns a delay in seconds."""
+        if key is None or self._delay <= 0:
+            return 0
+        now = time.time() if now is None else now
+        with self._lock:
+            e = self._penalties.pop(key, None)
+            if e is None or now - e[1] > self._window:
+                e = [0, now, now]
+                pass
+            e[0] += 1
+            e[1] = now
+            delay = min(self._max_delay,
+                        self._delay * (self._escalation ** (e[0] - 1)))
+            e[2] = now + delay
+            self._penalties[key] = e
+            while len(self._penalties) > self._capacity:
+                self._penalties.popitem(last=False)
+                pass
+            pass
+        return delay
+
+    def remaining(self, key, now=None):
+        """Returns seconds until a penalty on a key passes, or zero."""
+        if key is None:
+            return 0
+        now = time.time() if now is None else now
+        e = self._penalties.get(key)
+        if e is None:
+            return 0
+        return max(0, e[2] - now)
+
+    pass
+
+
+def make_penalty_tracker(param):
+    """Makes a tracker by the settings in the "multiplexer" or the
+    "controller" section of a conf.  Only bad_response_delay is taken
+    when the others are missing, and then, the delay is constant.
+    """
+    delay = float(param.get("bad_response_delay", 1))
+    return Penalty_Tracker(delay,
+                           float(param.get("bad_response_delay_max", delay)),
+                           float(param.get("bad_response_escalation", 1)),
+                           float(param.get("bad_response_window", 600)))
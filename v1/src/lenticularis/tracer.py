@@ -0,0 +1,352 @@
+"""Span tracing.  A span is a named and timed section in a request,
+such as a Redis call, a MinIO start, an mc command, or forwarding to
+MinIO.  Spans of a trace are collected until the root span finishes,
+and then, sampled traces are put in a ring buffer.  They are exported
+periodically in the Zipkin v2 json format to a file (one json array
+per line) or to a collector.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# A trace-id is taken from X-TRACEID, which is also used to decorate
+# log messages.  It is rehashed when it is not 16 or 32 hex digits as
+# Zipkin requires.  Tracing is disabled without a "tracing" section in
+# a conf, and then, span() returns a dummy span that does nothing.
+
+import atexit
+import collections
+import contextvars
+import hashlib
+import json
+import random
+import string
+import threading
+import time
+from urllib.request import Request, urlopen
+from lenticularis.utility import rephrase_exception_message
+from lenticularis.utility import logger
+
+
+_current_span = contextvars.ContextVar("lens3_span", default=None)
+
+
+def _make_span_id():
+    return f"{random.getrandbits(64):016x}"
+
+
+def _make_trace_id(traceid):
+    """Returns a trace-id for Zipkin.  It uses an X-TRACEID if it is
+    usable as it is.
+    """
+    if traceid is None or traceid == "":
+        return f"{random.getrandbits(128):032x}"
+    elif (len(traceid) in {16, 32}
+          and all(c in string.hexdigits for c in traceid)):
+        return traceid.lower()
+    else:
+        return hashlib.md5(traceid.encode()).hexdigest()
+    pass
+
+
+class _Null_Span():
+    """A span doing nothing, used when tracing is disabled or a request
+    is not sampled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def set_tag(self, key, value):
+        pass
+
+    pass
+
+
+_null_span = _Null_Span()
+
+
+class _Trace():
+    """Spans of a trace.  Spans are kept until the root finishes."""
+
+    __slots__ = ("tracer", "trace_id", "sampled", "root", "spans")
+
+    def __init__(self, tracer, trace_id, sampled):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.root = None
+        self.spans = []
+        pass
+
+    pass
+
+
+class Span():
+    """A timed section.  It is used as a context manager.  A span sets
+    itself as the current span while it is active.
+    """
+
+    __slots__ = ("_trace", "name", "kind", "span_id", "parent_id",
+                 "start", "duration", "tags", "_token")
+
+    def __init__(self, trace, name, parent_id, kind, tags):
+        self._trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = _make_span_id()
+        self.parent_id = parent_id
+        self.start = 0
+        self.duration = 0
+        self.tags = {k: str(v) for (k, v) in tags.items()}
+        self._token = None
+        pass
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.duration = time.time() - self.start
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+            pass
+        _current_span.reset(self._token)
+        trace = self._trace
+        trace.spans.append(self)
+        if self is trace.root:
+            trace.tracer._finish_trace(trace)
+            pass
+        return False
+
+    def set_tag(self, key, value):
+        self.tags[key] = str(value)
+        pass
+
+    def zipkin(self, service):
+        """Returns a span in the Zipkin v2 format."""
+        d = {"traceId": self._trace.trace_id,
+             "id": self.span_id,
+             "name": self.name,
+             "timestamp": int(self.start * 1000000),
+             "duration": max(1, int(self.duration * 1000000)),
+             "localEndpoint": {"serviceName": service},
+             "tags": self.tags}
+        if self.parent_id is not None:
+            d["parentId"] = self.parent_id
+            pass
+        if self.kind is not None:
+            d["kind"] = self.kind
+            pass
+        return d
+
+    pass
+
+
+class Tracer():
+    """A recorder of spans.  It is configured by a "tracing" section of
+    a conf.  It keeps a trace when it is head-sampled (by sample_rate)
+    or when it takes longer than slow_threshold (in seconds).
+    """
+
+    def __init__(self):
+        self._enabled = False
+        self._service = "lens3"
+        self._sample_rate = 0.0
+        self._slow_threshold = None
+        self._export_file = None
+        self._export_url = None
+        self._export_interval = 10
+        self._export_timeout = 10
+        self._ring = collections.deque(maxlen=10000)
+        self._dropped = 0
+        self._exporter = None
+        pass
+
+    def configure(self, conf, service):
+        """Enables tracing by a "tracing" section of a conf.  It is called
+        in each worker process, because it starts an exporter thread.
+        """
+        if conf is None:
+            self._enabled = False
+            return
+        self._service = service
+        self._sample_rate = float(conf.get("sample_rate", 0.0))
+        slow = conf.get("slow_threshold")
+        self._slow_threshold = float(slow) if slow is not None else None
+        self._ring = collections.deque(maxlen=int(conf.get("buffer_size",
+                                                           10000)))
+        self._export_file = conf.get("export_file")
+        self._export_url = conf.get("export_url")
+        self._export_interval = int(conf.get("export_interval", 10))
+        self._enabled = True
+        if self._export_file is not None or self._export_url is not None:
+            self._exporter = threading.Thread(target=self._export_loop,
+                                              daemon=True)
+            self._exporter.start()
+            atexit.register(self.flush)
+            pass
+        pass
+
+    def enabled(self):
+        return self._enabled
+
+    def trace(self, name, traceid, *, kind=None, **tags):
+        """Starts a root span of a trace.  It returns a dummy span when a
+        trace would not be recorded.
+        """
+        if not self._enabled:
+            return _null_span
+        sampled = (random.random() < self._sample_rate)
+        if not sampled and self._slow_threshold is None:
+            return _null_span
+        trace = _Trace(self, _make_trace_id(traceid), sampled)
+        span = Span(trace, name, None, kind, tags)
+        trace.root = span
+        if traceid is not None:
+            span.tags["lens3.traceid"] = traceid
+            pass
+        return span
+
+    def span(self, name, *, kind=None, **tags):
+        """Starts a child span of the current span.  It returns a dummy
+        span outside of a trace.
+        """
+        if not self._enabled:
+            return _null_span
+        parent = _current_span.get()
+        if parent is None:
+            return _null_span
+        return Span(parent._trace, name, parent.span_id, kind, tags)
+
+    def current_span(self):
+        """Returns the current span or a dummy span."""
+        span = _current_span.get() if self._enabled else None
+        return span if span is not None else _null_span
+
+    def _finish_trace(self, trace):
+        keep = (trace.sampled
+                or (self._slow_threshold is not None
+                    and trace.root.duration >= self._slow_threshold))
+        if not keep:
+            return
+        for span in trace.spans:
+            if len(self._ring) == self._ring.maxlen:
+                self._dropped += 1
+                pass
+            self._ring.append(span.zipkin(self._service))
+            pass
+        pass
+
+    def take_spans(self):
+        """Takes out the spans in the ring buffer."""
+        spans = []
+        while True:
+            try:
+                spans.append(self._ring.popleft())
+            except IndexError:
+                break
+            pass
+        return spans
+
+    def flush(self):
+        spans = self.take_spans()
+        if spans == []:
+            return
+        try:
+            if self._export_file is not None:
+                with open(self._export_file, "a") as f:
+                    f.write(json.dumps(spans, separators=(",", ":")) + "\n")
+                    pass
+                pass
+            if self._export_url is not None:
+                data = json.dumps(spans).encode()
+                req = Request(self._export_url, data=data, method="POST",
+                              headers={"Content-Type": "application/json"})
+                with urlopen(req, timeout=self._export_timeout) as res:
+                    res.read()
+                    pass
+                pass
+        except Exception as e:
+            m = rephrase_exception_message(e)
+            logger.warning(f"Exporting trace spans failed (dropped):"
+                           f" count={len(spans)}; exception=({m})")
+            pass
+        pass
+
+    def _export_loop(self):
+        while True:
+            time.sleep(self._export_interval)
+            self.flush()
+            if self._dropped > 0:
+                logger.warning(f"Trace spans dropped on overflow:"
+                               f" count={self._dropped}")
+                self._dropped = 0
+                pass
+            pass
+        pass
+
+    def traced_redis(self, db):
+        """Wraps a Redis client to make a span for a call."""
+        return _Traced_Redis(db, self)
+
+    pass
+
+
+def _trace_pipeline(pipeline, tracer):
+    """Makes a span at execution of a Redis pipeline.  It wraps the
+    method of a pipeline object in place, so that a pipeline is still
+    an instance of redis.client.Pipeline (redis-py checks it, for
+    example, to load scripts in a pipeline).
+    """
+    execute = pipeline.execute
+
+    def traced_execute(*args, **kwargs):
+        n = len(pipeline.command_stack)
+        with tracer.span("redis.pipeline", kind="CLIENT", commands=n):
+            return execute(*args, **kwargs)
+        pass
+
+    pipeline.execute = traced_execute
+    return pipeline
+
+
+class _Traced_Redis():
+    """A proxy of a Redis client.  It makes a span for a command."""
+
+    def __init__(self, db, tracer):
+        self._db = db
+        self._tracer = tracer
+        self._wrappers = {}
+        pass
+
+    def __getattr__(self, name):
+        w = self._wrappers.get(name)
+        if w is not None:
+            return w
+        attr = getattr(self._db, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        tracer = self._tracer
+        if name == "pipeline":
+            def w(*args, **kwargs):
+                return _trace_pipeline(attr(*args, **kwargs), tracer)
+        else:
+            spanname = f"redis.{name}"
+
+            def w(*args, **kwargs):
+                with tracer.span(spanname, kind="CLIENT"):
+                    return attr(*args, **kwargs)
+                pass
+            pass
+        self._wrappers[name] = w
+        return w
+
+    pass
+
+
+tracer = Tracer()
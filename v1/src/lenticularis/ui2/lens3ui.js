@@ -426,7 +426,10 @@ function api_make_pool(directory, gid) {
                 "owner_gid": gid};
   const body = JSON.stringify(args);
   const triple = {method, path, body};
-  return submit_request(msg, triple, set_pool_data);
+  return submit_request(msg, triple, (data) => {
+    set_pool_data(data);
+    poll_job(data["job_id"], set_pool_data);
+  });
 }
 
 function api_delete_pool(i) {
@@ -439,7 +442,44 @@ function api_delete_pool(i) {
   const args = {};
   const body = JSON.stringify(args);
   const triple = {method, path, body};
-  return submit_request(msg, triple, (data) => {api_list_pools();});
+  return submit_request(msg, triple, (data) => {
+    poll_job(data["job_id"], (data) => {api_list_pools();});
+  });
+}
+
+// Polls a job of a slow operation (making or deleting a pool) until
+// it finishes, then calls process_response with the job status.  A
+// failed job is shown as a message.  It gives up after some attempts
+// (5 minutes).
+
+const job_poll_interval = 2000;
+const job_poll_limit = 150;
+
+function poll_job(job_id, process_response, attempts = 0) {
+  const msg = "job";
+  if (attempts >= job_poll_limit) {
+    show_message(null, msg + " " + job_id + " ... no response, gave up");
+    return;
+  }
+  const method = "GET";
+  const path = (base_path_ + "/job/" + job_id);
+  const body = null;
+  const triple = {method, path, body};
+  setTimeout(() => {
+    submit_request(msg, triple, (data) => {
+      const job = data["job"];
+      if (job["status"] == "succeeded") {
+        process_response(data);
+      } else if (job["status"] == "failed") {
+        show_message(data, msg + " " + job["op"] + " failed: "
+                     + job["reason"]);
+      } else {
+        show_message(data, msg + " " + job["op"] + " ... "
+                     + job["progress"]);
+        poll_job(job_id, process_response, attempts + 1);
+      }
+    });
+  }, job_poll_interval);
 }
 
 function run_edit_pool(i) {
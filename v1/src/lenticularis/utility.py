@@ -3,9 +3,14 @@
 # Copyright (c) 2022-2023 RIKEN R-CCS
 # SPDX-License-Identifier: BSD-2-Clause
 
+import atexit
 import codecs
 import hashlib
+import json
+import os
 import platform
+import queue
+import threading
 import random
 import string
 import time
@@ -33,6 +38,15 @@ ERROR_EXIT_ARGUMENT = 126
 _ACCESS_KEY_LEN = 20
 _SECRET_KEY_LEN = 48
 
+# Logging goes through a queue to a writer thread by default.  A
+# queue size zero makes logging synchronous.
+
+_log_queue_size_default = 10000
+_log_batch_size = 256
+_log_drop_report_interval = 60
+_log_writer = None
+_access_log_format = "text"
+
 
 class _Hostname_Filter(logging.Filter):
     def __init__(self):
@@ -55,11 +69,184 @@ class _Microsecond_Filter(logging.Filter):
     pass
 
 
-def openlog(file, facility, priority):
+class _Formatter(logging.Formatter):
+    """A formatter which passes access logs in json as they are, to
+    make them easy to ingest.
+    """
+
+    def __init__(self, fmt, prefix):
+        super().__init__(fmt)
+        self._prefix = prefix
+        pass
+
+    def format(self, record):
+        if (isinstance(record.msg, _Access_Record)
+            and _access_log_format == "json"):
+            return self._prefix + str(record.msg)
+        return super().format(record)
+
+    pass
+
+
+class _Batching_File_Handler(logging.FileHandler):
+    """A FileHandler which flushes only when told.  A log writer
+    flushes once for a batch of records.
+    """
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+        pass
+
+    pass
+
+
+class _Dropping_Queue_Handler(logging.handlers.QueueHandler):
+    """A QueueHandler which drops records instead of blocking the caller
+    when a queue is full.  It counts the dropped records.  It does not
+    format a message in the caller, except for an exception
+    traceback.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+        pass
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+            pass
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            pass
+        pass
+
+    pass
+
+
+class _Log_Writer():
+    """A background writer of log records.  It takes records from a
+    queue in a batch and flushes a handler once per batch.  It is
+    restarted in a child process after a fork, because a thread does
+    not survive a fork.
+    """
+
+    def __init__(self, queue_size, handler):
+        self._queue_size = queue_size
+        self._handler = handler
+        self._queue_handler = _Dropping_Queue_Handler(
+            queue.Queue(queue_size))
+        self._reported_drops = 0
+        self._last_report = 0
+        self._thread = None
+        pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        pass
+
+    def restart_in_child(self):
+        self._queue_handler.queue = queue.Queue(self._queue_size)
+        self._queue_handler.dropped = 0
+        self._reported_drops = 0
+        self.start()
+        pass
+
+    def stop(self):
+        """Writes out remaining records."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue_handler.queue.put(None, timeout=1)
+            self._thread.join(timeout=5)
+        except queue.Full:
+            pass
+        pass
+
+    def stats(self):
+        return {"queued": self._queue_handler.queue.qsize(),
+                "dropped": self._queue_handler.dropped}
+
+    def _run(self):
+        q = self._queue_handler.queue
+        handler = self._handler
+        while True:
+            batch = [q.get()]
+            while len(batch) < _log_batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+                pass
+            for record in batch:
+                if record is None:
+                    continue
+                handler.handle(record)
+                pass
+            if isinstance(handler, _Batching_File_Handler):
+                handler.flush_batch()
+                pass
+            self._report_drops(handler)
+            if None in batch:
+                return
+            pass
+        pass
+
+    def _report_drops(self, handler):
+        dropped = self._queue_handler.dropped
+        now = time.time()
+        if (dropped > self._reported_drops
+            and self._last_report + _log_drop_report_interval < now):
+            record = logging.makeLogRecord({
+                "name": logger.name, "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": (f"Logging dropped records on overload:"
+                        f" count={dropped - self._reported_drops}")})
+            handler.handle(record)
+            self._reported_drops = dropped
+            self._last_report = now
+            pass
+        pass
+
+    pass
+
+
+def get_logging_stats():
+    """Returns counters of a log queue, or None if logging is
+    synchronous.
+    """
+    if _log_writer is None:
+        return None
+    return _log_writer.stats()
+
+
+def openlog(file, facility, priority, *,
+            queue_size=None, access_format=None):
+    """Sets up the logger.  It queues records to a background writer
+    unless queue_size=0.  An access_format is "text" or "json".
+    """
+    global _log_writer, _access_log_format
     assert (facility is not None) and (priority is not None)
     so = "/dev/log"
-
-    if file is not None:
+    queue_size = (queue_size if queue_size is not None
+                  else _log_queue_size_default)
+    _access_log_format = access_format if access_format else "text"
+    assert _access_log_format in {"text", "json"}
+
+    if file is not None and queue_size > 0:
+        handler = _Batching_File_Handler(file)
+    elif file is not None:
         # FileHandler, WatchedFileHandler, TimedRotatingFileHandler
         # handler = logging.handlers.TimedRotatingFileHandler(file, when="W0")
         handler = logging.FileHandler(file)
@@ -86,15 +273,25 @@ def openlog(file, facility, priority):
     if file is not None:
         fmt = ("%(asctime)s %(levelname)s:"
                " %(filename)s:%(lineno)s:%(funcName)s: %(message)s")
+        prefix = ""
     else:
         fmt = ("lenticularis: %(levelname)s:"
                " %(filename)s:%(lineno)s:%(funcName)s: %(message)s")
+        prefix = "lenticularis: "
         pass
 
     handler.addFilter(_Hostname_Filter())
     handler.addFilter(_Microsecond_Filter())
-    handler.setFormatter(logging.Formatter(fmt))
-    logger.addHandler(handler)
+    handler.setFormatter(_Formatter(fmt, prefix))
+    if queue_size > 0:
+        _log_writer = _Log_Writer(queue_size, handler)
+        _log_writer.start()
+        os.register_at_fork(after_in_child=_log_writer.restart_in_child)
+        atexit.register(_log_writer.stop)
+        logger.addHandler(_log_writer._queue_handler)
+    else:
+        logger.addHandler(handler)
+        pass
     logger.setLevel(pr)
 
     pass
@@ -227,12 +424,145 @@ def uniform_distribution_jitter():
     return random.random() * 2
 
 
-def get_ip_addresses(host):
+class _Resolver_Cache():
+    """A cache of resolutions of host names, shared in a process.  An
+    entry expires after a TTL, which is shorter for a failure.  An
+    expired entry is still returned while it is refreshed in a
+    background thread.
+    """
+
+    def __init__(self, positive_ttl=300, negative_ttl=30):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # A host maps to a triple (addresses, error, expiry-time).
+        self._entries = {}
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._metrics = self._empty_metrics()
+        pass
+
+    def _empty_metrics(self):
+        return {"lookups": 0, "misses": 0, "resolutions": 0, "failures": 0,
+                "latency_total": 0.0, "latency_max": 0.0}
+
+    def lookup(self, host, block):
+        """Returns a list of addresses.  When it is not cached, it
+        resolves a host name if block, or otherwise, it returns an
+        empty list and resolves it in background.  It raises an
+        exception for a failure if block.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._metrics["lookups"] += 1
+            e = self._entries.get(host)
+            if e is None:
+                self._metrics["misses"] += 1
+                if not block:
+                    self._schedule(host)
+                    return []
+            elif e[2] < now:
+                self._schedule(host)
+                pass
+            pass
+        if e is None:
+            e = self._resolve(host)
+            pass
+        (addrs, error, _) = e
+        if block and error is not None and addrs == []:
+            raise Exception(f"Resolving a host failed: {host}: {error}")
+        return addrs
+
+    def _schedule(self, host):
+        # (Called with the lock held).
+        if host in self._pending:
+            return
+        self._pending.add(host)
+        self._queue.put(host)
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._refresh_loop,
+                                            daemon=True)
+            self._thread.start()
+            pass
+        pass
+
+    def _refresh_loop(self):
+        while True:
+            host = self._queue.get()
+            try:
+                self._resolve(host)
+            finally:
+                with self._lock:
+                    self._pending.discard(host)
+                    pass
+                pass
+            pass
+        pass
+
+    def _resolve(self, host):
+        t0 = time.monotonic()
+        try:
+            addrs = [make_typical_ip_address(addr[0])
+                     for (_, _, _, _, addr)
+                     in socket.getaddrinfo(host, None)]
+            error = None
+        except Exception as e:
+            addrs = []
+            error = rephrase_exception_message(e)
+            pass
+        t1 = time.monotonic()
+        with self._lock:
+            m = self._metrics
+            m["resolutions"] += 1
+            m["latency_total"] += (t1 - t0)
+            m["latency_max"] = max(m["latency_max"], t1 - t0)
+            if error is None:
+                e = (addrs, None, t1 + self.positive_ttl)
+            else:
+                m["failures"] += 1
+                # Keep the last good addresses on a failure.
+                old = self._entries.get(host)
+                addrs = old[0] if old is not None else []
+                e = (addrs, error, t1 + self.negative_ttl)
+                pass
+            self._entries[host] = e
+            pass
+        return e
+
+    def take_metrics(self):
+        """Returns metrics of resolutions, and resets them."""
+        with self._lock:
+            m = self._metrics
+            self._metrics = self._empty_metrics()
+            pass
+        return m
+
+    pass
+
+
+_resolver = _Resolver_Cache()
+
+
+def configure_resolver(positive_ttl, negative_ttl):
+    """Sets the TTLs (in seconds) of the resolver cache."""
+    _resolver.positive_ttl = positive_ttl
+    _resolver.negative_ttl = negative_ttl
+    pass
+
+
+def take_resolver_metrics():
+    return _resolver.take_metrics()
+
+
+def get_ip_addresses(host, block=True):
     """Returns a list of addresses for the host name, which are formatted
-    to be compared for equality.
+    to be compared for equality.  Resolutions are cached.  It returns
+    an empty list for a host not cached yet, when block=False.
     """
-    return [make_typical_ip_address(addr[0])
-            for (_, _, _, _, addr) in socket.getaddrinfo(host, None)]
+    return _resolver.lookup(host, block)
 
 
 def host_port(host, port):
@@ -244,13 +574,77 @@ def host_port(host, port):
     pass
 
 
+class _Access_Record():
+    """An access log entry.  It is formatted when it is written out (in
+    a log writer thread).
+    """
+
+    __slots__ = ("t", "status", "client", "user", "method", "url",
+                 "upstream", "downstream")
+
+    def __init__(self, t, status, client, user, method, url,
+                 upstream, downstream):
+        self.t = t
+        self.status = status
+        self.client = client
+        self.user = user
+        self.method = method
+        self.url = url
+        self.upstream = upstream
+        self.downstream = downstream
+        pass
+
+    def __str__(self):
+        if _access_log_format == "json":
+            return json.dumps({
+                "time": format_time_z(self.t), "status": self.status,
+                "client": self.client, "user": self.user,
+                "method": self.method, "url": str(self.url),
+                "upstream": self.upstream, "downstream": self.downstream},
+                              separators=(",", ":"))
+        else:
+            access_time = format_time_z(self.t)
+            user_ = self.user if self.user else "-"
+            upstream = self.upstream if self.upstream else "-"
+            downstream = self.downstream if self.downstream else "-"
+            return (f"{access_time} {self.status} {self.client} {user_}"
+                    f" {self.method} {self.url} {upstream} {downstream}")
+        pass
+
+    pass
+
+
 def log_access(status_, client_, user_, method_, url_, *,
                upstream=None, downstream=None):
-    access_time = format_time_z(time.time())
-    user_ = user_ if user_ else "-"
-    upstream = upstream if upstream else "-"
-    downstream = downstream if downstream else "-"
-    logger.info(f"{access_time} {status_} {client_} {user_} {method_} {url_} {upstream} {downstream}")
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info(_Access_Record(time.time(), status_, client_, user_,
+                               method_, url_, upstream, downstream))
+    pass
+
+
+class Phase_Timer():
+    """A recorder of elapsed times of named phases.  A phase is
+    recorded by mark(), which takes the time since the last mark.
+    Records are a list of [name, milliseconds].
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self._last = self.start
+        self.phases = []
+        pass
+
+    def mark(self, name):
+        now = time.time()
+        self.phases.append([name, round((now - self._last) * 1000)])
+        self._last = now
+        pass
+
+    def elapsed(self):
+        """Returns milliseconds since the start."""
+        return round((time.time() - self.start) * 1000)
+
     pass
 
 
@@ -5,11 +5,24 @@ and checked against json schema."""
 # SPDX-License-Identifier: BSD-2-Clause
 
 import sys
+import functools
 import jsonschema
 import yaml
 from lenticularis.utility import rephrase_exception_message
 
 
+@functools.lru_cache(maxsize=None)
+def compiled_validator(make_schema):
+    """Returns a validator of a schema made by a function.  A validator
+    is compiled once and cached, because making a schema and checking
+    it costs more than validating a record.
+    """
+    schema = make_schema()
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
 def read_yaml_conf(file):
     """Reads a file and checks it against json schema."""
     assert file is not None
@@ -28,14 +41,14 @@ def read_yaml_conf(file):
                         f" missing subject")
     sub = yamlconf["subject"]
     if sub == "api":
-        schema = _api_conf_schema()
-        conf = _fix_type(yamlconf, schema)
-        jsonschema.validate(instance=conf, schema=schema)
+        validator = compiled_validator(_api_conf_schema)
+        conf = _fix_type(yamlconf, validator.schema)
+        validator.validate(conf)
         return conf
     elif sub[:3] == "mux":
-        schema = _mux_conf_schema()
-        conf = _fix_type(yamlconf, schema)
-        jsonschema.validate(instance=conf, schema=schema)
+        validator = compiled_validator(_mux_conf_schema)
+        conf = _fix_type(yamlconf, validator.schema)
+        validator.validate(conf)
         return conf
     else:
         raise Exception(f"Bad conf file: {file}:"
@@ -103,8 +116,30 @@ _minio_json_schema = {
     "additionalProperties": False,
 }
 
+_tracing_json_schema = {
+    "type": "object",
+    "properties": {
+        "sample_rate": {"type": "number"},
+        "slow_threshold": {"type": "number"},
+        "buffer_size": {"type": "number"},
+        "export_file": {"type": "string"},
+        "export_url": {"type": "string"},
+        "export_interval": {"type": "number"},
+    },
+    "required": [
+    ],
+    "additionalProperties": False,
+}
+
+
 def _mux_conf_schema():
-    """mux_node_name and log_file are optional."""
+    """mux_node_name, the bad_response_* entries other than
+    bad_response_delay, negative_cache_*, verify_signature,
+    signature_clock_skew, rate_limit_*, bandwidth_*, metrics_interval,
+    object_cache_*, record_validation, dns_*, pool_state_cache_ttl,
+    minio_cache_* (in minio_manager), log_file, log_queue_size,
+    log_access_format, and tracing are optional.
+    """
     multiplexer = {
         "type": "object",
         "properties": {
@@ -114,8 +149,33 @@ def _mux_conf_schema():
             "forwarding_timeout": {"type": "number"},
             "probe_access_timeout": {"type": "number"},
             "bad_response_delay": {"type": "number"},
+            "bad_response_delay_max": {"type": "number"},
+            "bad_response_escalation": {"type": "number"},
+            "bad_response_window": {"type": "number"},
             "busy_suspension_time": {"type": "number"},
             "mux_node_name": {"type": "string"},
+            "negative_cache_size": {"type": "number"},
+            "negative_cache_ttl": {"type": "number"},
+            "verify_signature": {"type": "boolean"},
+            "signature_clock_skew": {"type": "number"},
+            "rate_limit_per_key": {"type": "number"},
+            "rate_limit_per_pool": {"type": "number"},
+            "rate_limit_per_address": {"type": "number"},
+            "rate_limit_burst_time": {"type": "number"},
+            "rate_limit_sync_interval": {"type": "number"},
+            "bandwidth_per_node": {"type": "number"},
+            "bandwidth_per_pool": {"type": "number"},
+            "metrics_interval": {"type": "number"},
+            "object_cache_size": {"type": "number"},
+            "object_cache_max_object": {"type": "number"},
+            "object_cache_fresh_time": {"type": "number"},
+            "object_cache_directory": {"type": "string"},
+            "object_cache_disk_size": {"type": "number"},
+            "record_validation": {"type": "string",
+                                  "enum": ["all", "writes"]},
+            "dns_cache_ttl": {"type": "number"},
+            "dns_negative_ttl": {"type": "number"},
+            "pool_state_cache_ttl": {"type": "number"},
         },
         "required": [
             "front_host",
@@ -143,6 +203,11 @@ def _mux_conf_schema():
             "minio_setup_timeout": {"type": "number"},
             "minio_stop_timeout": {"type": "number"},
             "minio_mc_timeout": {"type": "number"},
+            "minio_cache_directory": {"type": "string"},
+            "minio_cache_quota": {"type": "number"},
+            "minio_cache_after": {"type": "number"},
+            "minio_cache_watermark_low": {"type": "number"},
+            "minio_cache_watermark_high": {"type": "number"},
         },
         "required": [
             "sudo",
@@ -172,6 +237,10 @@ def _mux_conf_schema():
             "minio": _minio_json_schema,
             "log_file": {"type": "string"},
             "log_syslog": _syslog_json_schema,
+            "log_queue_size": {"type": "number"},
+            "log_access_format": {"type": "string",
+                                  "enum": ["text", "json"]},
+            "tracing": _tracing_json_schema,
         },
         "required": [
             "subject",
@@ -189,7 +258,10 @@ def _mux_conf_schema():
 
 
 def _api_conf_schema():
-    """log_file is optional."""
+    """blocking_threads, record_validation, dns_*, bad_response_*,
+    expiry_sweep_*, job_*, log_file, log_queue_size, log_access_format,
+    and tracing are optional.
+    """
     controller = {
         "type": "object",
         "properties": {
@@ -202,6 +274,20 @@ def _api_conf_schema():
             "minio_mc_timeout": {"type": "number"},
             "max_pool_expiry": {"type": "number"},
             "csrf_secret_seed": {"type": "string"},
+            "blocking_threads": {"type": "number"},
+            "record_validation": {"type": "string",
+                                  "enum": ["all", "writes"]},
+            "dns_cache_ttl": {"type": "number"},
+            "dns_negative_ttl": {"type": "number"},
+            "bad_response_delay": {"type": "number"},
+            "bad_response_delay_max": {"type": "number"},
+            "bad_response_escalation": {"type": "number"},
+            "bad_response_window": {"type": "number"},
+            "expiry_sweep_interval": {"type": "number"},
+            "expiry_sweep_batch": {"type": "number"},
+            "job_workers": {"type": "number"},
+            "job_queue_limit": {"type": "number"},
+            "job_expiry": {"type": "number"},
         },
         "required": [
             "front_host",
@@ -237,6 +323,10 @@ def _api_conf_schema():
             "minio": _minio_json_schema,
             "log_file": {"type": "string"},
             "log_syslog": _syslog_json_schema,
+            "log_queue_size": {"type": "number"},
+            "log_access_format": {"type": "string",
+                                  "enum": ["text", "json"]},
+            "tracing": _tracing_json_schema,
         },
         "required": [
             "subject",
@@ -282,7 +372,7 @@ def _fix_type(data, schema):
             return float(data)
     elif schema["type"] == "boolean":
         assert isinstance(data, str)
-        return bool(data)
+        return data.lower() in {"true", "yes", "on", "y", "1"}
     else:
         raise Exception("_fix_type: Other types are not implemented")
     pass
@@ -0,0 +1,131 @@
+"""A load test of Lens3-Api.  It measures latencies of UI requests
+(listing pools) while other clients run pool operations (making and
+deleting buckets, which run mc commands).  It runs against a running
+Lens3-Api, using "client.json" of the simple tests.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# It runs two phases: UI requests alone, and UI requests with
+# concurrent pool operations.  The latencies of UI requests in the
+# second phase show whether pool operations stall other requests.
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "simple"))
+
+from lens3_client import Lens3_Client
+from lens3_client import random_string
+
+
+def _percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+    vv = sorted(values)
+    i = min(len(vv) - 1, max(0, int(round(p / 100 * len(vv) + 0.5)) - 1))
+    return vv[i]
+
+
+def _run_ui_clients(client_json, nclients, duration):
+    """Lists pools repeatedly for a duration, and returns latencies."""
+    latencies = []
+    lock = threading.Lock()
+
+    def ui_client():
+        client = Lens3_Client(client_json)
+        client.get_user_info()
+        mine = []
+        limit = time.time() + duration
+        while time.time() < limit:
+            t0 = time.perf_counter()
+            client.list_pools()
+            mine.append(time.perf_counter() - t0)
+            pass
+        with lock:
+            latencies.extend(mine)
+            pass
+        pass
+
+    threads = [threading.Thread(target=ui_client) for _ in range(nclients)]
+    for th in threads:
+        th.start()
+        pass
+    for th in threads:
+        th.join()
+        pass
+    return latencies
+
+
+def _run_pool_operations(client_json, pool, stop, counts):
+    """Makes and deletes buckets until stopped."""
+    client = Lens3_Client(client_json)
+    client.get_user_info()
+    while not stop.is_set():
+        bucket = f"bench{random_string(8).lower()}"
+        client.make_bucket(pool, bucket, "none")
+        client.delete_bucket(pool, bucket)
+        counts.append(2)
+        pass
+    pass
+
+
+def _print_latencies(title, latencies, duration):
+    ms = [t * 1000 for t in latencies]
+    print(f"{title}: requests={len(ms)}"
+          f" ({len(ms) / duration:.1f} req/s)"
+          f" p50={_percentile(ms, 50):.1f}ms"
+          f" p99={_percentile(ms, 99):.1f}ms"
+          f" max={max(ms, default=0):.1f}ms")
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conf", default="client.json")
+    parser.add_argument("--ui-clients", type=int, default=4)
+    parser.add_argument("--pool-clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+
+    client = Lens3_Client(args.conf)
+    client.get_user_info()
+    directory = client.home + "/00" + random_string(6)
+    pool = client.make_pool(directory)["pool_name"]
+    try:
+        lat1 = _run_ui_clients(args.conf, args.ui_clients, args.duration)
+        _print_latencies("UI requests alone", lat1, args.duration)
+
+        stop = threading.Event()
+        counts = []
+        ops = [threading.Thread(target=_run_pool_operations,
+                                args=(args.conf, pool, stop, counts))
+               for _ in range(args.pool_clients)]
+        for th in ops:
+            th.start()
+            pass
+        try:
+            lat2 = _run_ui_clients(args.conf, args.ui_clients, args.duration)
+        finally:
+            stop.set()
+            for th in ops:
+                th.join()
+                pass
+            pass
+        _print_latencies("UI requests with pool operations", lat2,
+                         args.duration)
+        print(f"pool operations: {sum(counts)}"
+              f" ({sum(counts) / args.duration:.1f} op/s)")
+    finally:
+        client.delete_pool(pool)
+        pass
+    pass
+
+
+if __name__ == "__main__":
+    main()
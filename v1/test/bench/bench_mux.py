@@ -0,0 +1,555 @@
+"""A benchmark of Lens3-Mux.  It runs a Mux in this process with a
+local redis-server, and with stubs of sudo, MinIO and mc, and then,
+it drives S3 requests to the Mux.  It reports request throughput,
+p50/p99 latency, cold-start latency (the first access to a pool,
+which starts MinIO), and Redis commands per request.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# The Mux runs in a wsgiref server instead of Gunicorn.  An adapter
+# fills the differences: it sets "RAW_URI" and limits "wsgi.input" by
+# the content-length as Gunicorn does.  A report can be saved in json
+# and compared with a baseline by "--baseline", which fails when a
+# figure gets worse than the tolerance.
+
+import argparse
+import datetime
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+from wsgiref.util import is_hop_by_hop
+
+_bench_dir = os.path.dirname(os.path.abspath(__file__))
+_src_dir = os.path.abspath(os.path.join(_bench_dir, "..", "..", "src"))
+sys.path.insert(0, _src_dir)
+
+import redis
+from lenticularis.pooldata import Pool_State, Pool_Reason
+from lenticularis.pooldata import set_pool_state
+from lenticularis.table import get_table, set_conf
+from lenticularis.utility import generate_secret_key
+from lenticularis.yamlconf import read_yaml_conf
+
+
+_region = "us-east-1"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+    pass
+
+
+def _write_script(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+        pass
+    os.chmod(path, 0o755)
+    pass
+
+
+def _make_stub_commands(workdir):
+    """Makes the commands that the conf refers to.  A "python" wrapper
+    lets a manager process find lenticularis in the source tree,
+    because a spawner passes only a minimal environment.
+    """
+    py = sys.executable
+    _write_script(os.path.join(workdir, "minio"),
+                  f"#!/bin/sh\nexec {py} {_bench_dir}/stub_minio.py \"$@\"\n")
+    _write_script(os.path.join(workdir, "mc"),
+                  f"#!/bin/sh\nexec {py} {_bench_dir}/stub_mc.py \"$@\"\n")
+    _write_script(os.path.join(workdir, "python"),
+                  f"#!/bin/sh\nPYTHONPATH={_src_dir}; export PYTHONPATH\n"
+                  f"exec {py} \"$@\"\n")
+    shutil.copy(os.path.join(_bench_dir, "stub-sudo.sh"),
+                os.path.join(workdir, "sudo"))
+    pass
+
+
+class Redis_Fixture():
+    """A redis-server running on a free port in a work directory.  It
+    does not save snapshots.
+    """
+
+    def __init__(self, redis_server, workdir):
+        self.port = _free_port()
+        self.password = generate_secret_key()
+        cmd = [redis_server, "--port", str(self.port),
+               "--bind", "127.0.0.1", "--requirepass", self.password,
+               "--save", "", "--appendonly", "no", "--dir", workdir]
+        self._p = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL)
+        self.db = redis.Redis(host="127.0.0.1", port=self.port,
+                              password=self.password)
+        for _ in range(100):
+            try:
+                self.db.ping()
+                return
+            except redis.exceptions.ConnectionError:
+                time.sleep(0.1)
+                pass
+            pass
+        self.stop()
+        raise Exception(f"redis-server does not start: cmd={cmd}")
+
+    def conf(self):
+        return {"host": "localhost", "port": self.port,
+                "password": self.password}
+
+    def total_commands(self):
+        return self.db.info("stats")["total_commands_processed"]
+
+    def stop(self):
+        self._p.terminate()
+        self._p.wait(timeout=10)
+        pass
+
+    pass
+
+
+class _Limited_Input():
+    """A request body limited to the content-length, as Gunicorn does.
+    wsgiref passes the socket stream as it is.
+    """
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._remaining = length
+        pass
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+            pass
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        return data
+
+    pass
+
+
+class _Request_Handler(WSGIRequestHandler):
+    def get_environ(self):
+        environ = super().get_environ()
+        environ["RAW_URI"] = self.path
+        return environ
+
+    def log_message(self, format, *args):
+        pass
+
+    pass
+
+
+class _Threading_WSGI_Server(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+    pass
+
+
+def _adapt_to_wsgiref(app):
+    """Fixes a request and a response for wsgiref.  The Mux passes a
+    status without a reason-phrase and hop-by-hop headers from MinIO.
+    """
+    def adapted(environ, start_response):
+        n = int(environ.get("CONTENT_LENGTH") or 0)
+        environ["wsgi.input"] = _Limited_Input(environ["wsgi.input"], n)
+        def start(status, headers, exc_info=None):
+            if " " not in status:
+                status = f"{status} {HTTPStatus(int(status)).phrase}"
+                pass
+            headers = [(k, v) for (k, v) in headers if not is_hop_by_hop(k)]
+            return start_response(status, headers, exc_info)
+        return app(environ, start)
+    return adapted
+
+
+def _sign_v4(method, host, path, access_key, secret_key, now):
+    """Makes headers with an S3 signature v4.  The payload is not
+    signed.
+    """
+    amzdate = now.strftime("%Y%m%dT%H%M%SZ")
+    date = amzdate[:8]
+    headers = {"host": host, "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+               "x-amz-date": amzdate}
+    signed = ";".join(sorted(headers))
+    canonical = "\n".join([method, path, "",
+                           *[f"{k}:{headers[k]}" for k in sorted(headers)],
+                           "", signed, "UNSIGNED-PAYLOAD"])
+    scope = f"{date}/{_region}/s3/aws4_request"
+    tosign = "\n".join(["AWS4-HMAC-SHA256", amzdate, scope,
+                        hashlib.sha256(canonical.encode()).hexdigest()])
+    k = f"AWS4{secret_key}".encode()
+    for m in (date, _region, "s3", "aws4_request"):
+        k = hmac.new(k, m.encode(), hashlib.sha256).digest()
+        pass
+    signature = hmac.new(k, tosign.encode(), hashlib.sha256).hexdigest()
+    headers["Authorization"] = (f"AWS4-HMAC-SHA256"
+                                f" Credential={access_key}/{scope},"
+                                f" SignedHeaders={signed},"
+                                f" Signature={signature}")
+    return headers
+
+
+class Bench():
+    def __init__(self, args):
+        self._args = args
+        self.workdir = args.workdir or tempfile.mkdtemp(prefix="lens3-bench-")
+        os.makedirs(self.workdir, exist_ok=True)
+        self.redis = None
+        self.tables = None
+        self.mux_port = _free_port()
+        self.pools = []
+        self._server = None
+        pass
+
+    def setup(self):
+        _make_stub_commands(self.workdir)
+        self.redis = Redis_Fixture(self._args.redis_server, self.workdir)
+        conf_file = os.path.join(self.workdir, "conf.json")
+        with open(conf_file, "w") as f:
+            json.dump({"redis": self.redis.conf()}, f)
+            pass
+        with open(os.path.join(_bench_dir, "mux-conf-bench.yaml")) as f:
+            text = f.read()
+            pass
+        text = (text.replace("@WORKDIR@", self.workdir)
+                .replace("@PORT@", str(self.mux_port)))
+        yaml_file = os.path.join(self.workdir, "mux-conf.yaml")
+        with open(yaml_file, "w") as f:
+            f.write(text)
+            pass
+        set_conf(read_yaml_conf(yaml_file), self.redis.conf())
+        self.tables = get_table(self.redis.conf())
+
+        os.environ["LENS3_CONF"] = conf_file
+        os.environ.pop("LENS3_MUX_NAME", None)
+        from lenticularis.mux import app
+        mux = app()
+        assert mux is not None
+        mux._spawner.executable = os.path.join(self.workdir, "python")
+        self._server = _Threading_WSGI_Server(("127.0.0.1", self.mux_port),
+                                              _Request_Handler)
+        self._server.set_app(_adapt_to_wsgiref(mux))
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+        pass
+
+    def make_pool(self, index):
+        """Makes a user, a pool, a bucket and an access-key directly in
+        Redis, as Lens3-Api would do.
+        """
+        now = int(time.time())
+        expiration = now + 24 * 3600
+        uid = os.environ.get("USER") or "lens3"
+        gid = os.environ.get("USER") or "lens3"
+        self.tables.add_user({"uid": uid, "claim": "", "groups": [gid],
+                              "enabled": True, "modification_time": now})
+        directory = os.path.join(self.workdir, f"pool{index}")
+        os.makedirs(directory, exist_ok=True)
+        pool_id = self.tables.make_unique_xid("pool", uid, {})
+        info = {"secret_key": "", "key_policy": "readwrite",
+                "expiration_time": expiration}
+        probe_key = self.tables.make_unique_xid("akey", pool_id, info)
+        (ok, _) = self.tables.set_ex_buckets_directory(directory, pool_id)
+        assert ok
+        self.tables.set_pool(pool_id, {
+            "pool_name": pool_id, "buckets_directory": directory,
+            "owner_uid": uid, "owner_gid": gid, "probe_key": probe_key,
+            "expiration_time": expiration, "online_status": True,
+            "modification_time": now})
+        set_pool_state(self.tables, pool_id, Pool_State.INITIAL,
+                       Pool_Reason.NORMAL)
+        bucket = f"bench{index}-{random.randrange(1 << 30):08x}"
+        (ok, _) = self.tables.set_ex_bucket(bucket, {
+            "pool": pool_id, "bkt_policy": "none",
+            "modification_time": now})
+        assert ok
+        secret = generate_secret_key()
+        info = {"secret_key": secret, "key_policy": "readwrite",
+                "expiration_time": expiration}
+        key = self.tables.make_unique_xid("akey", pool_id, info)
+        pool = {"pool": pool_id, "bucket": bucket, "key": key,
+                "secret": secret}
+        self.pools.append(pool)
+        return pool
+
+    def request(self, pool, method, obj, body=None):
+        """Sends a request to the Mux.  It returns a pair of a status and
+        an elapsed time in seconds.
+        """
+        path = f"/{pool['bucket']}/{obj}"
+        host = f"localhost:{self.mux_port}"
+        now = datetime.datetime.now(datetime.timezone.utc)
+        headers = _sign_v4(method, host, path, pool["key"], pool["secret"],
+                           now)
+        headers["X-Real-IP"] = "127.0.0.1"
+        headers["X-Forwarded-Proto"] = "http"
+        t0 = time.perf_counter()
+        conn = http.client.HTTPConnection("127.0.0.1", self.mux_port,
+                                          timeout=120)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            res = conn.getresponse()
+            res.read()
+            status = res.status
+        except Exception:
+            status = 0
+        finally:
+            conn.close()
+            pass
+        return (status, time.perf_counter() - t0)
+
+    def run_cold_starts(self, n):
+        """Makes pools and accesses each one first.  Starts are
+        sequential not to interfere with each other.
+        """
+        latencies = []
+        for i in range(n):
+            pool = self.make_pool(len(self.pools))
+            (status, t) = self.request(pool, "PUT", "cold", b"x")
+            if status != 200:
+                raise Exception(f"A cold start failed: status={status};"
+                                f" see logs in {self.workdir}")
+            latencies.append(t)
+            pass
+        return latencies
+
+    def run_load(self, clients, requests, size, get_ratio):
+        body = os.urandom(size)
+        objects = [f"obj{i}" for i in range(16)]
+        for pool in self.pools:
+            for obj in objects:
+                self.request(pool, "PUT", obj, body)
+                pass
+            pass
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+        counter = iter(range(requests))
+
+        def worker():
+            rnd = random.Random()
+            mine = []
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        break
+                    pass
+                pool = rnd.choice(self.pools)
+                obj = rnd.choice(objects)
+                if rnd.random() < get_ratio:
+                    (status, t) = self.request(pool, "GET", obj)
+                else:
+                    (status, t) = self.request(pool, "PUT", obj, body)
+                    pass
+                mine.append((status, t))
+                pass
+            with lock:
+                for (status, t) in mine:
+                    latencies.append(t)
+                    statuses[status] = statuses.get(status, 0) + 1
+                    pass
+                pass
+            pass
+
+        ops0 = self.redis.total_commands()
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(clients)]
+        for th in threads:
+            th.start()
+            pass
+        for th in threads:
+            th.join()
+            pass
+        elapsed = time.perf_counter() - t0
+        # Subtract the INFO command itself.
+        ops = self.redis.total_commands() - ops0 - 1
+        return (latencies, statuses, elapsed, ops)
+
+    def teardown(self):
+        """Stops managers (which stop MinIO) and redis-server."""
+        procs = []
+        for pool in (self.pools if self.tables is not None else []):
+            proc = self.tables.get_minio_proc(pool["pool"])
+            if proc is not None:
+                procs.append(proc)
+                _kill(proc["manager_pid"])
+                pass
+            pass
+        limit = time.time() + 15
+        while (time.time() < limit
+               and any(_alive(p["manager_pid"]) for p in procs)):
+            time.sleep(0.2)
+            pass
+        for p in procs:
+            _kill(p["minio_pid"])
+            pass
+        if self._server is not None:
+            self._server.shutdown()
+            pass
+        if self.redis is not None:
+            self.redis.stop()
+            pass
+        if self._args.workdir is None and not self._args.keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            pass
+        pass
+
+    pass
+
+
+def _kill(pid):
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    pass
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    pass
+
+
+def _percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+    vv = sorted(values)
+    i = min(len(vv) - 1, max(0, int(round(p / 100 * len(vv) + 0.5)) - 1))
+    return vv[i]
+
+
+def _make_report(cold, load):
+    (latencies, statuses, elapsed, ops) = load
+    n = len(latencies)
+    return {
+        "requests": n,
+        "statuses": {str(k): v for (k, v) in sorted(statuses.items())},
+        "throughput": (n / elapsed if elapsed > 0 else 0.0),
+        "latency_p50_ms": _percentile(latencies, 50) * 1000,
+        "latency_p99_ms": _percentile(latencies, 99) * 1000,
+        "cold_start_p50_ms": _percentile(cold, 50) * 1000,
+        "cold_start_max_ms": (max(cold) * 1000 if cold else 0.0),
+        "redis_ops_per_request": (ops / n if n > 0 else 0.0),
+    }
+
+
+# Figures compared with a baseline.  True is for larger-is-better.
+
+_compared_figures = {
+    "throughput": True,
+    "latency_p50_ms": False,
+    "latency_p99_ms": False,
+    "cold_start_p50_ms": False,
+    "redis_ops_per_request": False,
+}
+
+
+def _compare_with_baseline(report, baseline, tolerance):
+    """Returns a list of figures getting worse than the tolerance."""
+    regressions = []
+    for (name, larger_better) in _compared_figures.items():
+        (v, b) = (report.get(name), baseline.get(name))
+        if v is None or b is None or b == 0:
+            continue
+        change = (v - b) / b
+        worse = (-change if larger_better else change)
+        if worse > tolerance:
+            regressions.append((name, b, v))
+            pass
+        pass
+    return regressions
+
+
+def _print_report(report):
+    print(f"requests:              {report['requests']}"
+          f" (statuses {report['statuses']})")
+    print(f"throughput:            {report['throughput']:.1f} req/s")
+    print(f"latency p50/p99:       {report['latency_p50_ms']:.2f}"
+          f" / {report['latency_p99_ms']:.2f} ms")
+    print(f"cold-start p50/max:    {report['cold_start_p50_ms']:.1f}"
+          f" / {report['cold_start_max_ms']:.1f} ms")
+    print(f"redis ops per request: {report['redis_ops_per_request']:.2f}")
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-server", default="redis-server")
+    parser.add_argument("--workdir", default=None,
+                        help="a work directory (kept at exit)")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep a temporary work directory")
+    parser.add_argument("--pools", type=int, default=4,
+                        help="pools, each starts cold once")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=1024,
+                        help="object size in bytes")
+    parser.add_argument("--get-ratio", type=float, default=0.9)
+    parser.add_argument("--json", default=None,
+                        help="a file to save a report in json")
+    parser.add_argument("--baseline", default=None,
+                        help="a json report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    bench = Bench(args)
+    try:
+        bench.setup()
+        cold = bench.run_cold_starts(args.pools)
+        load = bench.run_load(args.clients, args.requests, args.size,
+                              args.get_ratio)
+    finally:
+        bench.teardown()
+        pass
+
+    report = _make_report(cold, load)
+    _print_report(report)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+            pass
+        pass
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+            pass
+        regressions = _compare_with_baseline(report, baseline,
+                                             args.tolerance)
+        for (name, b, v) in regressions:
+            print(f"REGRESSION: {name}: {b:.2f} -> {v:.2f}")
+            pass
+        if len(regressions) > 0:
+            sys.exit(1)
+            pass
+        pass
+    pass
+
+
+if __name__ == "__main__":
+    main()
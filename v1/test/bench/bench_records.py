@@ -0,0 +1,110 @@
+"""A micro-benchmark of records in Redis.  It compares the old encoding
+(a json object loaded to a dict, with a check of the keys) and the
+compact encoding of records (see lenticularis/records.py), by the
+sizes of encoded values, the times to parse, and the memory per
+record.  It needs no Redis.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Memory is measured by tracemalloc, as the increase of allocated
+# bytes by holding many parsed records divided by the count.
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+_bench_dir = os.path.dirname(os.path.abspath(__file__))
+_src_dir = os.path.abspath(os.path.join(_bench_dir, "..", "..", "src"))
+sys.path.insert(0, _src_dir)
+
+from lenticularis.records import Pool_Record, Pool_State_Record
+from lenticularis.records import Bucket_Record, Access_Key_Record
+from lenticularis.records import Minio_Proc_Record, Mux_Record
+
+
+def _samples():
+    now = int(time.time())
+    return [
+        (Pool_Record, {
+            "pool_name": "a1b2c3d4e5f6g7h8i9j0", "owner_uid": "user0",
+            "owner_gid": "user0", "buckets_directory": "/home/user0/pool",
+            "probe_key": "PKEY0000000000000000", "online_status": True,
+            "expiration_time": now + 86400, "modification_time": now}),
+        (Pool_State_Record, {
+            "state": "ready", "reason": "-", "modification_time": now}),
+        (Bucket_Record, {
+            "pool": "a1b2c3d4e5f6g7h8i9j0", "bkt_policy": "none",
+            "modification_time": now}),
+        (Access_Key_Record, {
+            "owner": "a1b2c3d4e5f6g7h8i9j0", "secret_key": "x" * 48,
+            "key_policy": "readwrite", "expiration_time": now + 86400,
+            "modification_time": now}),
+        (Minio_Proc_Record, {
+            "minio_ep": "localhost:9000", "minio_pid": "12345",
+            "admin": "A" * 20, "password": "p" * 48,
+            "mux_host": "localhost", "mux_port": "8003",
+            "manager_pid": "12340", "modification_time": now}),
+        (Mux_Record, {
+            "host": "localhost", "port": "8003", "start_time": now,
+            "modification_time": now}),
+    ]
+
+
+def _time_per_call(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+        pass
+    return (time.perf_counter() - t0) / n
+
+
+def _memory_per_record(fn, n):
+    tracemalloc.start()
+    (m0, _) = tracemalloc.get_traced_memory()
+    kept = [fn() for _ in range(n)]
+    (m1, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(kept) == n
+    return (m1 - m0) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'record':20s} {'bytes':>11s} {'parse (us)':>15s}"
+          f" {'memory (bytes)':>17s}")
+    for (cls, d) in _samples():
+        keys = set(d.keys())
+        old = json.dumps(d)
+        new = cls.from_dict(d).encode()
+
+        def parse_old():
+            r = json.loads(old)
+            assert set(r.keys()) == keys
+            return r
+
+        def parse_new():
+            return cls.decode(new)
+
+        assert parse_new() == parse_old()
+        t0 = _time_per_call(parse_old, args.count)
+        t1 = _time_per_call(parse_new, args.count)
+        m0 = _memory_per_record(parse_old, args.count // 10)
+        m1 = _memory_per_record(parse_new, args.count // 10)
+        print(f"{cls.__name__:20s} {len(old):5d}/{len(new):<5d}"
+              f" {t0 * 1e6:7.2f}/{t1 * 1e6:<7.2f}"
+              f" {m0:8.0f}/{m1:<8.0f}")
+        pass
+    print("(figures are old/new)")
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""A micro-benchmark of validation of records.  It measures the cost of
+checking pool descriptions and confs as done on each Api call, by the
+old way (making a schema and validating it by jsonschema.validate()
+for each call), by a compiled validator, and by the "writes" mode of
+record_validation (no check on reads).  It needs no Redis.
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# A list-pools call of Api validates every pool of a user.  A figure
+# is a time per pool description.
+
+import argparse
+import os
+import sys
+import time
+
+_bench_dir = os.path.dirname(os.path.abspath(__file__))
+_src_dir = os.path.abspath(os.path.join(_bench_dir, "..", "..", "src"))
+sys.path.insert(0, _src_dir)
+
+import jsonschema
+from lenticularis.pooldata import _pool_desc_schema
+from lenticularis.pooldata import check_pool_is_well_formed
+from lenticularis.table import _redis_conf_schema
+from lenticularis.yamlconf import compiled_validator
+
+
+def _make_pool_desc(nbuckets, nkeys):
+    now = int(time.time())
+    buckets = [{"name": f"bkt{i:03d}", "pool": "a1b2c3d4e5f6g7h8i9j0",
+                "bkt_policy": "none", "modification_time": now}
+               for i in range(nbuckets)]
+    secrets = [{"access_key": f"AKEY{i:016d}", "secret_key": "x" * 48,
+                "key_policy": "readwrite", "owner": "a1b2c3d4e5f6g7h8i9j0",
+                "expiration_time": now + 86400, "modification_time": now}
+               for i in range(nkeys)]
+    return {
+        "pool_name": "a1b2c3d4e5f6g7h8i9j0",
+        "buckets_directory": "/home/user0/pool-00",
+        "owner_uid": "user0",
+        "owner_gid": "user0",
+        "buckets": buckets,
+        "secrets": secrets,
+        "probe_key": "PKEY0000000000000000",
+        "expiration_time": now + 86400,
+        "online_status": True,
+        "user_enabled_status": True,
+        "minio_state": "ready",
+        "minio_reason": "-",
+        "modification_time": now,
+    }
+
+
+def _time_per_call(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+        pass
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--buckets", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=4)
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    pooldesc = _make_pool_desc(args.buckets, args.keys)
+    conf = {"redis": {"host": "localhost", "port": 6378,
+                      "password": "xyzxyz"}}
+
+    def old_pool():
+        jsonschema.validate(instance=pooldesc, schema=_pool_desc_schema())
+        pass
+
+    def new_pool():
+        check_pool_is_well_formed(pooldesc, None)
+        pass
+
+    def old_conf():
+        jsonschema.validate(instance=conf, schema=_redis_conf_schema())
+        pass
+
+    def new_conf():
+        compiled_validator(_redis_conf_schema).validate(conf)
+        pass
+
+    def no_check():
+        pass
+
+    rows = [
+        ("pool: make schema + validate", old_pool),
+        ("pool: compiled validator", new_pool),
+        ("pool: writes mode (no check)", no_check),
+        ("conf: make schema + validate", old_conf),
+        ("conf: compiled validator", new_conf),
+    ]
+    print(f"pool description with {args.buckets} buckets"
+          f" and {args.keys} keys, {args.count} calls")
+    base = None
+    for (name, fn) in rows:
+        fn()
+        t = _time_per_call(fn, args.count)
+        if name.endswith("make schema + validate"):
+            base = t
+            pass
+        ratio = (f" ({base / t:.1f}x)"
+                 if fn not in (old_pool, old_conf) and t > 0 else "")
+        print(f"{name:32s} {t * 1e6:10.1f} us{ratio}")
+        pass
+    pass
+
+
+if __name__ == "__main__":
+    main()
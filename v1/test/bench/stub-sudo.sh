@@ -0,0 +1,12 @@
+#!/bin/sh
+# A stub of sudo for benchmarking.  It drops the options Lens3 passes
+# (-n -u user -g group) and runs the command as the current user.
+
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -n) shift ;;
+        -u|-g) shift 2 ;;
+        *) break ;;
+    esac
+done
+exec "$@"
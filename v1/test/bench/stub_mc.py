@@ -0,0 +1,143 @@
+"""A stub of the mc command for benchmarking Lens3-Mux.  It accepts the
+command lines Lens3 runs (see lenticularis/mc.py) and prints json
+records in the way mc does.  It performs the operations on the stub
+of MinIO (stub_minio.py).
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Usage: stub_mc.py --config-dir=DIR --json command args...
+
+import json
+import os
+import sys
+from urllib.request import Request, urlopen
+
+
+_timeout = 10
+
+
+def _print_records(rr):
+    for r in rr:
+        sys.stdout.write(json.dumps(r) + "\n")
+        pass
+    sys.stdout.flush()
+    pass
+
+
+def _error(message, code=None):
+    e = {"message": message}
+    if code is not None:
+        e["cause"] = {"error": {"Code": code}}
+        pass
+    return [{"status": "error", "error": e}]
+
+
+def _alias_file(config_dir):
+    return os.path.join(config_dir, "stub-aliases.json")
+
+
+def _load_aliases(config_dir):
+    try:
+        with open(_alias_file(config_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    pass
+
+
+def _save_aliases(config_dir, aliases):
+    with open(_alias_file(config_dir), "w") as f:
+        json.dump(aliases, f)
+        pass
+    pass
+
+
+def _call_minio(aliases, target, op, *args):
+    """Calls an admin operation of the stub MinIO.  A target is an alias
+    or an alias/bucket.
+    """
+    alias = target.split("/", 1)[0]
+    a = aliases.get(alias)
+    if a is None:
+        return _error(f"No such alias: {alias}")
+    data = json.dumps({"op": op, "args": list(args)}).encode()
+    req = Request(f"{a['url']}/_stub/admin", data=data, method="POST",
+                  headers={"X-Stub-Root": f"{a['user']}:{a['password']}"})
+    try:
+        with urlopen(req, timeout=_timeout) as res:
+            return json.loads(res.read())
+    except Exception as e:
+        return _error(f"Unable to connect to {a['url']}: {e}")
+    pass
+
+
+def _bucket_of(target):
+    return target.split("/", 1)[1]
+
+
+def run(config_dir, cmd):
+    aliases = _load_aliases(config_dir)
+    n = len(cmd)
+    if cmd[:2] == ["alias", "set"] and n >= 6:
+        (alias, url, user, password) = cmd[2:6]
+        aliases[alias] = {"url": url, "user": user, "password": password}
+        _save_aliases(config_dir, aliases)
+        return [{"status": "success", "alias": alias, "URL": url}]
+    elif cmd[:2] == ["alias", "remove"] and n == 3:
+        aliases.pop(cmd[2], None)
+        _save_aliases(config_dir, aliases)
+        return [{"status": "success", "alias": cmd[2]}]
+    elif cmd[:2] == ["admin", "info"] and n == 3:
+        return _call_minio(aliases, cmd[2], "info")
+    elif cmd[:3] == ["admin", "service", "stop"] and n == 4:
+        return _call_minio(aliases, cmd[3], "service_stop")
+    elif cmd[:3] == ["admin", "user", "add"] and n == 6:
+        return _call_minio(aliases, cmd[3], "user_add", cmd[4], cmd[5])
+    elif cmd[:3] == ["admin", "user", "remove"] and n == 5:
+        return _call_minio(aliases, cmd[3], "user_remove", cmd[4])
+    elif (cmd[:2] == ["admin", "user"] and n == 5
+          and cmd[2] in {"enable", "disable"}):
+        status = cmd[2] + "d"
+        return _call_minio(aliases, cmd[3], "user_status", cmd[4], status)
+    elif cmd[:3] == ["admin", "user", "list"] and n == 4:
+        return _call_minio(aliases, cmd[3], "user_list")
+    elif cmd[:3] == ["admin", "policy", "set"] and n == 6:
+        key = cmd[5].removeprefix("user=")
+        return _call_minio(aliases, cmd[3], "policy_set", cmd[4], key)
+    elif cmd[:1] == ["ls"] and n == 2:
+        return _call_minio(aliases, cmd[1], "list_buckets")
+    elif cmd[:1] == ["mb"] and n == 2:
+        return _call_minio(aliases, cmd[1], "make_bucket",
+                           _bucket_of(cmd[1]))
+    elif cmd[:2] == ["anonymous", "set"] and n == 4:
+        return _call_minio(aliases, cmd[3], "anonymous_set", cmd[2],
+                           _bucket_of(cmd[3]))
+    else:
+        return _error(f"Unsupported command in stub mc: {cmd}")
+    pass
+
+
+def main():
+    argv = sys.argv[1:]
+    config_dir = None
+    while len(argv) > 0 and argv[0].startswith("--"):
+        if argv[0].startswith("--config-dir="):
+            config_dir = argv[0][len("--config-dir="):]
+            pass
+        argv = argv[1:]
+        pass
+    if config_dir is None:
+        _print_records(_error("Stub mc needs --config-dir"))
+        sys.exit(1)
+        pass
+    rr = run(config_dir, argv)
+    _print_records(rr)
+    ok = all(r.get("status") == "success" for r in rr)
+    sys.exit(0 if ok else 1)
+    pass
+
+
+if __name__ == "__main__":
+    main()
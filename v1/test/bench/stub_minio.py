@@ -0,0 +1,295 @@
+"""A stub of MinIO for benchmarking Lens3-Mux.  It takes the arguments
+Lens3 passes to MinIO, prints the start-up message the manager waits
+for, and serves "/minio/health/live" and simple object GET/PUT/HEAD/
+DELETE in memory.  It does not check authentication.  The stub of mc
+(stub_mc.py) manages its users and buckets via "/_stub/admin".
+"""
+
+# Copyright (c) 2022-2023 RIKEN R-CCS
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Usage: stub_minio.py --json --anonymous server --address :port dir
+
+import argparse
+import errno
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Store():
+    """In-memory state of a MinIO instance."""
+
+    def __init__(self, root_user, root_password):
+        self.lock = threading.Lock()
+        self.root = (root_user, root_password)
+        self.users = {}
+        self.buckets = {}
+        self.policies = {}
+        self.objects = {}
+        pass
+
+    pass
+
+
+def _print_log(level, message):
+    m = {"level": level, "errKind": "",
+         "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+         "message": message}
+    sys.stdout.write(json.dumps(m) + "\n")
+    sys.stdout.flush()
+    pass
+
+
+def _s3_error(code, message):
+    return (f"<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+            f"<Error><Code>{code}</Code><Message>{message}</Message>"
+            f"</Error>").encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MinIO"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b"", headers={}):
+        self.send_response(status)
+        for (k, v) in headers.items():
+            self.send_header(k, v)
+            pass
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+            pass
+        pass
+
+    def _read_body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n > 0 else b""
+
+    def _split_path(self):
+        path = self.path.split("?", 1)[0]
+        (bucket, _, key) = path.lstrip("/").partition("/")
+        return (bucket, key)
+
+    def do_GET(self):
+        store = self.server.store
+        if self.path.startswith("/minio/health/live"):
+            self._reply(200)
+            return
+        (bucket, key) = self._split_path()
+        with store.lock:
+            if bucket == "":
+                names = "".join(f"<Bucket><Name>{b}</Name></Bucket>"
+                                for b in sorted(store.buckets))
+                body = (f"<ListAllMyBucketsResult><Buckets>{names}"
+                        f"</Buckets></ListAllMyBucketsResult>").encode()
+                self._reply(200, body, {"Content-Type": "application/xml"})
+                return
+            if bucket not in store.buckets:
+                self._reply(404, _s3_error("NoSuchBucket", bucket))
+                return
+            if key == "":
+                keys = sorted(k for (b, k) in store.objects if b == bucket)
+                contents = "".join(f"<Contents><Key>{k}</Key></Contents>"
+                                   for k in keys)
+                body = (f"<ListBucketResult><Name>{bucket}</Name>"
+                        f"{contents}</ListBucketResult>").encode()
+                self._reply(200, body, {"Content-Type": "application/xml"})
+                return
+            data = store.objects.get((bucket, key))
+            pass
+        if data is None:
+            self._reply(404, _s3_error("NoSuchKey", key))
+            return
+        self._reply(200, data, {"Content-Type": "application/octet-stream",
+                                "ETag": f"\"{hash(data) & 0xffffffff:08x}\""})
+        pass
+
+    def do_HEAD(self):
+        self.do_GET()
+        pass
+
+    def do_PUT(self):
+        store = self.server.store
+        data = self._read_body()
+        (bucket, key) = self._split_path()
+        with store.lock:
+            if bucket not in store.buckets:
+                self._reply(404, _s3_error("NoSuchBucket", bucket))
+                return
+            if key == "":
+                self._reply(409, _s3_error("BucketAlreadyOwnedByYou", bucket))
+                return
+            store.objects[(bucket, key)] = data
+            pass
+        self._reply(200, b"", {"ETag": f"\"{hash(data) & 0xffffffff:08x}\""})
+        pass
+
+    def do_DELETE(self):
+        store = self.server.store
+        (bucket, key) = self._split_path()
+        with store.lock:
+            store.objects.pop((bucket, key), None)
+            pass
+        self._reply(204)
+        pass
+
+    def do_POST(self):
+        if self.path == "/_stub/admin":
+            self._do_admin()
+            return
+        self._reply(501, _s3_error("NotImplemented", self.path))
+        pass
+
+    def _do_admin(self):
+        """Performs an admin operation of mc.  A request is a json
+        {"op": name, "args": [...]}, and a reply is a json list of
+        records that mc prints.
+        """
+        store = self.server.store
+        cred = self.headers.get("X-Stub-Root", "")
+        if cred != f"{store.root[0]}:{store.root[1]}":
+            self._reply(403, json.dumps([_mc_error("InvalidAccessKeyId")])
+                        .encode())
+            return
+        try:
+            q = json.loads(self._read_body())
+            (op, args) = (q["op"], q["args"])
+            with store.lock:
+                rr = _admin_ops[op](store, *args)
+                pass
+        except Exception as e:
+            rr = [_mc_error(type(e).__name__, f"{e}")]
+            pass
+        self._reply(200, json.dumps(rr).encode(),
+                    {"Content-Type": "application/json"})
+        if op == "service_stop":
+            threading.Thread(target=self.server.shutdown).start()
+            pass
+        pass
+
+    pass
+
+
+def _mc_error(code, message=""):
+    return {"status": "error",
+            "error": {"message": message or code,
+                      "cause": {"error": {"Code": code}}}}
+
+
+def _op_info(store):
+    return [{"status": "success", "info": {"mode": "online"}}]
+
+
+def _op_service_stop(store):
+    return [{"status": "success", "action": "stop"}]
+
+
+def _op_user_add(store, key, secret):
+    store.users[key] = {"secret": secret, "policy": "", "status": "enabled"}
+    return [{"status": "success", "accessKey": key, "secretKey": secret,
+             "userStatus": "enabled"}]
+
+
+def _op_user_remove(store, key):
+    if store.users.pop(key, None) is None:
+        return [_mc_error("XMinioAdminNoSuchUser")]
+    return [{"status": "success", "accessKey": key}]
+
+
+def _op_user_status(store, key, status):
+    if key not in store.users:
+        return [_mc_error("XMinioAdminNoSuchUser")]
+    store.users[key]["status"] = status
+    return [{"status": "success", "accessKey": key, "userStatus": status}]
+
+
+def _op_user_list(store):
+    return [{"status": "success", "accessKey": k,
+             "policyName": u["policy"], "userStatus": u["status"]}
+            for (k, u) in sorted(store.users.items())]
+
+
+def _op_policy_set(store, policy, key):
+    if key not in store.users:
+        return [_mc_error("XMinioAdminNoSuchUser")]
+    store.users[key]["policy"] = policy
+    return [{"status": "success", "policy": policy, "userOrGroup": key}]
+
+
+def _op_list_buckets(store):
+    return [{"status": "success", "type": "folder", "size": 0,
+             "lastModified": "2023-01-01T00:00:00.00+00:00",
+             "key": f"{b}/", "etag": "", "url": "", "versionOrdinal": 1}
+            for b in sorted(store.buckets)]
+
+
+def _op_make_bucket(store, bucket):
+    if bucket in store.buckets:
+        return [_mc_error("BucketAlreadyOwnedByYou")]
+    store.buckets[bucket] = time.time()
+    return [{"status": "success", "bucket": bucket}]
+
+
+def _op_anonymous_set(store, policy, bucket):
+    if bucket not in store.buckets:
+        return [_mc_error("NoSuchBucket")]
+    store.policies[bucket] = policy
+    return [{"status": "success", "bucket": bucket, "perm": policy}]
+
+
+_admin_ops = {
+    "info": _op_info,
+    "service_stop": _op_service_stop,
+    "user_add": _op_user_add,
+    "user_remove": _op_user_remove,
+    "user_status": _op_user_status,
+    "user_list": _op_user_list,
+    "policy_set": _op_policy_set,
+    "list_buckets": _op_list_buckets,
+    "make_bucket": _op_make_bucket,
+    "anonymous_set": _op_anonymous_set,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--anonymous", action="store_true")
+    parser.add_argument("command", choices=["server"])
+    parser.add_argument("--address", required=True)
+    parser.add_argument("directory")
+    args = parser.parse_args()
+
+    (host, _, port) = args.address.rpartition(":")
+    store = _Store(os.environ.get("MINIO_ROOT_USER", "minioadmin"),
+                   os.environ.get("MINIO_ROOT_PASSWORD", "minioadmin"))
+    try:
+        server = ThreadingHTTPServer((host or "", int(port)), _Handler)
+    except OSError as e:
+        if e.errno == errno.EADDRINUSE:
+            _print_log("FATAL", "Specified port is already in use")
+        else:
+            _print_log("FATAL", f"Unable to initialize backend: {e}")
+            pass
+        sys.exit(1)
+        pass
+    server.daemon_threads = True
+    server.store = store
+    _print_log("INFO", f"API: http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ import json
 import base64
 import socket
 import ssl
+import time
 import urllib
 from urllib.request import Request, urlopen
 from urllib.error import HTTPError
@@ -220,7 +221,9 @@ class Lens3_Client(Api_Client):
         reply = self.do_access("POST", path, data=data)
         desc = reply["pool_desc"]
         assert desc is not None
-        return desc
+        (job, desc1) = self.wait_job(reply["job_id"])
+        assert job["status"] == "succeeded"
+        return desc1 if desc1 is not None else desc
 
     def get_pool(self, pool):
         path = f"/pool/{pool}"
@@ -240,8 +243,30 @@ class Lens3_Client(Api_Client):
         body = dict()
         data = json.dumps(body).encode()
         reply = self.do_access("DELETE", path, data=data)
+        (job, _) = self.wait_job(reply["job_id"])
+        assert job["status"] == "succeeded"
         return None
 
+    def get_job(self, job_id):
+        path = f"/job/{job_id}"
+        reply = self.do_access("GET", path, data=None)
+        return (reply["job"], reply["pool_desc"])
+
+    def wait_job(self, job_id, interval=1, timeout=120):
+        """Polls a job until it finishes.  It returns a pair of a job status
+        and a pool description (for a job of making a pool).
+        """
+        limit = time.time() + timeout
+        while True:
+            (job, desc) = self.get_job(job_id)
+            if job["status"] in {"succeeded", "failed"}:
+                return (job, desc)
+            if time.time() > limit:
+                raise Exception(f"Job timed out: job={job_id}")
+            time.sleep(interval)
+            pass
+        pass
+
     def make_bucket(self, pool, bucket, policy):
         assert policy in self.bkt_policy_set
         path = f"/pool/{pool}/bucket"
@@ -283,6 +308,23 @@ class Lens3_Client(Api_Client):
         desc = reply["pool_desc"]
         return desc
 
+    def batch(self, pool, operations):
+        """Applies operations on buckets and access-keys at once.  An
+        operation is a dict like {"op": "make_bucket", "name": bucket,
+        "bkt_policy": policy}, where "op" is one of make_bucket,
+        delete_bucket, make_secret, and delete_secret.  It returns a
+        pair of a pool description and a list of the results.  (The
+        client of v2 (v2/test/lib) does not have it, because only the
+        v1 Api implements "/pool/{pool_id}/batch").
+        """
+        path = f"/pool/{pool}/batch"
+        body = {
+            "operations": operations,
+        }
+        data = json.dumps(body).encode()
+        reply = self.do_access("POST", path, data=data)
+        return (reply["pool_desc"], reply["results"])
+
     # Auxiliary.
 
     def find_pool(self, directory):